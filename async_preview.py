@@ -0,0 +1,111 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from constants import PREVIEW_DEBOUNCE
+# ------------------------------------------------------------------------------
+# Asynchronous, debounced live preview.
+#
+# The keyboard handler only edits the expression and redraws it; the preview
+# is evaluated later, off the event loop, once typing pauses for a moment.
+# Every keystroke starts a new generation: the task of the previous one is
+# cancelled and a result that arrives for an older generation is dropped, so
+# a slow evaluation can never overwrite the preview of newer input.
+# ------------------------------------------------------------------------------
+
+
+class AsyncPreview:
+    """
+    Schedules preview evaluations on a single background thread.
+
+    `evaluate(expression)` runs on that thread (so a stateful evaluator such as
+    IncrementalEvaluator is only ever used from one thread) and `publish(result)`
+    is called on the event loop with results that are still current.
+    `run_task` starts a coroutine on the event loop, e.g. `page.run_task`.
+
+    Sessions of a server can share one `executor` instead of a thread each,
+    their evaluations are then serialized per AsyncPreview by a lock.
+    """
+
+    def __init__(self, evaluate, publish, run_task, debounce: float = PREVIEW_DEBOUNCE, executor=None):
+        self.evaluate = evaluate
+        self.publish = publish
+        self.run_task = run_task
+        self.debounce = debounce
+        self.shared_executor = executor is not None
+        if self.shared_executor:
+            self.executor = executor
+            self.evaluation_lock = Lock()
+            self.evaluate = self.evaluate_serially
+            self.evaluate_unlocked = evaluate
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self.lock = Lock()
+        self.generation = 0
+        # Task (and its loop) of the newest preview, None once it finished or before it started
+        self.task = None
+        self.loop = None
+        self.published = 0
+        self.discarded = 0
+
+    def preview(self, expression: str) -> None:
+        """
+        Schedules the preview of `expression`, superseding any earlier one.
+        Returns None: the result is published later (see handle_keyboard_input).
+        """
+        with self.lock:
+            self.generation += 1
+            self.cancel_pending()
+            generation = self.generation
+        self.run_task(self.refresh, expression, generation)
+
+    def cancel(self) -> None:
+        """Drops the pending preview, e.g. when "=" or "C" sets the result directly"""
+        with self.lock:
+            self.generation += 1
+            self.cancel_pending()
+
+    def cancel_pending(self) -> None:
+        # Called with the lock held, the handlers run on other threads than the loop
+        if self.task is not None:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+            self.task = None
+
+    async def refresh(self, expression: str, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                self.discarded += 1
+                return
+            self.task = asyncio.current_task()
+            self.loop = asyncio.get_running_loop()
+
+        try:
+            # Debounce: a keystroke arriving during the sleep cancels this task before any evaluation
+            await asyncio.sleep(self.debounce)
+            result = await self.loop.run_in_executor(self.executor, self.evaluate, expression)
+        except asyncio.CancelledError:
+            # Superseded; an evaluation that was already running finishes on its thread and is ignored
+            self.discarded += 1
+            return
+
+        with self.lock:
+            if generation != self.generation:
+                self.discarded += 1
+                return
+            self.task = None
+            self.published += 1
+            # Published under the lock so a newer keystroke can't slip in between the check and the update
+            self.publish(result)
+
+    def evaluate_serially(self, expression: str):
+        # A superseded evaluation may still run on another thread of a shared executor
+        with self.evaluation_lock:
+            return self.evaluate_unlocked(expression)
+
+    def stats(self) -> dict:
+        return {"published": self.published, "discarded": self.discarded}
+
+    def shutdown(self) -> None:
+        """Cancels the pending preview and stops the background thread, unless it is shared"""
+        self.cancel()
+        if not self.shared_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
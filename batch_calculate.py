@@ -0,0 +1,180 @@
+"""
+Headless batch evaluation of expression files with `calculate`.
+
+Reads expressions one per line (or from a CSV column), evaluates chunks of
+them on a pool of worker processes and writes the results in input order as
+soon as they are ready. Only a bounded number of chunks is in flight, so
+memory stays constant whatever the size of the input.
+
+    python batch_calculate.py expressions.txt -o results.txt
+    python batch_calculate.py data.csv --csv --column amount -o reconciled.csv
+    cat expressions.txt | python batch_calculate.py - > results.txt
+"""
+import csv
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from os import O_WRONLY, cpu_count, devnull, dup2, open as os_open
+from time import perf_counter
+from constants import BATCH_CHUNK_SIZE, BATCH_CHUNKS_IN_FLIGHT_PER_WORKER
+# ------------------------------------------------------------------------------
+
+
+def init_worker(timeout: float | None, precision: int | None = None, backend: str | None = None) -> None:
+    """
+    Pool initializer, optionally bounds each sympy evaluation of this worker by `timeout` seconds,
+    gives non-integer results `precision` significant digits and pins the evaluation `backend`
+    """
+    if backend:
+        from handle_keyboard_helpers import set_evaluation_backend
+
+        set_evaluation_backend(backend)
+    if precision:
+        from handle_keyboard_helpers import set_precision
+
+        set_precision(precision)
+    if timeout:
+        from evaluation_executor import EvaluationExecutor
+        from handle_keyboard_helpers import set_evaluation_executor
+
+        set_evaluation_executor(EvaluationExecutor(workers=1, timeout=timeout))
+
+
+def evaluate_chunk(expressions: list[str]) -> list[str]:
+    """Runs in a worker process"""
+    from handle_keyboard_helpers import calculate
+
+    results = []
+    for expression in expressions:
+        try:
+            results.append(calculate(expression))
+        except Exception as error:
+            # e.g. ZeroDivisionError raised by sympy for "1%0", one bad line doesn't stop the job
+            results.append(f"error: {type(error).__name__}")
+    return results
+
+
+def read_lines(file) -> iter:
+    """Yields (expression, None) per line"""
+    for line in file:
+        yield line.rstrip("\r\n"), None
+
+
+def read_csv_column(file, column: str, delimiter: str, header_sink: list) -> iter:
+    """Yields (expression, row) per CSV row, `column` is a header name or a 0-based index"""
+    reader = csv.reader(file, delimiter=delimiter)
+    if column.isdigit():
+        index = int(column)
+    else:
+        header = next(reader, None)
+        if header is None:
+            return
+        if column not in header:
+            raise SystemExit(f"column {column!r} not found in the CSV header")
+        index = header.index(column)
+        header_sink.append(header)
+    for row in reader:
+        yield (row[index] if index < len(row) else ""), row
+
+
+def chunked(items, size: int) -> iter:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def evaluate_stream(
+    items,
+    workers: int,
+    chunk_size: int,
+    timeout: float | None = None,
+    precision: int | None = None,
+    backend: str | None = None,
+):
+    """
+    Yields (row, result) in input order. At most `workers` * BATCH_CHUNKS_IN_FLIGHT_PER_WORKER
+    chunks are read ahead, so memory doesn't grow with the input.
+    """
+    if workers <= 1:
+        init_worker(timeout, precision, backend)
+        for chunk in chunked(items, chunk_size):
+            yield from zip((row for _, row in chunk), evaluate_chunk([expression for expression, _ in chunk]))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(timeout, precision, backend)) as pool:
+        in_flight = deque()
+        for chunk in chunked(items, chunk_size):
+            rows = [row for _, row in chunk]
+            in_flight.append((rows, pool.submit(evaluate_chunk, [expression for expression, _ in chunk])))
+            if len(in_flight) >= workers * BATCH_CHUNKS_IN_FLIGHT_PER_WORKER:
+                rows, future = in_flight.popleft()
+                yield from zip(rows, future.result())
+        while in_flight:
+            rows, future = in_flight.popleft()
+            yield from zip(rows, future.result())
+
+
+def main(arguments: list[str] | None = None) -> int:
+    parser = ArgumentParser(description="Evaluates a file of expressions with the calculator")
+    parser.add_argument("input", help="input file, '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output file, '-' (default) for stdout")
+    parser.add_argument("--csv", action="store_true", help="read the expressions from a CSV column")
+    parser.add_argument("--column", default="0", help="CSV column, header name or 0-based index (default 0)")
+    parser.add_argument("--delimiter", default=",", help="CSV delimiter")
+    parser.add_argument("--result-column", default="result", help="name of the appended CSV result column")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1, help="worker processes (default: cores)")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="expressions per task")
+    parser.add_argument("--timeout", type=float, help="seconds a sympy evaluation may take, slower ones give 'Too expensive'")
+    parser.add_argument("--precision", type=int, help="significant digits of non-integer results (default 5)")
+    parser.add_argument("--backend", choices=("float", "rational", "sympy"), help="evaluation backend to start from")
+    options = parser.parse_args(arguments)
+
+    source = sys.stdin if options.input == "-" else open(options.input, newline="" if options.csv else None)
+    target = sys.stdout if options.output == "-" else open(options.output, "w", newline="" if options.csv else None)
+    count = 0
+    started = perf_counter()
+    try:
+        header = []
+        if options.csv:
+            items = read_csv_column(source, options.column, options.delimiter, header)
+            writer = csv.writer(target, delimiter=options.delimiter)
+        else:
+            items = read_lines(source)
+        results = evaluate_stream(items, options.workers, options.chunk_size, options.timeout, options.precision, options.backend)
+
+        for row, result in results:
+            if options.csv:
+                if header:
+                    # The header is only known once the first row was read
+                    writer.writerow(header.pop() + [options.result_column])
+                writer.writerow(row + [result])
+            else:
+                target.write(result + "\n")
+            count += 1
+        if header:
+            writer.writerow(header.pop() + [options.result_column])
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head), stdout is pointed at devnull so exiting doesn't fail again
+        if target is sys.stdout:
+            dup2(os_open(devnull, O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        try:
+            target.flush()
+        except BrokenPipeError:
+            pass
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = perf_counter() - started
+    throughput = count / elapsed if elapsed else 0.0
+    print(f"{count} expressions in {elapsed:.2f} s ({throughput:,.0f} expressions/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,93 @@
+"""
+Memory benchmark for the per-keystroke state handling.
+
+Types the expression corpus (then "=" and "C") through `handle_keyboard_input`
+on one CalculatorState, with the expression cache and incremental preview
+already warm so evaluation doesn't dominate, and reports the memory allocated
+while handling a key (peak above the state before the key, from tracemalloc)
+and what a key leaves allocated. Also reports the memory retained by one
+calculator session (a CalculatorApp on a headless page) and by its state.
+
+    python -m benchmarks.allocations
+"""
+import gc
+import tracemalloc
+from statistics import mean
+
+from benchmarks.common import button_event, headless_page, percentile
+from benchmarks.corpus import CORPUS
+from calculator_state import CalculatorState
+from expression_buffer import ExpressionBuffer
+from handle_keyboard_helpers import handle_keyboard_input
+from history_buffer import HistoryBuffer
+from incremental_preview import IncrementalEvaluator
+import main as calculator_app
+# ------------------------------------------------------------------------------
+
+SESSIONS = 20
+
+
+def keystroke_allocations() -> dict:
+    events = [button_event(key) for group in CORPUS.values() for expression in group for key in [*expression, "=", "C"]]
+    state = CalculatorState(ExpressionBuffer(), "", HistoryBuffer())
+    evaluator = IncrementalEvaluator()
+    # Warms the result cache, the sympy fallback would otherwise be all that is measured
+    for event in events:
+        handle_keyboard_input(event, state, evaluator)
+
+    peaks = []
+    gc.collect()
+    tracemalloc.start()
+    before_run = tracemalloc.get_traced_memory()[0]
+    for event in events:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        handle_keyboard_input(event, state, evaluator)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before_run
+    tracemalloc.stop()
+    peaks.sort()
+    return {"keys": len(events), "peak_p50": percentile(peaks, 0.5), "peak_mean": mean(peaks), "retained": retained / len(events)}
+
+
+def session_memory() -> dict:
+    calculator_app.ASYNC_PREVIEW = False
+    pages = [headless_page(session_id=f"session-{index}") for index in range(SESSIONS)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    apps = [calculator_app.CalculatorApp(page) for page in pages]
+    gc.collect()
+    created = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    state = apps[0].state
+    return {
+        "session_kb": created / SESSIONS / 1024,
+        "state_bytes": state_size(state),
+    }
+
+
+def state_size(state: CalculatorState) -> int:
+    """The state object itself and its expression buffer (the history entries are shared strings)"""
+    from sys import getsizeof
+
+    expression = state.expression
+    size = getsizeof(state) + getsizeof(expression)
+    if isinstance(expression, ExpressionBuffer):
+        size += getsizeof(expression.tokens) + getsizeof(expression.number_indexes)
+    return size + getsizeof(state.history_list) + getsizeof(state.history_list.entries)
+
+
+def main() -> None:
+    keys = keystroke_allocations()
+    print(
+        f"{keys['keys']} keys: {keys['peak_p50']:,.0f} B allocated per key (p50), {keys['peak_mean']:,.0f} B mean, "
+        f"{keys['retained']:,.1f} B left allocated per key"
+    )
+    session = session_memory()
+    print(f"one session: {session['session_kb']:,.1f} KB, of which the calculator state {session['state_bytes']:,} B")
+
+
+if __name__ == "__main__":
+    main()
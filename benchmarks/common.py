@@ -0,0 +1,69 @@
+import asyncio
+from math import ceil
+from statistics import mean
+from time import perf_counter_ns
+from types import SimpleNamespace
+
+from flet_core.local_connection import LocalConnection
+from flet_core.page import Page
+from flet_core.protocol import PageCommandsBatchResponsePayload
+# ------------------------------------------------------------------------------
+# Helpers shared by the benchmark scripts
+# ------------------------------------------------------------------------------
+
+
+def button_event(data: str) -> SimpleNamespace:
+    """Event shaped like the click of a calculator button (key in control.data)"""
+    return SimpleNamespace(control=SimpleNamespace(data=data), key=None, shift=False)
+
+
+def keyboard_event(key: str, shift: bool = False) -> SimpleNamespace:
+    """Event shaped like a page keyboard event (no control data)"""
+    return SimpleNamespace(control=SimpleNamespace(data=None), key=key, shift=shift)
+
+
+def time_call(function) -> float:
+    """Runs `function` once and returns the wall time in microseconds"""
+    start = perf_counter_ns()
+    function()
+    return (perf_counter_ns() - start) / 1000
+
+
+def percentile(sorted_samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    rank = max(1, ceil(fraction * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Reduces timing samples (microseconds) to the numbers reported and stored in baselines"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean": mean(ordered),
+        "min": ordered[0],
+        "p50": percentile(ordered, 0.50),
+        "p90": percentile(ordered, 0.90),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1],
+    }
+
+
+class HeadlessConnection(LocalConnection):
+    """Flet connection that processes page commands like the desktop server but sends nothing"""
+
+    def send_commands(self, session_id: str, commands: list):
+        results = []
+        for command in commands:
+            result, _message = self._process_command(command)
+            if command.name in ("add", "get"):
+                results.append(result)
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+
+def headless_page(loop: asyncio.AbstractEventLoop | None = None, session_id: str = "headless") -> Page:
+    """
+    Page backed by a HeadlessConnection, controls can be added and updated without a client.
+    Pages of simulated sessions can share one `loop` (running in another thread), like the sessions of a server.
+    """
+    return Page(HeadlessConnection(), session_id, loop=loop or asyncio.new_event_loop())
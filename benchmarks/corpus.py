@@ -0,0 +1,57 @@
+# ------------------------------------------------------------------------------
+# Representative expressions, grouped by what makes them expensive
+# ------------------------------------------------------------------------------
+
+CORPUS = {
+    "short": [
+        "1+1",
+        "12+3*4",
+        "7-2",
+        "9/3",
+        "5%3",
+        "2^8",
+        "0.5+0.25",
+        "100-1",
+    ],
+    "deep_parentheses": [
+        "((((1+2)*3)-4)/5)",
+        "(((((((2)))))))",
+        "((1+(2*(3+(4*(5+6))))))",
+        "(1+(2+(3+(4+(5+(6+(7+(8+9))))))))",
+        "((((((((1.5))))))))*2",
+    ],
+    "implied_multiplication": [
+        "2(3)",
+        "(1+2)(3+4)",
+        "3(4(5(6)))",
+        "(2)3(4)5",
+        "1.5(2)(3)",
+        "(7)(8)(9)(10)",
+    ],
+    "large_integers": [
+        "2^100",
+        "123456789*987654321",
+        "99999999999999999999+1",
+        "(2^64-1)*(2^64+1)",
+        "3^200-2^300",
+        "12345678901234567890123456789*98765432109876543210",
+    ],
+    "division_heavy": [
+        "1/3",
+        "22/7",
+        "1/7+1/11+1/13",
+        "((1/2)/(3/4))/(5/6)",
+        "100000/3",
+        "1/300000",
+        "355/113-22/7",
+        "10/4/2/8",
+    ],
+    # Inputs the native evaluator hands to sympy
+    "sympy_fallback": [
+        "2^0.5",
+        "4^(1/2)",
+        "1/0",
+        "5.5%2",
+        "(-8)^(1/3)",
+    ],
+}
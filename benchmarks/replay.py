@@ -0,0 +1,156 @@
+"""
+Headless replay of recorded sessions, for end-to-end latency regressions.
+
+Every recording made with `python main.py --record` (see session_recorder.py)
+is fed back through `CalculatorApp.handle_keyboard_input` of a CalculatorApp
+mounted on a headless page: key normalization, the handlers, the preview and
+the display update. Events are replayed as fast as possible or, with --paced,
+at the recorded pace (--speed 2 replays twice as fast). The preview is
+evaluated synchronously and keys are applied one by one, so an event's latency
+covers its whole path; when paced, it is measured from the event's due time.
+Reports the latency per recording and over all of them and whether each
+replay ends in the recorded state, exits with status 1 if one doesn't.
+
+    python -m benchmarks.replay ~/.flet_calculator/sessions [--paced] [--speed 2] [--repeat 3]
+"""
+import sys
+from argparse import ArgumentParser
+from os import listdir
+from os.path import basename, isdir, join
+from time import perf_counter, sleep
+
+import flet as ft
+
+from benchmarks.common import button_event, headless_page, summarize
+from evaluation_executor import EvaluationExecutor
+from fast_arithmetic import EVALF_DIGITS
+from handle_keyboard_helpers import set_evaluation_executor, set_precision, warm_up_engines
+from session_recorder import MODIFIERS, RecordedSession, read_session, state_snapshot
+import main as calculator_app
+# ------------------------------------------------------------------------------
+
+
+def keyboard_event(key: str, modifiers: int, page) -> ft.KeyboardEvent:
+    """A page keyboard event like Flet delivers it"""
+    event = ft.KeyboardEvent(key=key, **{name: bool(modifiers & bit) for name, bit in MODIFIERS})
+    event.target, event.name, event.data, event.control, event.page = "page", "keyboard_event", "", page, page
+    return event
+
+
+def replay(session: RecordedSession, paced: bool, speed: float) -> tuple[list[float], list[str] | None]:
+    """
+    Replays one recording on a new CalculatorApp, returns the event latencies (microseconds)
+    and the end state fields that differ from the recorded ones (None without a recorded end state)
+    """
+    # Every recording starts at the default precision, like a new app (Ctrl+P changes it for the process)
+    set_precision(EVALF_DIGITS)
+    page = headless_page()
+    app = calculator_app.CalculatorApp(page)
+    for entry in session.history:
+        app.state.history_list.append(entry)
+    app.history.show(app.state.history_list)
+    page.add(app)
+
+    latencies = []
+    started = perf_counter()
+    for offset, kind, value, modifiers in session.events:
+        due = started + offset / speed
+        if paced:
+            delay = due - perf_counter()
+            if delay > 0:
+                sleep(delay)
+        else:
+            due = perf_counter()
+        if kind == "p":
+            app.paste(value)
+        elif kind == "k":
+            app.handle_keyboard_input(keyboard_event(value, modifiers, page))
+        else:
+            app.handle_keyboard_input(button_event(value))
+        latencies.append((perf_counter() - due) * 1e6)
+
+    if session.end is None:
+        return latencies, None
+    replayed = state_snapshot(app.state)
+    return latencies, [field for field, value in session.end.items() if replayed.get(field) != value]
+
+
+def recording_paths(paths: list[str]) -> list[str]:
+    """The given files, and the recordings in the given directories"""
+    found = []
+    for path in paths:
+        if isdir(path):
+            found += sorted(join(path, name) for name in listdir(path) if ".jsonl" in name)
+        else:
+            found.append(path)
+    return found
+
+
+def format_row(name: str, events: int, latencies: list[float], outcome: str) -> str:
+    summary = summarize(latencies) if latencies else dict.fromkeys(("p50", "p90", "p99", "max"), 0.0)
+    return f"{name:40}{events:>8}" + "".join(f"{summary[key]:>10.1f}" for key in ("p50", "p90", "p99", "max")) + f"  {outcome}"
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Replays recorded calculator sessions headlessly")
+    parser.add_argument("recordings", nargs="+", help="recording files or directories of recordings")
+    parser.add_argument("--paced", action="store_true", help="replay at the recorded pace instead of as fast as possible")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace multiplier with --paced")
+    parser.add_argument("--repeat", type=int, default=1, help="replays per recording")
+    arguments = parser.parse_args()
+
+    # Every key is applied and previewed on its own, as it arrives
+    calculator_app.ASYNC_PREVIEW = False
+    calculator_app.INPUT_BATCHING = False
+    # Evaluated like the desktop app, so sympy deadlines ("Too expensive") apply as they did when recording
+    executor = EvaluationExecutor()
+    set_evaluation_executor(executor)
+    warm_up_engines()
+    # The worker's first simplify loads the rest of sympy, that isn't part of any recorded event
+    executor.evaluate("2**(1/2)")
+    try:
+        return replay_all(arguments)
+    finally:
+        set_evaluation_executor(None)
+        executor.shutdown()
+
+
+def replay_all(arguments) -> int:
+    """Replays every recording and prints its row, returns the exit status"""
+    paths = recording_paths(arguments.recordings)
+    if not paths:
+        print("no recordings found", file=sys.stderr)
+        return 1
+    print(f"{'recording':40}{'events':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}  end state")
+    all_latencies = []
+    mismatches = 0
+    for path in paths:
+        try:
+            session = read_session(path)
+        except (OSError, ValueError) as error:
+            print(f"{basename(path):40}  unreadable: {error}")
+            mismatches += 1
+            continue
+        latencies = []
+        differences = set()
+        for _ in range(arguments.repeat):
+            replay_latencies, differing = replay(session, arguments.paced, arguments.speed)
+            latencies += replay_latencies
+            differences.update(differing or ())
+        if session.end is None:
+            outcome = "not recorded"
+        elif differences:
+            outcome = "DIFFERS: " + ", ".join(sorted(differences))
+            mismatches += 1
+        else:
+            outcome = "same"
+        all_latencies += latencies
+        print(format_row(basename(path), len(session.events), latencies, outcome))
+
+    print(format_row("all", len(all_latencies) // arguments.repeat, all_latencies, f"{mismatches} differ"))
+    print("(latencies in microseconds, from the handler call or the recorded time to the display update)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,98 @@
+"""
+Scaling benchmark for the per-keystroke input pipeline.
+
+Times every step that runs when a digit is typed at the end of expressions of
+growing length and reports how the cost grows with the length. A growth
+exponent of 1 means linear time, anything well above it is flagged.
+
+    python -m benchmarks.scaling [--check]
+"""
+from argparse import ArgumentParser
+from math import log
+from statistics import median
+from time import perf_counter_ns
+
+from benchmarks.common import button_event
+from calculator_state import CalculatorState
+from expression_buffer import ExpressionBuffer
+from handle_keyboard_helpers import calculate, calculation_cache, handle_keyboard_input, update_expression
+from incremental_preview import IncrementalEvaluator
+# ------------------------------------------------------------------------------
+
+LENGTHS = (100, 1_000, 10_000)
+EXPRESSION_UNIT = "12+3*(4-5)/7-"
+REPETITIONS = 25
+# Growth exponent above which a step is reported as superlinear
+MAX_GROWTH_EXPONENT = 1.3
+
+
+def build_expression(length: int) -> str:
+    """Builds a valid expression of roughly `length` characters ending in a digit"""
+    return EXPRESSION_UNIT * (length // len(EXPRESSION_UNIT)) + "1"
+
+
+def time_step(step, repetitions: int = REPETITIONS) -> float:
+    """Returns the median wall time of `step` in microseconds"""
+    samples = []
+    for _ in range(repetitions):
+        start = perf_counter_ns()
+        step()
+        samples.append(perf_counter_ns() - start)
+    return median(samples) / 1000
+
+
+def measure(expression: str) -> dict[str, float]:
+    evaluator = IncrementalEvaluator()
+    evaluator.preview(expression)
+    buffer = ExpressionBuffer(expression)
+    event = button_event("7")
+
+    def cold_calculate():
+        calculation_cache.clear()
+        calculate(expression + "7")
+
+    def preview_keystroke():
+        # Type a digit and take it back again, so every repetition does the same work
+        evaluator.preview(expression + "7")
+        evaluator.preview(expression)
+
+    def keystroke():
+        handle_keyboard_input(event, CalculatorState(expression), evaluator)
+        evaluator.preview(expression)
+
+    def buffer_keystroke():
+        buffer.append("7")
+        buffer.backspace()
+
+    return {
+        "update_expression": time_step(lambda: update_expression("7", expression)),
+        "ExpressionBuffer (append + backspace)": time_step(buffer_keystroke),
+        "calculate (uncached)": time_step(cold_calculate),
+        "incremental preview (type + backspace)": time_step(preview_keystroke),
+        "handle_keyboard_input (+ backspace)": time_step(keystroke),
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Per-keystroke scaling benchmark")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if any step grows superlinearly")
+    arguments = parser.parse_args()
+
+    results = {length: measure(build_expression(length)) for length in LENGTHS}
+    steps = list(results[LENGTHS[0]])
+
+    print(f"{'step':42}" + "".join(f"{length:>12,}" for length in LENGTHS) + "    growth exponent")
+    superlinear = []
+    for step in steps:
+        timings = [results[length][step] for length in LENGTHS]
+        exponent = log(timings[-1] / timings[0]) / log(LENGTHS[-1] / LENGTHS[0])
+        flag = "  <-- superlinear" if exponent > MAX_GROWTH_EXPONENT else ""
+        if flag:
+            superlinear.append(step)
+        print(f"{step:42}" + "".join(f"{timing:>10.1f}us" for timing in timings) + f"    {exponent:6.2f}{flag}")
+
+    return 1 if arguments.check and superlinear else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
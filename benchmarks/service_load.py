@@ -0,0 +1,154 @@
+"""
+Load generator for the HTTP evaluation service.
+
+Starts `calculator_service.py` on a free port (unless --address points at a
+running one), then for each client count keeps that many keep-alive
+connections sending corpus expressions for --duration seconds, and reports
+throughput and client-side latency percentiles in milliseconds, with the
+service's cache hit rate and missed deadlines.
+
+    python -m benchmarks.service_load [--clients 1 8 32] [--duration 5] [--batch 50] [--distinct 1000]
+
+--distinct appends "+k" (k < distinct) to the expressions so fewer of them
+are cache hits, 0 sends the plain corpus.
+"""
+import asyncio
+import subprocess
+import sys
+from argparse import ArgumentParser
+from json import dumps, loads
+from random import Random
+from time import perf_counter
+from benchmarks.common import percentile
+from benchmarks.corpus import CORPUS
+# ------------------------------------------------------------------------------
+
+DEFAULT_CLIENTS = (1, 8, 32)
+DEFAULT_DURATION = 5.0
+EXPRESSIONS = [expression for group in CORPUS.values() for expression in group]
+
+
+class ServiceClient:
+    """One keep-alive HTTP/1.1 connection to the service"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "ServiceClient":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, host)
+
+    async def request(self, method: str, path: str, payload: dict | None = None) -> tuple[int, dict]:
+        body = dumps(payload).encode() if payload is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await self.writer.drain()
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(head[0].split(" ")[1])
+        length = next(int(line.partition(":")[2]) for line in head if line.lower().startswith("content-length:"))
+        return status, loads(await self.reader.readexactly(length))
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def make_payload(random: Random, batch: int, distinct: int) -> tuple[str, dict]:
+    def expression() -> str:
+        base = random.choice(EXPRESSIONS)
+        return f"{base}+{random.randrange(distinct)}" if distinct else base
+
+    if batch:
+        return "/batch", {"expressions": [expression() for _ in range(batch)]}
+    return "/calculate", {"expression": expression()}
+
+
+async def run_client(host: str, port: int, seed: int, stop_at: float, batch: int, distinct: int, samples: list, failures: list):
+    random = Random(seed)
+    client = await ServiceClient.connect(host, port)
+    try:
+        while perf_counter() < stop_at:
+            path, payload = make_payload(random, batch, distinct)
+            started = perf_counter()
+            status, _response = await client.request("POST", path, payload)
+            samples.append(perf_counter() - started)
+            if status != 200:
+                failures.append(status)
+    finally:
+        await client.close()
+
+
+async def measure(host: str, port: int, clients: int, duration: float, batch: int, distinct: int) -> dict:
+    samples, failures = [], []
+    started = perf_counter()
+    await asyncio.gather(
+        *(run_client(host, port, seed, started + duration, batch, distinct, samples, failures) for seed in range(clients))
+    )
+    elapsed = perf_counter() - started
+    ordered = sorted(samples)
+    metrics_client = await ServiceClient.connect(host, port)
+    _status, metrics = await metrics_client.request("GET", "/metrics")
+    await metrics_client.close()
+    return {
+        "requests_per_s": len(samples) / elapsed,
+        "expressions_per_s": len(samples) * (batch or 1) / elapsed,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "failures": len(failures),
+        "metrics": metrics,
+    }
+
+
+def start_service(workers: int | None) -> tuple[subprocess.Popen, str, int]:
+    command = [sys.executable, "calculator_service.py", "--port", "0"]
+    if workers:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    line = process.stderr.readline()
+    if not line.startswith("Listening on http://"):
+        process.kill()
+        raise SystemExit(f"the service didn't start: {line}{process.stderr.read()}")
+    host, _, port = line.strip().removeprefix("Listening on http://").rpartition(":")
+    return process, host, int(port)
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Concurrent-client load test of calculator_service.py")
+    parser.add_argument("--address", help="host:port of a running service, started here otherwise")
+    parser.add_argument("--workers", type=int, help="sympy workers of the started service (default: cores)")
+    parser.add_argument("--clients", type=int, nargs="+", default=DEFAULT_CLIENTS)
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds per client count")
+    parser.add_argument("--batch", type=int, default=0, help="expressions per /batch request, 0 uses /calculate")
+    parser.add_argument("--distinct", type=int, default=0, help="variants per corpus expression, lowers the hit rate")
+    arguments = parser.parse_args()
+
+    process = None
+    if arguments.address:
+        host, _, port = arguments.address.rpartition(":")
+        port = int(port)
+    else:
+        process, host, port = start_service(arguments.workers)
+    try:
+        print(f"{'clients':>8}{'requests/s':>12}{'expr/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'failed':>8}{'hit rate':>10}{'timed out':>11}")
+        for clients in arguments.clients:
+            result = asyncio.run(measure(host, port, clients, arguments.duration, arguments.batch, arguments.distinct))
+            metrics = result["metrics"]
+            print(
+                f"{clients:>8}{result['requests_per_s']:>12,.0f}{result['expressions_per_s']:>10,.0f}"
+                f"{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['failures']:>8}"
+                f"{metrics['cache']['hit_rate']:>10.1%}{metrics['timed_out']:>11}"
+            )
+        print("(hit rate and timed out are cumulative over the service's lifetime)")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
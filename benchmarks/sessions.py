@@ -0,0 +1,159 @@
+"""
+Multi-session load harness for server mode.
+
+For each session count N, a fresh interpreter builds N calculator sessions on
+headless pages sharing one event loop, like the sessions of `main.py --server`,
+and has every session type corpus expressions (then "=" and "C") at a fixed
+key interval for --duration seconds. Keys are dispatched to a shared handler
+thread pool, as the Flet server does. It reports the keystroke latency (from
+dispatch to the display update that applied it) and the resident memory added
+per session, in server mode or, with --desktop, with the per-session defaults.
+
+    python -m benchmarks.sessions [--sessions 1 10 50 100] [--duration 5] [--key-interval 0.05] [--desktop]
+"""
+import asyncio
+import gc
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from random import Random
+from threading import Thread
+from time import perf_counter
+# ------------------------------------------------------------------------------
+
+DEFAULT_SESSIONS = (1, 10, 50, 100)
+DEFAULT_DURATION = 5.0
+# Seconds between two keys of one session, a fast typist
+DEFAULT_KEY_INTERVAL = 0.05
+
+
+def resident_memory() -> int:
+    """Resident set size in bytes (Linux)"""
+    from resource import getpagesize
+
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * getpagesize()
+
+
+async def type_keys(app, handlers: ThreadPoolExecutor, seed: int, stop_at: float, key_interval: float) -> None:
+    """One session's keystroke stream: corpus expressions followed by "=" and "C" """
+    from benchmarks.common import button_event
+    from benchmarks.corpus import CORPUS
+
+    expressions = [expression for group in CORPUS.values() for expression in group]
+    random = Random(seed)
+    loop = asyncio.get_running_loop()
+    # Sessions start typing at different moments of the first interval
+    await asyncio.sleep(random.random() * key_interval)
+    while perf_counter() < stop_at:
+        for key in [*random.choice(expressions), "=", "C"]:
+            event = button_event(key)
+            event.dispatched = perf_counter()
+            loop.run_in_executor(handlers, app.handle_keyboard_input, event)
+            await asyncio.sleep(key_interval)
+
+
+def run_sessions(count: int, duration: float, key_interval: float, desktop: bool) -> dict:
+    """Runs in the child interpreter"""
+    from benchmarks.common import headless_page, percentile
+    from evaluation_executor import EvaluationExecutor
+    from handle_keyboard_helpers import get_calculation_cache_stats, set_evaluation_executor, warm_up_engines
+    from server_mode import ServerResources
+    import main as calculator_app
+
+    if desktop:
+        server = None
+        set_evaluation_executor(EvaluationExecutor())
+    else:
+        server = ServerResources()
+    warm_up_engines()
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, daemon=True).start()
+    # Flet dispatches the sync event handlers of every session to one thread pool of this default size
+    handlers = ThreadPoolExecutor()
+    latencies = []
+
+    def timed(apply_input):
+        def apply_and_record(events):
+            apply_input(events)
+            applied = perf_counter()
+            latencies.extend(applied - event.dispatched for event in events)
+
+        return apply_and_record
+
+    gc.collect()
+    baseline = resident_memory()
+    apps = []
+    for index in range(count):
+        page = headless_page(loop, f"session-{index}")
+        calculator_app.main(page, server)
+        app = page.controls[0]
+        app.apply_input = timed(app.apply_input)
+        if app.input_batcher is not None:
+            app.input_batcher.apply_batch = app.apply_input
+        apps.append(app)
+    gc.collect()
+    created = resident_memory()
+
+    started = perf_counter()
+    clients = [type_keys(app, handlers, seed, started + duration, key_interval) for seed, app in enumerate(apps)]
+    asyncio.run_coroutine_threadsafe(asyncio.wait([loop.create_task(client) for client in clients]), loop).result()
+    handlers.shutdown(wait=True)
+    elapsed = perf_counter() - started
+    gc.collect()
+    after_run = resident_memory()
+
+    for app in apps:
+        app.close()
+    ordered = sorted(latencies)
+    return {
+        "keys_per_s": len(ordered) / elapsed,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "created_kb_per_session": (created - baseline) / count / 1024,
+        "run_kb_per_session": (after_run - baseline) / count / 1024,
+        "cache_hit_rate": get_calculation_cache_stats()["hit_rate"],
+    }
+
+
+def run_child(count: int, duration: float, key_interval: float, desktop: bool) -> dict:
+    command = [
+        sys.executable, "-m", "benchmarks.sessions", "--child", str(count),
+        "--duration", str(duration), "--key-interval", str(key_interval),
+    ]
+    if desktop:
+        command.append("--desktop")
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Concurrent-session load harness for the calculator's server mode")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS)
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds of typing per session count")
+    parser.add_argument("--key-interval", type=float, default=DEFAULT_KEY_INTERVAL, help="seconds between keys")
+    parser.add_argument("--desktop", action="store_true", help="per-session defaults instead of server mode")
+    parser.add_argument("--child", type=int, help="internal: runs N sessions in this interpreter")
+    arguments = parser.parse_args()
+
+    if arguments.child:
+        result = run_sessions(arguments.child, arguments.duration, arguments.key_interval, arguments.desktop)
+        print(dumps(result))
+        # The shared loop and executors are daemon threads / processes, nothing to wait for
+        return
+
+    print(f"{'mode':8}{'sessions':>9}{'keys/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'KB/session':>12}{'after run':>11}{'hit rate':>10}")
+    mode = "desktop" if arguments.desktop else "server"
+    for count in arguments.sessions:
+        result = run_child(count, arguments.duration, arguments.key_interval, arguments.desktop)
+        print(
+            f"{mode:8}{count:>9}{result['keys_per_s']:>9,.0f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+            f"{result['created_kb_per_session']:>12.0f}{result['run_kb_per_session']:>11.0f}{result['cache_hit_rate']:>10.1%}"
+        )
+    print("(latency from key dispatch to the display update, memory is resident set growth over the shared baseline)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Startup benchmark.
+
+Starts fresh interpreters that import `main`, build the calculator on a
+headless page (`main.main`) and wait for the background warm-up, and reports
+the median time to import, to the first frame and to warm engines, in
+milliseconds. The "eager" row imports sympy up front, like the app did before
+the engines were loaded lazily.
+
+    python -m benchmarks.startup [--runs 10]
+"""
+import subprocess
+import sys
+from argparse import ArgumentParser
+from json import loads
+from statistics import median
+# ------------------------------------------------------------------------------
+
+DEFAULT_RUNS = 10
+
+CHILD_SCRIPT = """
+import sys
+from json import dumps
+from threading import Event
+from time import perf_counter
+
+start = perf_counter()
+if {eager}:
+    import sympy
+import main
+imported = perf_counter()
+
+warm = Event()
+warm_up_in_background = main.warm_up_in_background
+def timed_warm_up():
+    warm_up_in_background()
+    warm.set()
+main.warm_up_in_background = timed_warm_up
+
+from benchmarks.common import headless_page
+main.main(headless_page())
+first_frame = perf_counter()
+sympy_at_first_frame = "sympy" in sys.modules
+warm.wait()
+warmed = perf_counter()
+print(dumps({{
+    "import": (imported - start) * 1000,
+    "first_frame": (first_frame - start) * 1000,
+    "engines_warm": (warmed - start) * 1000,
+    "sympy_at_first_frame": sympy_at_first_frame,
+}}))
+"""
+
+
+def run_child(eager: bool) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT.format(eager=eager)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Cold-start benchmark for the calculator")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    arguments = parser.parse_args()
+
+    print(f"{'mode':10}{'import':>10}{'first frame':>14}{'engines warm':>15}  sympy loaded at first frame")
+    for mode, eager in (("lazy", False), ("eager", True)):
+        runs = [run_child(eager) for _ in range(arguments.runs)]
+        print(
+            f"{mode:10}"
+            f"{median(run['import'] for run in runs):>10.1f}"
+            f"{median(run['first_frame'] for run in runs):>14.1f}"
+            f"{median(run['engines_warm'] for run in runs):>15.1f}"
+            f"  {any(run['sympy_at_first_frame'] for run in runs)}"
+        )
+    print("(median milliseconds since interpreter start of the measurement)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Headless benchmark suite for the evaluation and input pipeline.
+
+Covers `calculate` over the expression corpus (cold and cached), the full
+`handle_keyboard_input` path driven by synthetic button and keyboard events,
+pasting whole expressions, recording, undoing and redoing the steps of long
+edits, and building the UI (`create_button_rows`, `CalculatorApp`). Reports
+percentiles in microseconds, can save them as a JSON baseline and flags
+regressions against a stored baseline. Ends with how often each evaluation
+backend was picked and fell back (--backend pins one, to compare them) and
+with the memory the undo history holds per step.
+
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --backend rational
+"""
+import gc
+import tracemalloc
+from argparse import ArgumentParser
+from json import dump, load
+from platform import platform, python_version
+
+from benchmarks.common import button_event, keyboard_event, summarize, time_call
+from benchmarks.corpus import CORPUS
+from calculator_state import CalculatorState
+from evaluation_backends import backend_names, get_backend_stats
+from handle_keyboard_helpers import (
+    apply_input_key,
+    calculate,
+    calculation_cache,
+    handle_keyboard_batch,
+    handle_keyboard_input,
+    resolve_input_key,
+    set_evaluation_backend,
+    updates_preview,
+)
+from expression_buffer import ExpressionBuffer
+from incremental_preview import IncrementalEvaluator
+from main import CalculatorApp
+from undo_history import UndoHistory
+from ui_components import create_button_rows
+# ------------------------------------------------------------------------------
+
+DEFAULT_REPETITIONS = 30
+# A benchmark regresses when its p50 grows by more than this fraction over the baseline
+DEFAULT_THRESHOLD = 0.25
+# Timings this small are dominated by noise and never reported as regressions
+NOISE_FLOOR_US = 5.0
+# Characters typed by the long edits undone and redone, undo / redo should cost the same for both
+UNDO_EDIT_LENGTHS = (100, 2000)
+# Memory limit of the undo history in the eviction part of the undo report
+UNDO_REPORT_MEMORY_LIMIT = 64 * 1024
+
+
+def benchmark_calculate(repetitions: int) -> dict[str, list[float]]:
+    samples = {}
+    for category, expressions in CORPUS.items():
+        cold = samples.setdefault(f"calculate/{category}", [])
+        cached = samples.setdefault(f"calculate/{category}/cached", [])
+        for _ in range(repetitions):
+            for expression in expressions:
+                calculation_cache.clear()
+                cold.append(time_call(lambda: calculate(expression)))
+                cached.append(time_call(lambda: calculate(expression)))
+    return samples
+
+
+def type_expression(expression: str, make_event, evaluator) -> list[float]:
+    """Feeds an expression key by key (then "=") through handle_keyboard_input, timing every event"""
+    state = CalculatorState()
+
+    def press(event):
+        handle_keyboard_input(event, state, evaluator)
+
+    timings = []
+    for key in list(expression) + ["="]:
+        event = make_event(key)
+        timings.append(time_call(lambda: press(event)))
+    return timings
+
+
+def benchmark_keyboard_input(repetitions: int) -> dict[str, list[float]]:
+    samples = {}
+    for category, expressions in CORPUS.items():
+        for source, make_event in (("buttons", button_event), ("keyboard", keyboard_event)):
+            bucket = samples.setdefault(f"keyboard/{source}/{category}", [])
+            for _ in range(repetitions):
+                calculation_cache.clear()
+                for expression in expressions:
+                    bucket.extend(type_expression(expression, make_event, IncrementalEvaluator()))
+    return samples
+
+
+def benchmark_paste(repetitions: int) -> dict[str, list[float]]:
+    """Pastes every expression as a whole, one sample per paste (validation, ingestion and the preview)"""
+    samples = {}
+    for category, expressions in CORPUS.items():
+        bucket = samples.setdefault(f"keyboard/paste/{category}", [])
+        for _ in range(repetitions):
+            calculation_cache.clear()
+            for expression in expressions:
+                state = CalculatorState(ExpressionBuffer())
+                bucket.append(time_call(lambda: handle_keyboard_batch([expression], state)))
+    return samples
+
+
+def edit_keys(length: int) -> list[str]:
+    """A long edit: `length` characters typed with every eighth one backspaced and typed again, then "=" and "C" twice"""
+    keys = []
+    operand = "12+34*(5-6)/7-"
+    for position in range(length):
+        char = operand[position % len(operand)]
+        keys.append(char)
+        if position % 8 == 7:
+            keys.extend(["Backspace", char])
+    return keys + ["=", "C", "C"]
+
+
+def record_edit(keys: list, undo_history: UndoHistory, state: CalculatorState, timings: list | None = None) -> None:
+    """Applies the keys one by one, recording each as an undo step (timed into `timings` when given)"""
+
+    def press(event):
+        undo_history.begin(state)
+        input_key = resolve_input_key(event)
+        apply_input_key(input_key, state)
+        undo_history.commit(state, updates_preview(input_key))
+
+    for key in keys:
+        event = button_event(key)
+        if timings is None:
+            press(event)
+        else:
+            timings.append(time_call(lambda: press(event)))
+
+
+def benchmark_undo(repetitions: int) -> dict[str, list[float]]:
+    """Records every key of long edits as an undo step, then undoes and redoes all of them, one sample per step"""
+    samples = {}
+    for length in UNDO_EDIT_LENGTHS:
+        keys = edit_keys(length)
+        recorded = samples.setdefault(f"undo/record/{length}", [])
+        undone = samples.setdefault(f"undo/undo/{length}", [])
+        redone = samples.setdefault(f"undo/redo/{length}", [])
+        for _ in range(repetitions):
+            state = CalculatorState(ExpressionBuffer())
+            undo_history = UndoHistory()
+            record_edit(keys, undo_history, state, recorded)
+            for _ in range(len(undo_history)):
+                undone.append(time_call(lambda: undo_history.undo(state)))
+            while undo_history.redo_steps:
+                redone.append(time_call(lambda: undo_history.redo(state)))
+    return samples
+
+
+def benchmark_ui(repetitions: int) -> dict[str, list[float]]:
+    def on_click(event):
+        pass
+
+    return {
+        "ui/create_button_rows": [time_call(lambda: create_button_rows(on_click)) for _ in range(repetitions)],
+        "ui/CalculatorApp": [time_call(lambda: CalculatorApp(None)) for _ in range(repetitions)],
+    }
+
+
+def run_suite(repetitions: int) -> dict[str, dict]:
+    samples = {}
+    samples.update(benchmark_calculate(repetitions))
+    samples.update(benchmark_keyboard_input(repetitions))
+    samples.update(benchmark_paste(repetitions))
+    samples.update(benchmark_undo(repetitions))
+    samples.update(benchmark_ui(repetitions))
+    return {name: summarize(timings) for name, timings in samples.items()}
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> dict[str, float]:
+    """Returns the relative p50 change of every benchmark that got slower than allowed"""
+    regressions = {}
+    for name, summary in results.items():
+        previous = baseline.get(name)
+        if previous is None or summary["p50"] < NOISE_FLOOR_US:
+            continue
+        change = summary["p50"] / previous["p50"] - 1
+        if change > threshold:
+            regressions[name] = change
+    return regressions
+
+
+def print_report(results: dict, baseline: dict | None, regressions: dict) -> None:
+    header = f"{'benchmark':44}{'p50':>10}{'p90':>10}{'p99':>10}{'mean':>10}"
+    print(header + ("    vs baseline" if baseline else ""))
+    for name, summary in results.items():
+        line = f"{name:44}" + "".join(f"{summary[key]:>10.1f}" for key in ("p50", "p90", "p99", "mean"))
+        if baseline and name in baseline:
+            change = summary["p50"] / baseline[name]["p50"] - 1
+            line += f"    {change:+7.1%}" + ("  <-- regression" if name in regressions else "")
+        print(line)
+    print("(all times in microseconds)")
+
+
+def print_backend_report() -> None:
+    print(f"{'backend':12}{'chosen':>10}{'evaluated':>11}{'fallbacks':>11}{'p50':>10}{'p99':>10}  fallbacks by feature")
+    for name, stats in get_backend_stats()["backends"].items():
+        latency = stats["latency"]
+        features = ", ".join(f"{feature} {count}" for feature, count in stats["fallback_features"].items())
+        print(
+            f"{name:12}{stats['chosen']:>10}{stats['evaluations']:>11}{stats['fallbacks']:>11}"
+            f"{latency.get('p50_us', 0.0):>10.1f}{latency.get('p99_us', 0.0):>10.1f}  {features}"
+        )
+
+
+def print_undo_report() -> None:
+    """Memory held by the undo history per step (traced and estimated), and what a small limit keeps"""
+    print(f"{'undo edit':12}{'steps':>10}{'traced B/step':>15}{'estimated B/step':>18}{'kept':>10}{'dropped':>10}")
+    for length in UNDO_EDIT_LENGTHS:
+        keys = edit_keys(length)
+        state = CalculatorState(ExpressionBuffer())
+        undo_history = UndoHistory()
+        # Everything but the undo steps is allocated by a first run over the same keys
+        record_edit(keys, UndoHistory(), CalculatorState(ExpressionBuffer()))
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        record_edit(keys, undo_history, state)
+        state = None
+        gc.collect()
+        traced = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        steps = len(undo_history)
+
+        bounded = UndoHistory(UNDO_REPORT_MEMORY_LIMIT)
+        record_edit(keys, bounded, CalculatorState(ExpressionBuffer()))
+        print(
+            f"{length:<12}{steps:>10}{traced / steps:>15.1f}{undo_history.size / steps:>18.1f}"
+            f"{len(bounded):>10}{bounded.dropped:>10}"
+        )
+    print(f"(kept / dropped with a {UNDO_REPORT_MEMORY_LIMIT // 1024} KiB memory limit)")
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Benchmark suite for the calculator pipeline")
+    parser.add_argument("--repetitions", type=int, default=DEFAULT_REPETITIONS)
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results to a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a stored JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed relative p50 slowdown")
+    parser.add_argument("--backend", choices=backend_names(), help="evaluation backend to start from")
+    arguments = parser.parse_args()
+
+    set_evaluation_backend(arguments.backend)
+    results = run_suite(arguments.repetitions)
+
+    baseline = None
+    regressions = {}
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as baseline_file:
+            baseline = load(baseline_file)["results"]
+        regressions = find_regressions(results, baseline, arguments.threshold)
+
+    print_report(results, baseline, regressions)
+    print_backend_report()
+    print_undo_report()
+
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, "w", encoding="utf-8") as baseline_file:
+            dump(
+                {
+                    "python": python_version(),
+                    "platform": platform(),
+                    "repetitions": arguments.repetitions,
+                    "results": results,
+                },
+                baseline_file,
+                indent=2,
+            )
+        print(f"baseline saved to {arguments.save_baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {arguments.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,59 @@
+"""
+Update traffic benchmark for the calculator display.
+
+Types the expression corpus into a CalculatorApp mounted on a headless page
+and reports, per keystroke, the update messages and bytes sent to the Flet
+client and the time spent in the update, once with the targeted display
+updates and once with a whole-tree `update()` for comparison.
+
+    python -m benchmarks.updates
+"""
+from benchmarks.common import button_event, headless_page, summarize, time_call
+from benchmarks.corpus import CORPUS
+from handle_keyboard_helpers import calculation_cache
+import main as calculator_app
+# ------------------------------------------------------------------------------
+
+
+def measure(whole_tree: bool) -> dict:
+    # The preview is evaluated synchronously and keys aren't batched, so every keystroke's traffic is counted
+    calculator_app.ASYNC_PREVIEW = False
+    calculator_app.INPUT_BATCHING = False
+    calculator_app.UPDATE_METER = True
+    page = headless_page()
+    app = calculator_app.CalculatorApp(page)
+    page.add(app)
+    if whole_tree:
+        app.refresh_display = app.update
+    timings = []
+    original_refresh = app.refresh_display
+
+    def timed_refresh():
+        timings.append(time_call(original_refresh))
+
+    app.refresh_display = timed_refresh
+    calculation_cache.clear()
+    for expressions in CORPUS.values():
+        for expression in expressions:
+            for key in list(expression) + ["=", "C"]:
+                app.handle_keyboard_input(button_event(key))
+    stats = app.update_meter.stats()
+    return {
+        "messages_per_keystroke": stats["messages_per_keystroke"],
+        "bytes_per_keystroke": stats["bytes_per_keystroke"],
+        "update_p50_us": summarize(timings)["p50"],
+    }
+
+
+def main() -> None:
+    print(f"{'mode':14}{'messages/key':>14}{'bytes/key':>12}{'update p50 (us)':>18}")
+    for mode, whole_tree in (("targeted", False), ("whole tree", True)):
+        result = measure(whole_tree)
+        print(
+            f"{mode:14}{result['messages_per_keystroke']:>14.2f}"
+            f"{result['bytes_per_keystroke']:>12.1f}{result['update_p50_us']:>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Local HTTP/JSON service exposing `calculate`, with the app's exact semantics.
+
+    python calculator_service.py [--port 8765] [--workers 4]
+
+    POST /calculate  {"expression": "2(3)+1", "deadline": 0.5}
+                  -> {"expression": "2(3)+1", "result": "7"}
+    POST /batch      {"expressions": ["1/3", "5%3"], "deadline": 2}
+                  -> {"results": [{"result": "0.33333"}, {"result": "2"}]}
+    GET  /metrics -> request latency per route, deadlines missed, cache hit rate,
+                     evaluations / fallbacks / latency per evaluation backend
+
+`deadline` (seconds, optional) bounds the whole request. An expression that
+misses it is answered with "Too expensive" and "timed_out": true; its
+evaluation still completes in the background (bounded by MAX_EXACT_BITS on
+the inline exact path and by the sympy worker timeout) and lands in the
+shared result cache, so a retry is usually a hit.
+Invalid input is returned unchanged and evaluation errors as "error": "<Type>".
+"""
+import asyncio
+import signal
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from os import cpu_count
+from time import monotonic, perf_counter
+from constants import (
+    EVALUATION_TIMEOUT,
+    SERVICE_DEADLINE,
+    SERVICE_HOST,
+    SERVICE_MAX_BATCH,
+    SERVICE_MAX_BODY,
+    SERVICE_MAX_DEADLINE,
+    SERVICE_PORT,
+    SERVICE_THREADS_PER_WORKER,
+    TOO_EXPENSIVE_RESULT,
+)
+from instrumentation import LatencyHistogram
+# ------------------------------------------------------------------------------
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+}
+ROUTES = {"/calculate": "POST", "/batch": "POST", "/metrics": "GET"}
+
+
+class RequestError(Exception):
+    """Answered with `status` and {"error": message}"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceMetrics:
+    """Request latency per route and counters, exported by GET /metrics"""
+
+    def __init__(self):
+        self.started = monotonic()
+        self.latency = {}
+        self.statuses = {}
+        self.expressions = 0
+        self.timed_out = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def record_request(self, route: str, status: int, seconds: float) -> None:
+        histogram = self.latency.get(route)
+        if histogram is None:
+            histogram = self.latency[route] = LatencyHistogram()
+        histogram.add(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def export(self) -> dict:
+        from evaluation_backends import get_backend_stats
+        from handle_keyboard_helpers import evaluation_executor, get_calculation_cache_stats
+
+        return {
+            "uptime_s": monotonic() - self.started,
+            "in_flight": self.in_flight,
+            "requests": {route: histogram.summary() for route, histogram in sorted(self.latency.items())},
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "expressions": self.expressions,
+            "timed_out": self.timed_out,
+            "evaluation_errors": self.errors,
+            "cache": get_calculation_cache_stats(),
+            "executor": evaluation_executor.stats() if evaluation_executor is not None else None,
+            "backends": get_backend_stats(),
+        }
+
+
+class CalculatorService:
+    """
+    Serves `calculate` over HTTP/1.1 (keep-alive, JSON bodies). Calls run on a thread pool so
+    the event loop keeps accepting requests; sympy itself runs in the EvaluationExecutor's processes.
+    """
+
+    def __init__(self, threads: int, deadline: float = SERVICE_DEADLINE, max_deadline: float = SERVICE_MAX_DEADLINE):
+        from handle_keyboard_helpers import calculate
+
+        self.calculate = calculate
+        self.deadline = deadline
+        self.max_deadline = max_deadline
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="calculate")
+        self.metrics = ServiceMetrics()
+
+    async def evaluate(self, expression: str, deadline_at: float) -> dict:
+        """Evaluates on the pool, answering "Too expensive" once the loop time passes `deadline_at`"""
+        self.metrics.expressions += 1
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.pool, self.calculate, expression), max(0.0, deadline_at - loop.time())
+            )
+        except asyncio.TimeoutError:
+            self.metrics.timed_out += 1
+            return {"result": TOO_EXPENSIVE_RESULT, "timed_out": True}
+        except Exception as error:
+            # e.g. ZeroDivisionError raised by sympy for "1%0"
+            self.metrics.errors += 1
+            return {"error": type(error).__name__}
+        return {"result": result}
+
+    def deadline_at(self, request: dict) -> float:
+        deadline = request.get("deadline", self.deadline)
+        if isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or deadline <= 0:
+            raise RequestError(400, "deadline must be a positive number of seconds")
+        return asyncio.get_running_loop().time() + min(deadline, self.max_deadline)
+
+    async def handle_calculate(self, request: dict) -> dict:
+        expression = request.get("expression")
+        if not isinstance(expression, str):
+            raise RequestError(400, "expression must be a string")
+        return {"expression": expression, **await self.evaluate(expression, self.deadline_at(request))}
+
+    async def handle_batch(self, request: dict) -> dict:
+        expressions = request.get("expressions")
+        if not isinstance(expressions, list) or not all(isinstance(expression, str) for expression in expressions):
+            raise RequestError(400, "expressions must be a list of strings")
+        if len(expressions) > SERVICE_MAX_BATCH:
+            raise RequestError(413, f"at most {SERVICE_MAX_BATCH} expressions per batch")
+        # One deadline for the whole batch, its expressions are evaluated concurrently
+        deadline_at = self.deadline_at(request)
+        results = await asyncio.gather(*(self.evaluate(expression, deadline_at) for expression in expressions))
+        return {"results": results}
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> dict:
+        if path not in ROUTES:
+            raise RequestError(404, f"no route {path}")
+        if method != ROUTES[path]:
+            raise RequestError(405, f"{path} expects {ROUTES[path]}")
+        if path == "/metrics":
+            return self.metrics.export()
+        try:
+            request = loads(body)
+        except ValueError:
+            raise RequestError(400, "body must be JSON")
+        if not isinstance(request, dict):
+            raise RequestError(400, "body must be a JSON object")
+        if path == "/calculate":
+            return await self.handle_calculate(request)
+        return await self.handle_batch(request)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answers the requests of one connection in order until it is closed"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except RequestError as error:
+                    # The stream can't be trusted past a malformed request
+                    writer.write(encode_response(error.status, {"error": str(error)}, keep_alive=False))
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                method, path, keep_alive, body = request
+
+                started = perf_counter()
+                self.metrics.in_flight += 1
+                try:
+                    status, payload = 200, await self.dispatch(method, path, body)
+                except RequestError as error:
+                    status, payload = error.status, {"error": str(error)}
+                finally:
+                    self.metrics.in_flight -= 1
+                writer.write(encode_response(status, payload, keep_alive))
+                await writer.drain()
+                self.metrics.record_request(f"{method} {path}" if path in ROUTES else "other", status, perf_counter() - started)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, bool, bytes] | None:
+    """Reads one request as (method, path, keep_alive, body), None when the client closed the connection"""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as error:
+        if error.partial.strip():
+            raise RequestError(400, "incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise RequestError(431, "request head too large")
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = request_line.split(" ")
+    except ValueError:
+        raise RequestError(400, "malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+
+    if "transfer-encoding" in headers:
+        raise RequestError(411, "chunked bodies are not supported, send a Content-Length")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise RequestError(400, "invalid Content-Length")
+    if length < 0:
+        raise RequestError(400, "invalid Content-Length")
+    if length > SERVICE_MAX_BODY:
+        raise RequestError(413, f"bodies are limited to {SERVICE_MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return method, target.partition("?")[0], keep_alive, body
+
+
+def encode_response(status: int, payload: dict, keep_alive: bool) -> bytes:
+    body = dumps(payload, separators=(",", ":")).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+async def serve(service: CalculatorService, host: str, port: int) -> None:
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    bound_host, bound_port = server.sockets[0].getsockname()[:2]
+    # Flushed right away, the load generator reads the port from here when started with --port 0
+    print(f"Listening on http://{bound_host}:{bound_port}", file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(arguments: list[str] | None = None) -> int:
+    parser = ArgumentParser(description="Local HTTP/JSON service evaluating expressions like the calculator")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="0 picks a free port")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1, help="sympy worker processes (default: cores)")
+    parser.add_argument("--deadline", type=float, default=SERVICE_DEADLINE, help="default request deadline, seconds")
+    parser.add_argument(
+        "--evaluation-timeout",
+        type=float,
+        default=EVALUATION_TIMEOUT,
+        help="seconds a sympy evaluation may take before it is cached as 'Too expensive'",
+    )
+    parser.add_argument("--precision", type=int, help="significant digits of non-integer results (default 5)")
+    parser.add_argument("--backend", choices=("float", "rational", "sympy"), help="evaluation backend to start from")
+    options = parser.parse_args(arguments)
+
+    from evaluation_executor import EvaluationExecutor
+    from handle_keyboard_helpers import set_evaluation_backend, set_evaluation_executor, set_precision, warm_up_engines
+
+    if options.precision:
+        set_precision(options.precision)
+    if options.backend:
+        set_evaluation_backend(options.backend)
+    executor = EvaluationExecutor(workers=options.workers, timeout=options.evaluation_timeout)
+    set_evaluation_executor(executor)
+    warm_up_engines()
+    service = CalculatorService(options.workers * SERVICE_THREADS_PER_WORKER, options.deadline)
+    # Stopped like Ctrl+C, so the sympy worker processes are shut down too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(serve(service, options.host, options.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+        set_evaluation_executor(None)
+        executor.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
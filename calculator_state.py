@@ -0,0 +1,31 @@
+from constants import HISTORY_VISIBLE_ROWS
+from expression_buffer import ExpressionBuffer
+from history_buffer import HistoryBuffer
+# ------------------------------------------------------------------------------
+
+
+class CalculatorState:
+    """
+    What a calculator session shows: the expression being typed, the result
+    line and the calculation history.
+
+    The key handlers (see handle_keyboard_helpers) update it in place, so an
+    event allocates no state tuple. `expression` is an ExpressionBuffer or a
+    plain string, `history_list` a HistoryBuffer or a list; the history text is
+    derived from the newest entries on demand.
+    """
+
+    __slots__ = ("expression", "result", "history_list")
+
+    def __init__(self, expression: str | ExpressionBuffer = "", result: str = "", history_list: HistoryBuffer | list | None = None):
+        self.expression = expression
+        self.result = result
+        self.history_list = HistoryBuffer() if history_list is None else history_list
+
+    def __repr__(self) -> str:
+        return f"CalculatorState({str(self.expression)!r}, {self.result!r}, {self.history_list!r})"
+
+    @property
+    def history(self) -> str:
+        """The newest entries, one per line, like the history pane shows them"""
+        return "\n".join(self.history_list[-HISTORY_VISIBLE_ROWS:])
@@ -0,0 +1,270 @@
+"""
+Applies one formula to the numeric columns of large data files, chunk by chunk.
+
+The formula uses the calculator's syntax (^, %, implied multiplication, sin,
+log, ...) with column names as variables, e.g. `(a-b)/b*100`. It is compiled
+once for NumExpr (multithreaded, no full-size temporaries) or, without it,
+NumPy, then evaluated on chunks of rows. Binary columns are memory-mapped and
+the pages of finished chunks are released; CSV is streamed. Results are
+written as they are computed, so memory stays bounded whatever the file size.
+Throughput and peak RSS are reported on stderr.
+
+    python column_evaluation.py "(a-b)/b*100" --column a=today.npy --column b=yesterday.npy -o change.npy
+    python column_evaluation.py "(a-b)/b*100" --column a=today.f64 --column b=yesterday.f64 -o change.f64
+    python column_evaluation.py "(close-open)/open*100" --csv prices.csv -o change.txt
+    python column_evaluation.py "(a-b)/b*100" --csv prices.csv --column a=close --column b=2 -o change.txt
+
+`--column NAME=FILE` maps a formula name to a 1-D .npy file or a raw binary
+file of --dtype. With --csv, `--column NAME=HEADER` maps it to a CSV column
+(header name or 0-based index) and unmapped names are looked up in the header.
+The output format follows the suffix: .npy, .txt / .csv (one value per line,
+also "-" for stdout) or else raw little-endian float64.
+"""
+import csv
+import mmap
+import sys
+from argparse import ArgumentParser
+from itertools import islice
+from time import perf_counter
+from constants import COLUMN_CHUNK_ROWS, COLUMN_CSV_CHUNK_ROWS
+from tabulation import FUNCTION_NAMES, IDENTIFIER_PATTERN, VariableExpressionError, parse_formula
+# ------------------------------------------------------------------------------
+
+BACKENDS = ("numexpr", "numpy")
+TEXT_SUFFIXES = (".txt", ".csv")
+
+
+class MappedColumn:
+    """A 1-D column of a .npy or raw binary file, memory-mapped read-only"""
+
+    def __init__(self, path: str, dtype: str, numpy):
+        self.file = open(path, "rb")
+        self.offset = 0
+        if path.endswith(".npy"):
+            version = numpy.lib.format.read_magic(self.file)
+            read_header = numpy.lib.format.read_array_header_1_0 if version == (1, 0) else numpy.lib.format.read_array_header_2_0
+            shape, fortran_order, file_dtype = read_header(self.file)
+            if len(shape) != 1 or file_dtype.hasobject:
+                raise SystemExit(f"{path}: expected a 1-D numeric array, got shape {shape} of {file_dtype}")
+            self.offset = self.file.tell()
+            self.dtype = file_dtype
+            self.rows = shape[0]
+        else:
+            self.dtype = numpy.dtype(dtype)
+            self.file.seek(0, 2)
+            self.rows = self.file.tell() // self.dtype.itemsize
+        # An empty file can't be mapped, it simply has no rows
+        self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.rows else None
+        self.values = (
+            numpy.frombuffer(self.mapping, self.dtype, self.rows, self.offset) if self.rows else numpy.empty(0, self.dtype)
+        )
+
+    def release(self, start: int, stop: int) -> None:
+        """Drops the pages of rows start..stop from memory, they won't be read again"""
+        if self.mapping is None or not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        begin = self.offset + start * self.dtype.itemsize
+        end = self.offset + stop * self.dtype.itemsize
+        # Only whole pages, the first and last ones may still hold rows of the neighbouring chunks
+        begin = -(-begin // mmap.PAGESIZE) * mmap.PAGESIZE
+        end = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > begin:
+            self.mapping.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+    @property
+    def size(self) -> int:
+        return self.rows * self.dtype.itemsize
+
+    def close(self) -> None:
+        self.values = None
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError:
+                # A chunk is still referenced, the mapping goes away with it
+                pass
+        self.file.close()
+
+
+def mapped_chunks(columns: dict, chunk_rows: int):
+    """Yields {name: array} chunks of memory-mapped columns"""
+    lengths = {column.rows for column in columns.values()}
+    if len(lengths) > 1:
+        raise SystemExit(f"the columns have different lengths: {sorted(lengths)}")
+    rows = lengths.pop()
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        yield {name: column.values[start:stop] for name, column in columns.items()}
+        # The chunk was evaluated and written by now
+        for column in columns.values():
+            column.release(start, stop)
+
+
+def csv_chunks(file, sources: dict, delimiter: str, chunk_rows: int, numpy, progress: list):
+    """
+    Yields {name: array} chunks of CSV columns, `sources` maps names to a header name or 0-based index.
+    Cells that aren't numbers are NaN. `progress[0]` counts the characters read.
+    """
+    header = next(csv.reader([file.readline()], delimiter=delimiter), [])
+    indices = []
+    for name, source in sources.items():
+        if source in header:
+            indices.append(header.index(source))
+        elif source.isdigit() and int(source) < len(header):
+            indices.append(int(source))
+        else:
+            raise SystemExit(f"column {source!r} (for {name}) not found in the CSV header")
+
+    while lines := list(islice(file, chunk_rows)):
+        progress[0] += sum(map(len, lines))
+        try:
+            table = numpy.loadtxt(lines, dtype=float, delimiter=delimiter, usecols=indices, ndmin=2, quotechar='"')
+        except ValueError:
+            # A cell that isn't a number (or a short row) somewhere in the chunk, parsed cell by cell instead
+            table = numpy.array([parse_cells(row, indices) for row in csv.reader(lines, delimiter=delimiter)], dtype=float)
+        yield {name: table[:, position] for position, name in enumerate(sources)}
+
+
+def parse_cells(row: list[str], indices: list[int]) -> list[float]:
+    values = []
+    for index in indices:
+        try:
+            values.append(float(row[index]))
+        except (IndexError, ValueError):
+            values.append(float("nan"))
+    return values
+
+
+class ResultWriter:
+    """Writes result chunks as .npy (row count known up front), text lines or raw float64"""
+
+    def __init__(self, path: str, rows: int | None, numpy):
+        if path.endswith(".npy") and rows is None:
+            raise SystemExit("a .npy output needs the row count up front, write CSV input to .txt or raw .f64")
+        self.written = 0
+        self.text = path == "-" or path.endswith(TEXT_SUFFIXES)
+        if path == "-":
+            self.file = sys.stdout
+        else:
+            self.file = open(path, "w") if self.text else open(path, "wb")
+        if path.endswith(".npy"):
+            header = {"descr": numpy.lib.format.dtype_to_descr(numpy.dtype("<f8")), "fortran_order": False, "shape": (rows,)}
+            numpy.lib.format.write_array_header_1_0(self.file, header)
+
+    def write(self, values) -> None:
+        if self.text:
+            self.file.write("\n".join(map(str, values.tolist())) + "\n" if len(values) else "")
+        else:
+            values.astype("<f8", copy=False).tofile(self.file)
+        self.written += len(values)
+
+    def close(self) -> None:
+        if self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def compile_formula(formula: str, backend: str):
+    """Returns the formula's column names (in order of appearance) and its vectorized callable"""
+    names = list(dict.fromkeys(name for name in IDENTIFIER_PATTERN.findall(formula) if name not in FUNCTION_NAMES))
+    if not names:
+        raise VariableExpressionError(f"{formula!r} uses no column")
+    symbols, parsed = parse_formula(formula, names)
+    from sympy import lambdify
+
+    return names, lambdify(symbols, parsed, modules=backend)
+
+
+def choose_backend(requested: str) -> str:
+    for backend in BACKENDS if requested == "auto" else (requested,):
+        try:
+            __import__(backend)
+        except ImportError:
+            continue
+        return backend
+    raise SystemExit(f"{requested if requested != 'auto' else 'NumPy'} is not installed (pip install numpy numexpr)")
+
+
+def peak_memory_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    maximum = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return maximum / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def main(arguments: list[str] | None = None) -> int:
+    parser = ArgumentParser(description="Evaluates a formula over the columns of large data files")
+    parser.add_argument("formula", help='e.g. "(a-b)/b*100", names are columns')
+    parser.add_argument("--column", action="append", default=[], metavar="NAME=SOURCE", help="file, or CSV column with --csv")
+    parser.add_argument("--csv", help="CSV file to stream the columns from, '-' for stdin")
+    parser.add_argument("--delimiter", default=",", help="CSV delimiter")
+    parser.add_argument("--dtype", default="float64", help="element type of raw binary files (default float64)")
+    parser.add_argument("-o", "--output", default="-", help="output file, the suffix picks the format")
+    parser.add_argument("--chunk-rows", type=int, help=f"rows evaluated at once (default {COLUMN_CHUNK_ROWS}, {COLUMN_CSV_CHUNK_ROWS} for CSV)")
+    parser.add_argument("--backend", choices=("auto", *BACKENDS), default="auto", help="default: NumExpr if installed")
+    options = parser.parse_args(arguments)
+
+    backend = choose_backend(options.backend)
+    import numpy
+
+    try:
+        names, function = compile_formula(options.formula, backend)
+    except VariableExpressionError as error:
+        raise SystemExit(str(error))
+    sources = dict(column.partition("=")[::2] for column in options.column)
+    for name in names:
+        if name not in sources:
+            if options.csv is None:
+                raise SystemExit(f"no --column {name}=FILE for {name!r}")
+            sources[name] = name
+    sources = {name: sources[name] for name in names}
+
+    started = perf_counter()
+    progress = [0]
+    if options.csv is not None:
+        source = sys.stdin if options.csv == "-" else open(options.csv, newline="")
+        columns = {}
+        chunks = csv_chunks(source, sources, options.delimiter, options.chunk_rows or COLUMN_CSV_CHUNK_ROWS, numpy, progress)
+        rows = None
+    else:
+        source = None
+        columns = {name: MappedColumn(path, options.dtype, numpy) for name, path in sources.items()}
+        chunks = mapped_chunks(columns, options.chunk_rows or COLUMN_CHUNK_ROWS)
+        rows = next(iter(columns.values())).rows
+
+    writer = ResultWriter(options.output, rows, numpy)
+    try:
+        with numpy.errstate(all="ignore"):
+            for chunk in chunks:
+                length = len(next(iter(chunk.values())))
+                # A formula that reduces to a constant gives a scalar
+                values = numpy.broadcast_to(numpy.asarray(function(*chunk.values()), dtype=float), (length,))
+                writer.write(values)
+    except BrokenPipeError:
+        return 1
+    finally:
+        writer.close()
+        for column in columns.values():
+            column.close()
+        if source not in (None, sys.stdin):
+            source.close()
+
+    elapsed = perf_counter() - started
+    read = sum(column.size for column in columns.values()) if columns else progress[0]
+    peak = peak_memory_mb()
+    print(
+        f"{writer.written} rows in {elapsed:.2f} s ({writer.written / elapsed if elapsed else 0:,.0f} rows/s, "
+        f"{read / 1e6 / elapsed if elapsed else 0:,.0f} MB/s read) with {backend}"
+        + (f", peak RSS {peak:.0f} MB" if peak is not None else ""),
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,5 @@
+from os.path import expanduser, join
+
 # Allowed key for input
 ALLOWED_KEYS = set("1234567890+-*/().%")
 
@@ -10,6 +12,16 @@ NUMPAD_OPERATIONS = {
     "Numpad Decimal": ".",
 }
 
+# Numpad keys and the key they stand for, numpad keys not listed here are ignored
+NUMPAD_KEYS = {
+    **NUMPAD_OPERATIONS,
+    **{f"Numpad {digit}": digit for digit in "0123456789"},
+    "Numpad Paren Left": "(",
+    "Numpad Paren Right": ")",
+    "Numpad Enter": "=",
+    "Numpad Equal": "=",
+}
+
 # Create a list of all valid operators, including those from the numpad.
 all_values_set = set(NUMPAD_OPERATIONS.values())
 all_values_set.discard(".")
@@ -79,3 +91,94 @@ BUTTON_LAYOUT = [
         ["=", "="],
     ],
 ]
+
+# Number of evaluated expressions kept by the calculate() result cache
+CALCULATION_CACHE_SIZE = 512
+
+# Significant digits of non-integer (and abbreviated integer) results, Ctrl+P cycles through them
+PRECISION_CHOICES = (5, 10, 20, 50)
+
+# Deadline-bounded sympy evaluation in worker processes (see evaluation_executor.py)
+EVALUATION_WORKERS = 1
+EVALUATION_TIMEOUT = 0.5  # seconds per evaluation
+EVALUATION_STARTUP_TIMEOUT = 10.0  # seconds a new worker may take to start
+EVALUATION_MEMORY_LIMIT = 512 * 1024 * 1024  # bytes a worker may grow by
+TOO_EXPENSIVE_RESULT = "Too expensive"
+
+# Backend every evaluation starts from (see evaluation_backends.py): "float", "rational" or "sympy",
+# None picks the cheapest one that supports each expression
+EVALUATION_BACKEND = None
+
+# Live preview evaluated off the event loop once typing pauses (see async_preview.py)
+ASYNC_PREVIEW = True
+PREVIEW_DEBOUNCE = 0.03  # seconds without a keystroke before the preview is evaluated
+
+# Provisional preview of incomplete expressions (see incremental_preview.py), the cost is bounded per keystroke
+SPECULATIVE_PREVIEW = True
+SPECULATION_MAX_LOOKBACK = 16  # trailing operators / open parentheses skipped to reach the last complete operand
+SPECULATION_MAX_GROUPS = 32  # open parentheses closed automatically, more deeply nested input isn't speculated on
+
+# Calculation history kept in a ring buffer (see history_buffer.py)
+HISTORY_CAPACITY = 1000  # entries kept, the oldest are dropped first
+HISTORY_VISIBLE_ROWS = 5  # entries shown (and rendered) at once
+
+# Undo / redo of the expression, result and history with Ctrl+Z / Ctrl+Y (see undo_history.py)
+UNDO_MEMORY_LIMIT = 4 * 1024 * 1024  # bytes of undo / redo steps kept, the oldest steps are dropped first
+
+# Persistent append-only history (see history_log.py)
+HISTORY_LOG_PATH = join(expanduser("~"), ".flet_calculator", "history.log")
+HISTORY_LOG_SYNC_EVERY = 16  # entries written between two fsyncs
+HISTORY_LOG_SYNC_INTERVAL = 2.0  # seconds, an append after this long always fsyncs
+HISTORY_SEARCH_LIMIT = 50  # entries returned by a history search
+HISTORY_SEARCH_CACHE_SIZE = 32  # recent searches kept in memory
+
+# Keys arriving within one frame are applied (evaluated and rendered) together (see input_batching.py)
+INPUT_BATCHING = True
+INPUT_FRAME = 1 / 60  # seconds
+
+# Counts the update messages / bytes sent to the Flet client (see control_updates.py), for benchmarks.updates.
+# Relies on flet internals, so it is only imported when enabled
+UPDATE_METER = False
+
+# Opt-in stage timing (see instrumentation.py), enabled with --instrument or CALCULATOR_INSTRUMENTATION=1
+INSTRUMENTATION_WINDOW = 1000  # latest samples kept per stage
+INSTRUMENTATION_SLOW_THRESHOLD = 0.05  # seconds, slower calculations are listed with their expression
+INSTRUMENTATION_SLOW_EXPRESSIONS = 20  # slow calculations kept
+INSTRUMENTATION_OVERLAY_INTERVAL = 0.5  # seconds between two refreshes of the debug overlay
+INSTRUMENTATION_EXPORT_PATH = join(expanduser("~"), ".flet_calculator", "instrumentation.json")
+
+# Opt-in keystroke recording (see session_recorder.py), enabled with --record or CALCULATOR_RECORD=1
+RECORDING_DIRECTORY = join(expanduser("~"), ".flet_calculator", "sessions")  # one gzipped file per session
+
+# Headless batch evaluation (see batch_calculate.py)
+BATCH_CHUNK_SIZE = 1000  # expressions sent to a worker at once
+BATCH_CHUNKS_IN_FLIGHT_PER_WORKER = 2  # chunks read ahead per worker, bounds the memory use
+
+# Local HTTP/JSON evaluation service (see calculator_service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_DEADLINE = 1.0  # seconds a request may take when it doesn't ask for a deadline
+SERVICE_MAX_DEADLINE = 10.0  # seconds, longer requested deadlines are capped
+SERVICE_THREADS_PER_WORKER = 2  # calculate() threads per sympy worker, so cheap expressions don't queue behind slow ones
+SERVICE_MAX_BATCH = 1000  # expressions per batch request
+SERVICE_MAX_BODY = 1024 * 1024  # bytes per request body
+
+# Multi-session web deployment, `python main.py --server` (see server_mode.py)
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8550
+SERVER_EVALUATION_WORKERS = None  # sympy worker processes shared by every session, None uses the core count
+SERVER_PREVIEW_THREADS = 4  # threads evaluating the live previews of every session
+SERVER_CALCULATION_CACHE_SIZE = 16384  # calculate() results shared across sessions
+SERVER_HISTORY_CAPACITY = 50  # in-memory history entries per session, nothing is written to the history log
+
+# Variable mode, expressions in x tabulated over a range (see tabulation.py)
+TABULATION_POINTS = 1_000_000
+TABULATION_RANGE = (-10.0, 10.0)
+TABULATION_TABLE_ROWS = 11  # evenly spaced rows of the summarized table
+TABULATION_MAX_ROOTS = 10  # roots listed, the others are only counted
+TABULATION_CACHE_SIZE = 64  # compiled expressions kept
+TABULATION_TIMEOUT = 5.0  # seconds a tabulation may take in a sympy worker process
+
+# Formula evaluation over data file columns (see column_evaluation.py)
+COLUMN_CHUNK_ROWS = 1 << 20  # rows of memory-mapped columns evaluated (and kept in memory) at once
+COLUMN_CSV_CHUNK_ROWS = 1 << 16  # rows of CSV parsed at once, its text takes far more memory than the values
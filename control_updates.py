@@ -0,0 +1,121 @@
+from json import dumps
+from threading import Lock
+# ------------------------------------------------------------------------------
+# Targeted control updates.
+#
+# `Control.update()` on the whole calculator walks the display and all the
+# buttons to find what changed. ChangeTracker remembers the last pushed state
+# of the few controls a keystroke can change, so only those whose state really
+# changed are sent, and nothing is sent at all for keys that change nothing.
+# UpdateMeter counts what those updates send to the Flet client, it reaches
+# into flet's private connection and protocol modules, so flet_core is only
+# imported when a meter is attached (constants.UPDATE_METER).
+# ------------------------------------------------------------------------------
+
+
+class ChangeTracker:
+    """Remembers the last pushed state of a fixed set of controls"""
+
+    def __init__(self, controls, attributes: tuple[str, ...] = ("value", "visible")):
+        self.controls = list(controls)
+        self.attributes = attributes
+        self.lock = Lock()
+        self.pushed = [self.state(control) for control in self.controls]
+
+    def state(self, control) -> tuple:
+        return tuple(getattr(control, attribute) for attribute in self.attributes)
+
+    def changed(self) -> list:
+        """Returns the controls whose state differs from the last pushed one, and records it as pushed"""
+        changed = []
+        for index, control in enumerate(self.controls):
+            state = self.state(control)
+            if state != self.pushed[index]:
+                self.pushed[index] = state
+                changed.append(control)
+        return changed
+
+    def push(self, page) -> int:
+        """Sends the changed controls in one update, returns how many there were"""
+        # The keyboard handler and the asynchronous preview push from different threads
+        with self.lock:
+            changed = self.changed()
+            if changed:
+                page.update(*changed)
+        return len(changed)
+
+
+class UpdateMeter:
+    """
+    Counts the update messages a page sends to the Flet client and their size
+    (JSON-encoded commands, like the desktop and web connections send them),
+    in total and for the latest keystroke.
+    """
+
+    def __init__(self):
+        # flet's JSON encoder for page commands, imported by `attach`
+        self.encoder = None
+        self.keystrokes = 0
+        self.messages = 0
+        self.bytes = 0
+        self.keystroke_messages = 0
+        self.keystroke_bytes = 0
+
+    def attach(self, page) -> bool:
+        """Starts counting the updates of `page`, returns False if its connection isn't reachable"""
+        try:
+            from flet_core.protocol import CommandEncoder
+        except ImportError:
+            # Another flet layout than the one this was written against (see requirements.txt)
+            return False
+        self.encoder = CommandEncoder
+        # Flet doesn't expose the page's connection, send_commands is wrapped once per connection
+        connection = getattr(page, "_Page__conn", None)
+        if connection is None:
+            return False
+        meters = getattr(connection, "update_meters", None)
+        if meters is None:
+            meters = connection.update_meters = {}
+            send_commands = connection.send_commands
+
+            def metered_send_commands(session_id, commands):
+                meter = meters.get(session_id)
+                if meter is not None:
+                    meter.record(commands)
+                return send_commands(session_id, commands)
+
+            connection.send_commands = metered_send_commands
+        meters[page._session_id] = self
+        return True
+
+    def detach(self, page) -> None:
+        meters = getattr(getattr(page, "_Page__conn", None), "update_meters", None)
+        if meters is not None:
+            meters.pop(page._session_id, None)
+
+    def record(self, commands: list) -> None:
+        if not commands:
+            return
+        size = len(dumps(commands, cls=self.encoder, separators=(",", ":")))
+        self.messages += 1
+        self.bytes += size
+        self.keystroke_messages += 1
+        self.keystroke_bytes += size
+
+    def start_keystroke(self) -> None:
+        """Starts a new per-keystroke count (an asynchronous preview counts towards its keystroke)"""
+        self.keystrokes += 1
+        self.keystroke_messages = 0
+        self.keystroke_bytes = 0
+
+    def stats(self) -> dict:
+        keystrokes = self.keystrokes or 1
+        return {
+            "keystrokes": self.keystrokes,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "last_keystroke_messages": self.keystroke_messages,
+            "last_keystroke_bytes": self.keystroke_bytes,
+            "messages_per_keystroke": self.messages / keystrokes,
+            "bytes_per_keystroke": self.bytes / keystrokes,
+        }
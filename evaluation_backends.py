@@ -0,0 +1,209 @@
+from re import compile as re_compile
+from threading import Lock
+from time import perf_counter
+from constants import EVALUATION_BACKEND
+from fast_arithmetic import ArithmeticSyntaxError, UnsupportedExpression, evaluate_arithmetic, evaluate_float
+from instrumentation import LatencyHistogram
+# ------------------------------------------------------------------------------
+# Evaluation backends, picked per expression by cost.
+#
+# Every backend declares what it costs and which expression features it
+# can't handle. `classify` finds the features of an expression with a few
+# substring checks and one regex search, and `evaluate` tries the cheapest
+# backend that handles all of them. A backend that can't reproduce sympy's
+# result for a given value raises UnsupportedExpression and the next one is
+# tried, so every backend returns exactly what sympy would:
+#
+#     float      decimal literals with + - * / only, plain float operations
+#     rational   the exact int / Fraction path of fast_arithmetic.py
+#     sympy      everything, registered by handle_keyboard_helpers.py
+#
+# Pinning a backend (EVALUATION_BACKEND, set_pinned_backend) skips the ones
+# cheaper than it. Each backend counts its evaluations, fallbacks (also per
+# feature, to see what to teach the cheap backends next) and latency.
+# ------------------------------------------------------------------------------
+
+# Integer literal, i.e. digits with no decimal point before or after them
+INTEGER_LITERAL_PATTERN = re_compile(r"(?<![\d.])\d+(?![\d.])")
+SYMBOL_PATTERN = re_compile(r"[A-Za-z_]")
+
+
+class EvaluationBackend:
+    """
+    One way of evaluating a normalized expression. `evaluate` returns the formatted result, None if
+    the expression can never be parsed, or raises UnsupportedExpression to pass it to the next backend.
+    """
+
+    def __init__(self, name: str, cost: int, evaluate, unsupported_features=frozenset()):
+        self.name = name
+        # Relative cost of one evaluation, backends are tried from the cheapest
+        self.cost = cost
+        self.evaluate = evaluate
+        self.unsupported_features = frozenset(unsupported_features)
+        self.chosen = 0
+        self.evaluations = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.fallback_features = {}
+        self.latency = LatencyHistogram()
+        self.lock = Lock()
+
+    def supports(self, features: frozenset) -> bool:
+        return self.unsupported_features.isdisjoint(features)
+
+    def record(self, seconds: float, outcome: str, features: frozenset, chosen: bool) -> None:
+        with self.lock:
+            self.chosen += chosen
+            self.latency.add(seconds)
+            if outcome == "fallback":
+                self.fallbacks += 1
+                for feature in features:
+                    self.fallback_features[feature] = self.fallback_features.get(feature, 0) + 1
+            elif outcome == "error":
+                self.errors += 1
+            else:
+                self.evaluations += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "cost": self.cost,
+                "chosen": self.chosen,
+                "evaluations": self.evaluations,
+                "fallbacks": self.fallbacks,
+                "fallback_features": dict(sorted(self.fallback_features.items())),
+                "errors": self.errors,
+                "latency": self.latency.summary(),
+            }
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.chosen = self.evaluations = self.fallbacks = self.errors = 0
+            self.fallback_features.clear()
+            self.latency = LatencyHistogram()
+
+
+# Registered backends, cheapest first (see register_backend)
+backends = []
+
+# Name of the backend dispatch starts from, None picks the cheapest per expression (see set_pinned_backend)
+pinned_backend = EVALUATION_BACKEND
+
+# Backends tried for each set of features seen, dropped whenever the backends or the pin change
+candidates_by_features = {}
+
+
+def classify(processed_expression: str) -> frozenset:
+    """The features of a normalized expression that backends may not support"""
+    features = []
+    if "." in processed_expression:
+        features.append("decimal")
+    if INTEGER_LITERAL_PATTERN.search(processed_expression):
+        features.append("integer")
+    if "**" in processed_expression or "^" in processed_expression:
+        features.append("power")
+    if "//" in processed_expression:
+        features.append("floor_division")
+    if "%" in processed_expression:
+        features.append("modulo")
+    if SYMBOL_PATTERN.search(processed_expression):
+        features.append("symbols")
+    return frozenset(features)
+
+
+def candidate_backends(features: frozenset) -> list[EvaluationBackend]:
+    """The backends that handle `features`, in the order they are tried"""
+    candidates = candidates_by_features.get(features)
+    if candidates is None:
+        candidates = [backend for backend in backends if backend.supports(features)]
+        if pinned_backend is not None:
+            pinned_cost = next(backend.cost for backend in backends if backend.name == pinned_backend)
+            candidates = [backend for backend in candidates if backend.cost >= pinned_cost]
+        candidates_by_features[features] = candidates
+    return candidates
+
+
+def evaluate(processed_expression: str, timer=None) -> str | None:
+    """
+    Evaluates with the cheapest backend that supports the expression, falling back to the next ones.
+    Stages are timed into `timer` (an Instrumentation) under the backends' names when given.
+    """
+    features = classify(processed_expression)
+    candidates = candidate_backends(features)
+    chosen = True
+    for backend in candidates:
+        # Anything but a result or a fallback (e.g. EvaluationBusy) is an error, left to calculate
+        outcome = "error"
+        started = perf_counter()
+        try:
+            result = backend.evaluate(processed_expression)
+            outcome = "evaluation"
+        except UnsupportedExpression:
+            outcome = "fallback"
+        finally:
+            seconds = perf_counter() - started
+            backend.record(seconds, outcome, features, chosen)
+            if timer is not None:
+                timer.record(backend.name, seconds)
+        if outcome == "evaluation":
+            return result
+        chosen = False
+    raise UnsupportedExpression(processed_expression)
+
+
+def register_backend(backend: EvaluationBackend) -> None:
+    """Adds a backend (replacing one with the same name), keeping them sorted by cost"""
+    backends[:] = sorted([*(other for other in backends if other.name != backend.name), backend], key=lambda other: other.cost)
+    candidates_by_features.clear()
+
+
+def set_pinned_backend(name: str | None) -> None:
+    """Starts dispatch at the backend called `name`: cheaper ones are skipped, costlier ones still take fallbacks"""
+    global pinned_backend
+    if name is not None and all(backend.name != name for backend in backends):
+        raise ValueError(f"unknown evaluation backend {name!r}, expected one of {backend_names()}")
+    pinned_backend = name
+    candidates_by_features.clear()
+
+
+def get_pinned_backend() -> str | None:
+    return pinned_backend
+
+
+def backend_names() -> list[str]:
+    return [backend.name for backend in backends]
+
+
+def get_backend_stats() -> dict:
+    """Per-backend dispatch, fallback and latency counters"""
+    return {"pinned": pinned_backend, "backends": {backend.name: backend.stats() for backend in backends}}
+
+
+def reset_backend_stats() -> None:
+    for backend in backends:
+        backend.reset_stats()
+
+
+def evaluate_with_floats(processed_expression: str) -> str | None:
+    try:
+        return evaluate_float(processed_expression)
+    except ArithmeticSyntaxError:
+        return None
+
+
+def evaluate_with_rationals(processed_expression: str) -> str | None:
+    try:
+        return evaluate_arithmetic(processed_expression)
+    except ArithmeticSyntaxError:
+        return None
+
+
+register_backend(
+    EvaluationBackend(
+        "float",
+        1,
+        evaluate_with_floats,
+        unsupported_features=("integer", "power", "floor_division", "modulo", "symbols"),
+    )
+)
+register_backend(EvaluationBackend("rational", 2, evaluate_with_rationals, unsupported_features=("symbols",)))
@@ -0,0 +1,191 @@
+import multiprocessing
+from queue import Empty, Queue
+from threading import Lock
+from time import monotonic
+from constants import EVALUATION_MEMORY_LIMIT, EVALUATION_STARTUP_TIMEOUT, EVALUATION_TIMEOUT, EVALUATION_WORKERS
+# ------------------------------------------------------------------------------
+# Deadline-bounded sympy evaluation in worker processes.
+#
+# sympify + simplify can run for minutes (or exhaust memory) on input such as
+# 9^9^9. The executor sends those evaluations to a small pool of reusable
+# worker processes and waits at most a deadline for the answer; a worker that
+# misses it (or runs out of memory) is killed and replaced by a fresh one.
+# Other sympy work, such as compiling and tabulating an expression in x, goes
+# through the same workers with `run`.
+# ------------------------------------------------------------------------------
+
+
+class EvaluationTimeout(Exception):
+    """Raised when an evaluation missed its deadline or ran out of memory"""
+
+
+class EvaluationBusy(Exception):
+    """Raised when no worker became free before the deadline"""
+
+
+def limit_memory(memory_limit: int) -> None:
+    """Caps the worker's address space growth where the platform supports it"""
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return
+    try:
+        with open("/proc/self/statm") as statm:
+            current_size = int(statm.read().split()[0]) * resource.getpagesize()
+    except OSError:
+        # No cheap way to read the current size (e.g. macOS, which doesn't enforce RLIMIT_AS anyway)
+        return
+    limit = current_size + memory_limit
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_worker(connection, memory_limit: int) -> None:
+    """Worker process loop: receives (function, arguments) and sends back ("result" | "error" | "too_expensive", value)"""
+    # Loaded before reporting ready, so no evaluation deadline is spent importing sympy
+    import sympy
+
+    if memory_limit:
+        limit_memory(memory_limit)
+    connection.send(("ready", None))
+
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        try:
+            function, arguments = request
+            reply = ("result", function(*arguments))
+        except MemoryError:
+            reply = ("too_expensive", None)
+        except Exception as error:
+            reply = ("error", error)
+        try:
+            connection.send(reply)
+        except Exception as error:
+            # e.g. an exception that can't be pickled
+            connection.send(("error", RuntimeError(repr(error))))
+
+
+class Worker:
+    """One worker process and the parent's end of its pipe"""
+
+    def __init__(self, context, memory_limit: int):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(child_connection, memory_limit), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        if not self.ready and self.connection.poll(timeout):
+            self.connection.recv()
+            self.ready = True
+        return self.ready
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(1)
+        self.connection.close()
+
+
+class EvaluationExecutor:
+    """Pool of reusable worker processes evaluating expressions with sympy under a per-call deadline"""
+
+    def __init__(
+        self,
+        workers: int = EVALUATION_WORKERS,
+        timeout: float = EVALUATION_TIMEOUT,
+        memory_limit: int = EVALUATION_MEMORY_LIMIT,
+        startup_timeout: float = EVALUATION_STARTUP_TIMEOUT,
+    ):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.startup_timeout = startup_timeout
+        self.context = multiprocessing.get_context()
+        self.idle_workers = Queue()
+        self.all_workers = set()
+        self.lock = Lock()
+        self.closed = False
+        self.timeouts = 0
+        self.respawns = 0
+        for _ in range(workers):
+            self.idle_workers.put(self.spawn())
+
+    def spawn(self) -> Worker:
+        worker = Worker(self.context, self.memory_limit)
+        with self.lock:
+            self.all_workers.add(worker)
+        return worker
+
+    def replace(self, worker: Worker) -> None:
+        """Kills a stuck or broken worker and puts a fresh one in the pool"""
+        with self.lock:
+            self.all_workers.discard(worker)
+            self.respawns += 1
+        worker.kill()
+        if not self.closed:
+            self.idle_workers.put(self.spawn())
+
+    def evaluate(self, processed_expression: str, timeout: float | None = None, digits: int | None = None) -> str | None:
+        """
+        Evaluates with sympy in a worker, like evaluate_with_sympy (`digits` defaults to the worker's, i.e. 5).
+        Raises EvaluationTimeout when the deadline is missed and EvaluationBusy when every worker is taken.
+        """
+        from handle_keyboard_helpers import evaluate_with_sympy
+
+        return self.run(evaluate_with_sympy, (processed_expression, digits), timeout)
+
+    def run(self, function, arguments: tuple, timeout: float | None = None):
+        """
+        Calls a module-level function in a worker and returns its result, re-raising its exceptions.
+        Raises EvaluationTimeout when the deadline is missed and EvaluationBusy when every worker is taken.
+        """
+        budget = self.timeout if timeout is None else timeout
+        deadline = monotonic() + budget
+        try:
+            worker = self.idle_workers.get(timeout=budget)
+        except Empty:
+            raise EvaluationBusy(*arguments[:1])
+
+        try:
+            if not worker.ready:
+                # A freshly spawned worker gets extra time to start up, that isn't the expression's fault
+                if not worker.wait_until_ready(self.startup_timeout):
+                    raise EvaluationTimeout(*arguments[:1])
+                deadline = monotonic() + budget
+            worker.connection.send((function, arguments))
+            if not worker.connection.poll(max(0.0, deadline - monotonic())):
+                raise EvaluationTimeout(*arguments[:1])
+            kind, value = worker.connection.recv()
+        except (EvaluationTimeout, EOFError, OSError):
+            # Missed the deadline or the worker died (e.g. killed by the OS for using too much memory)
+            self.timeouts += 1
+            self.replace(worker)
+            raise EvaluationTimeout(*arguments[:1])
+
+        if kind == "too_expensive":
+            self.timeouts += 1
+            # A worker that hit its memory limit may be left in a bad state
+            self.replace(worker)
+            raise EvaluationTimeout(*arguments[:1])
+
+        self.idle_workers.put(worker)
+        if kind == "error":
+            raise value
+        return value
+
+    def stats(self) -> dict:
+        return {"workers": len(self.all_workers), "timeouts": self.timeouts, "respawns": self.respawns}
+
+    def shutdown(self) -> None:
+        """Stops every worker process"""
+        self.closed = True
+        with self.lock:
+            workers = list(self.all_workers)
+            self.all_workers.clear()
+        for worker in workers:
+            worker.kill()
@@ -0,0 +1,170 @@
+from re import compile as re_compile
+# ------------------------------------------------------------------------------
+
+NUMBER_CHARACTERS = set("0123456789.")
+# Splits loaded text (e.g. a result such as 1.0000e-5) into the same tokens typing would produce
+LOAD_TOKEN_PATTERN = re_compile(r"[\w.]+e[+-]\d+|[\w.]+|.")
+LEADING_ZEROS_PATTERN = re_compile(r"\b0+(?=\d)")
+
+
+class ExpressionBuffer:
+    """
+    Expression being typed, stored as tokens: numbers, operators and parentheses.
+
+    Appending and backspacing only touch the last token, leading zeros are
+    normalized inside the affected number only and the parenthesis balance
+    is kept up to date on every edit. `str()` renders the text shown in the UI.
+    """
+
+    __slots__ = ("tokens", "length", "open_parentheses", "number_indexes", "rendered")
+
+    def __init__(self, text: str = ""):
+        self.load(text)
+
+    def __str__(self) -> str:
+        if self.rendered is None:
+            self.rendered = "".join(self.tokens)
+        return self.rendered
+
+    def __repr__(self) -> str:
+        return f"ExpressionBuffer({str(self)!r})"
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __bool__(self) -> bool:
+        return self.length > 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ExpressionBuffer):
+            return self.tokens == other.tokens
+        if isinstance(other, str):
+            return str(self) == other
+        return NotImplemented
+
+    def __getitem__(self, index: int) -> str:
+        """Character access, O(1) at either end of the expression"""
+        if not isinstance(index, int):
+            raise TypeError("ExpressionBuffer only supports integer indexes")
+        if index == -1 and self.tokens:
+            return self.tokens[-1][-1]
+        if index == 0 and self.tokens:
+            return self.tokens[0][0]
+        return str(self)[index]
+
+    @property
+    def is_balanced(self) -> bool:
+        """True when every "(" has a matching ")" (by count, like calculate checks)"""
+        return self.open_parentheses == 0
+
+    def load(self, text: str) -> None:
+        """Replaces the content with `text`, e.g. a calculated result"""
+        self.tokens = LOAD_TOKEN_PATTERN.findall(text)
+        self.length = len(text)
+        self.open_parentheses = text.count("(") - text.count(")")
+        # Indexes of the tokens holding digits, the last one is where leading zeros can appear
+        self.number_indexes = [index for index, token in enumerate(self.tokens) if has_digit(token)]
+        self.rendered = text
+
+    def clear(self) -> None:
+        self.tokens = []
+        self.length = 0
+        self.open_parentheses = 0
+        self.number_indexes = []
+        self.rendered = ""
+
+    def append(self, char: str) -> None:
+        """Appends one typed character, stripping leading zeros like update_expression"""
+        if char.isdigit():
+            self.normalize_last_number()
+
+        if char in NUMBER_CHARACTERS and self.tokens and is_word_character(self.tokens[-1][-1]):
+            had_digit = has_digit(self.tokens[-1])
+            self.tokens[-1] += char
+        else:
+            had_digit = False
+            self.tokens.append(char)
+
+        if char.isdigit() and not had_digit:
+            self.number_indexes.append(len(self.tokens) - 1)
+        elif char == "(":
+            self.open_parentheses += 1
+        elif char == ")":
+            self.open_parentheses -= 1
+        self.length += 1
+        self.rendered = None
+
+    def backspace(self) -> None:
+        """Removes the last character"""
+        if not self.tokens:
+            return
+        last_token = self.tokens[-1]
+        char = last_token[-1]
+        if len(last_token) > 1:
+            self.tokens[-1] = last_token = last_token[:-1]
+        else:
+            self.tokens.pop()
+            last_token = ""
+
+        if char == "(":
+            self.open_parentheses -= 1
+        elif char == ")":
+            self.open_parentheses += 1
+        elif char.isdigit() and not has_digit(last_token):
+            self.number_indexes.pop()
+        self.length -= 1
+        self.rendered = None
+
+    def replace_tail(self, keep: int, text: str) -> None:
+        """
+        Keeps the first `keep` characters and appends `text` after them, e.g. to undo an edit.
+        Only the tokens past `keep` are touched, so the cost doesn't depend on the expression's length.
+        """
+        head = ""
+        while self.length > keep:
+            token = self.pop_token()
+            if self.length < keep:
+                # The token straddles `keep`, its first characters stay
+                head = token[:keep - self.length]
+        text = head + text
+        if text and self.tokens and is_word_character(self.tokens[-1][-1]) and is_word_character(text[0]):
+            # Re-split with the token it continues, so a number is never split in two
+            text = self.pop_token() + text
+        for token in LOAD_TOKEN_PATTERN.findall(text):
+            self.push_token(token)
+        self.rendered = None
+
+    def pop_token(self) -> str:
+        token = self.tokens.pop()
+        if self.number_indexes and self.number_indexes[-1] == len(self.tokens):
+            self.number_indexes.pop()
+        self.open_parentheses -= token.count("(") - token.count(")")
+        self.length -= len(token)
+        return token
+
+    def push_token(self, token: str) -> None:
+        if has_digit(token):
+            self.number_indexes.append(len(self.tokens))
+        self.tokens.append(token)
+        self.open_parentheses += token.count("(") - token.count(")")
+        self.length += len(token)
+
+    def normalize_last_number(self) -> None:
+        """Strips leading zeros from the number holding the last typed digit, e.g. 007 -> 7"""
+        if not self.number_indexes:
+            return
+        index = self.number_indexes[-1]
+        token = self.tokens[index]
+        normalized = LEADING_ZEROS_PATTERN.sub("", token)
+        if normalized != token:
+            self.tokens[index] = normalized
+            self.length -= len(token) - len(normalized)
+            self.rendered = None
+
+
+def has_digit(token: str) -> bool:
+    return any(char.isdigit() for char in token)
+
+
+def is_word_character(char: str) -> bool:
+    return char.isalnum() or char in "._"
@@ -0,0 +1,501 @@
+import decimal
+from fractions import Fraction
+from math import isfinite, log10
+from re import compile as re_compile
+from sys import float_info
+from result_cache import LRUCache
+# ------------------------------------------------------------------------------
+# Pure-arithmetic evaluator used in front of sympy by `calculate`.
+#
+# It mirrors what sympify + simplify produce for plain numbers: integers and
+# rationals stay exact (Fraction), decimal literals behave like sympy Floats
+# (53-bit, round to nearest) and results are formatted like `int(...)` or
+# `evalf(n)` at the precision set with set_result_digits (5 by default).
+# Anything outside that subset raises UnsupportedExpression so the caller can
+# fall back to sympy and keep the exact same output.
+#
+# Expressions made of decimal literals only can skip the exact arithmetic
+# altogether: evaluate_float applies float operations directly, which round
+# like sympy's 53-bit Floats (see evaluation_backends.py).
+#
+# Integers too long to read are formatted in scientific notation from their
+# leading bits, never converted to decimal in full: the int is kept and all
+# of its digits are only formatted on request (format_full_integer).
+# ------------------------------------------------------------------------------
+
+# Same precision sympy uses for `evalf(5)`: mpmath's dps_to_prec(5) bits, kept as a literal so
+# mpmath is only imported by the first non-integer result
+EVALF_DIGITS = 5
+EVALF_PREC = 20
+
+# Largest Float literal sympy still parses at the default 15 digit precision
+MAX_FLOAT_LITERAL_DIGITS = 15
+
+# Exact operands and results (numerators / denominators) longer than this many bits are left to sympy,
+# which evaluates them under the worker deadline, so the inline path is bounded for any expression
+MAX_EXACT_BITS = 1 << 18
+# Integer literals with more digits are longer than MAX_EXACT_BITS, they are rejected before being converted
+MAX_EXACT_DIGITS = int(MAX_EXACT_BITS * log10(2)) + 1
+
+# Integer results with more digits (Python's own int-to-str limit) are shown in scientific notation
+RESULT_MAX_INTEGER_DIGITS = 4300
+# Smallest such integer and its length in bits, most ints are told apart by their length alone
+LONG_INTEGER = 10 ** RESULT_MAX_INTEGER_DIGITS
+LONG_INTEGER_BITS = LONG_INTEGER.bit_length()
+# Integer results shown abbreviated that are kept, keyed by expression, for formatting all their digits
+LARGE_RESULTS_KEPT = 16
+# Below this many bits an int is converted to Decimal directly
+DECIMAL_CONVERSION_BITS = 128
+
+TOKEN_PATTERN = re_compile(r"(\d+\.?\d*|\.\d+|\*\*|//|[-+*/%^()])")
+BINARY_OPERATORS = set("+-*/%^")
+LEADING_INVALID_OPERATORS = set("*/%^")
+
+
+# Exact values are ints or Fractions, floats stand in for sympy Floats
+Value = int | Fraction | float
+
+# Significant digits of non-integer (and abbreviated integer) results, see set_result_digits
+result_digits = EVALF_DIGITS
+
+large_results = LRUCache(LARGE_RESULTS_KEPT)
+
+
+class UnsupportedExpression(Exception):
+    """Raised when an expression is outside what the fast path can evaluate exactly like sympy"""
+
+
+class ArithmeticSyntaxError(ValueError):
+    """Raised when an expression can never be parsed, so sympy would reject it as well"""
+
+
+def tokenize(expression: str) -> list[str]:
+    """Splits an expression into number, operator and parenthesis tokens"""
+    tokens = []
+    position = 0
+    length = len(expression)
+    while position < length:
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None:
+            raise UnsupportedExpression(expression)
+        token = match.group(1)
+        tokens.append("**" if token == "^" else token)
+        position = match.end()
+    return tokens
+
+
+def parse_number(token: str) -> Value:
+    """Converts a number token the same way sympy's auto_number transformation does"""
+    if "." not in token:
+        # Python (and therefore sympy) rejects leading zeros such as "0123"
+        if len(token) > 1 and token[0] == "0" and token.strip("0"):
+            raise UnsupportedExpression(token)
+        if len(token) > MAX_EXACT_DIGITS:
+            raise UnsupportedExpression(len(token))
+        return check_size(parse_integer(token))
+
+    if sum(char.isdigit() for char in token) > MAX_FLOAT_LITERAL_DIGITS:
+        raise UnsupportedExpression(token)
+    return check_float(float(token))
+
+
+def parse_integer(digits: str) -> int:
+    """
+    Converts a string of digits to an int, whatever its length. Python's str-to-int refuses more than
+    RESULT_MAX_INTEGER_DIGITS digits, longer strings are split in halves and combined.
+    """
+    if len(digits) <= RESULT_MAX_INTEGER_DIGITS:
+        return int(digits)
+    half = len(digits) >> 1
+    return parse_integer(digits[:-half]) * 10 ** half + parse_integer(digits[-half:])
+
+
+def check_float(value: float) -> float:
+    """Rejects floats where sympy's arbitrary-exponent Floats would behave differently"""
+    if value == 0 or not isfinite(value) or abs(value) < float_info.min:
+        raise UnsupportedExpression(value)
+    return value
+
+
+def to_float(value: Value) -> float:
+    """Rounds an exact value to the nearest 53-bit float like sympy's `_as_mpf_op`"""
+    if type(value) is float:
+        return value
+    try:
+        # int / int is correctly rounded, unlike float(numerator) / float(denominator)
+        if type(value) is int:
+            return check_float(value / 1)
+        return check_float(value.numerator / value.denominator)
+    except OverflowError:
+        raise UnsupportedExpression(value)
+
+
+def normalize(value: Fraction) -> Value:
+    """Keeps integral results as plain ints, which are much cheaper than Fractions"""
+    return check_size(value.numerator if value.denominator == 1 else value)
+
+
+def check_size(value: Value) -> Value:
+    """Rejects exact values longer than MAX_EXACT_BITS, the next operation on them could take arbitrarily long"""
+    if type(value) is int:
+        if value.bit_length() > MAX_EXACT_BITS:
+            raise UnsupportedExpression(value.bit_length())
+    elif type(value) is Fraction:
+        if max(value.numerator.bit_length(), value.denominator.bit_length()) > MAX_EXACT_BITS:
+            raise UnsupportedExpression(value.denominator.bit_length())
+    return value
+
+
+def add(left: Value, right: Value) -> Value:
+    if type(left) is not float and type(right) is not float:
+        return check_size(left + right) if type(left) is int and type(right) is int else normalize(left + right)
+    return check_float(to_float(left) + to_float(right))
+
+
+def subtract(left: Value, right: Value) -> Value:
+    if type(left) is not float and type(right) is not float:
+        return check_size(left - right) if type(left) is int and type(right) is int else normalize(left - right)
+    return check_float(to_float(left) - to_float(right))
+
+
+def multiply(left: Value, right: Value) -> Value:
+    if type(left) is not float and type(right) is not float:
+        return check_size(left * right) if type(left) is int and type(right) is int else normalize(left * right)
+    return check_float(to_float(left) * to_float(right))
+
+
+def divide(left: Value, right: Value) -> Value:
+    if right == 0:
+        # sympy turns these into zoo / nan or raises, leave it to sympy
+        raise UnsupportedExpression(right)
+    if type(left) is not float and type(right) is not float:
+        return normalize(Fraction(left) / right)
+    if type(left) is not float:
+        # sympy evaluates Rational / Float as Rational * (1 / Float)
+        return check_float(to_float(left) * check_float(1.0 / right))
+    return check_float(left / to_float(right))
+
+
+def modulo(left: Value, right: Value) -> Value:
+    if right == 0 or type(left) is float or type(right) is float:
+        raise UnsupportedExpression(right)
+    return check_size(left % right) if type(left) is int and type(right) is int else normalize(Fraction(left) % right)
+
+
+def floor_divide(left: Value, right: Value) -> int:
+    # Only Integer // Integer is a plain floor division in sympy, rationals go through floor()/divmod
+    if right == 0 or type(left) is not int or type(right) is not int:
+        raise UnsupportedExpression(right)
+    return left // right
+
+
+def power(base: Value, exponent: Value) -> Value:
+    if type(base) is float or type(exponent) is not int:
+        raise UnsupportedExpression(exponent)
+    if base == 0 and exponent < 0:
+        raise UnsupportedExpression(exponent)
+    base = Fraction(base)
+    base_bits = max(base.numerator.bit_length(), base.denominator.bit_length())
+    if base_bits * abs(exponent) > MAX_EXACT_BITS:
+        raise UnsupportedExpression(exponent)
+    return normalize(base ** exponent)
+
+
+BINARY_FUNCTIONS = {
+    "+": add,
+    "-": subtract,
+    "*": multiply,
+    "/": divide,
+    "%": modulo,
+    "//": floor_divide,
+}
+
+
+def float_add(left: float, right: float) -> float:
+    return check_float(left + right)
+
+
+def float_subtract(left: float, right: float) -> float:
+    return check_float(left - right)
+
+
+def float_multiply(left: float, right: float) -> float:
+    return check_float(left * right)
+
+
+def float_divide(left: float, right: float) -> float:
+    # check_float never lets a zero through, so right can't be one
+    return check_float(left / right)
+
+
+# Operations on floats only and their precedence, the other operators are left to the exact path
+FLOAT_FUNCTIONS = {
+    "+": float_add,
+    "-": float_subtract,
+    "*": float_multiply,
+    "/": float_divide,
+}
+FLOAT_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+
+class Parser:
+    """Recursive descent parser following Python's operator precedence, as sympify does"""
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def advance(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise UnsupportedExpression("unexpected end of expression")
+        self.position += 1
+        return token
+
+    def parse(self) -> Value:
+        value = self.parse_sum()
+        if self.peek() is not None:
+            raise UnsupportedExpression(self.peek())
+        return value
+
+    def parse_sum(self) -> Value:
+        value = self.parse_term()
+        while self.peek() in ("+", "-"):
+            operator = self.advance()
+            value = BINARY_FUNCTIONS[operator](value, self.parse_term())
+        return value
+
+    def parse_term(self) -> Value:
+        value = self.parse_factor()
+        while self.peek() in ("*", "/", "%", "//"):
+            operator = self.advance()
+            value = BINARY_FUNCTIONS[operator](value, self.parse_factor())
+        return value
+
+    def parse_factor(self) -> Value:
+        # Unary signs are counted in a loop so long runs like "--5" don't recurse
+        negate = False
+        while self.peek() in ("-", "+"):
+            negate ^= self.advance() == "-"
+        value = self.parse_power()
+        return -value if negate else value
+
+    def parse_power(self) -> Value:
+        base = self.parse_atom()
+        if self.peek() == "**":
+            self.advance()
+            # Exponentiation is right-associative and binds tighter than unary minus on its left only
+            return power(base, self.parse_factor())
+        return base
+
+    def parse_atom(self) -> Value:
+        token = self.advance()
+        if token == "(":
+            value = self.parse_sum()
+            if self.advance() != ")":
+                raise UnsupportedExpression("missing closing parenthesis")
+            return value
+        if token[0].isdigit() or token[0] == ".":
+            return parse_number(token)
+        raise UnsupportedExpression(token)
+
+
+def format_result(value: Value, digits: int | None = None) -> str:
+    """Formats a value like `calculate` does: integers with format_integer, others like `str(value.evalf(digits))`"""
+    if digits is None:
+        digits = result_digits
+    if type(value) is int:
+        return format_integer(value, digits)
+    from mpmath.libmp import dps_to_prec, from_float, from_rational, mpf_pos, round_nearest, to_str
+
+    prec = EVALF_PREC if digits == EVALF_DIGITS else dps_to_prec(digits)
+    if type(value) is Fraction:
+        # sympy's evalf_rational truncates at prec + 4 bits before rounding to prec
+        mpf = from_rational(value.numerator, value.denominator, prec + 4)
+    else:
+        mpf = from_float(value)
+
+    formatted = to_str(mpf_pos(mpf, prec, round_nearest), digits, strip_zeros=False)
+    if formatted.startswith("-.0"):
+        formatted = "-0." + formatted[3:]
+    elif formatted.startswith(".0"):
+        formatted = "0." + formatted[2:]
+    return formatted
+
+
+def format_integer(value: int, digits: int) -> str:
+    """
+    Formats an integer like `str(value)`, or with `digits` significant digits in scientific
+    notation (e.g. 9.9900e+30102) if it has more than RESULT_MAX_INTEGER_DIGITS digits
+    """
+    if not is_long_integer(value):
+        return str(value)
+    from mpmath.libmp import dps_to_prec, from_int, round_nearest, to_str
+
+    # Rounded to a few bits as it is converted (normalizing the whole mantissa first is slow), only those are formatted
+    return to_str(from_int(value, dps_to_prec(digits), round_nearest), digits, strip_zeros=False)
+
+
+def is_long_integer(value: int) -> bool:
+    """Checks if an integer has more than RESULT_MAX_INTEGER_DIGITS digits"""
+    bits = value.bit_length()
+    return bits > LONG_INTEGER_BITS or (bits == LONG_INTEGER_BITS and abs(value) >= LONG_INTEGER)
+
+
+def is_abbreviated(value: Value) -> bool:
+    """Checks if format_result shows the value in scientific notation instead of all its digits"""
+    return type(value) is int and is_long_integer(value)
+
+
+def format_full_integer(value: int) -> str:
+    """
+    All the digits of an integer, whatever its length. Python's int-to-str is quadratic (and capped
+    at 4300 digits), this splits the int in halves recursively and combines them with decimal's
+    fast multiplication instead: ~0.1 s for a million bits.
+    """
+    if not is_long_integer(value):
+        return str(value)
+    powers = {}
+
+    def power_of_two(exponent: int) -> decimal.Decimal:
+        result = powers.get(exponent)
+        if result is None:
+            if exponent <= DECIMAL_CONVERSION_BITS:
+                result = decimal.Decimal(1 << exponent)
+            else:
+                half = exponent >> 1
+                result = power_of_two(half) * power_of_two(exponent - half)
+            powers[exponent] = result
+        return result
+
+    def convert(number: int, bits: int) -> decimal.Decimal:
+        if bits <= DECIMAL_CONVERSION_BITS:
+            return decimal.Decimal(number)
+        half = bits >> 1
+        high = number >> half
+        low = number - (high << half)
+        return convert(high, bits - half) * power_of_two(half) + convert(low, half)
+
+    with decimal.localcontext() as context:
+        # Exact arithmetic on integers of any size
+        context.prec = decimal.MAX_PREC
+        context.Emax = decimal.MAX_EMAX
+        context.Emin = decimal.MIN_EMIN
+        context.traps[decimal.Inexact] = True
+        digits = convert(abs(value), value.bit_length())
+    return ("-" if value < 0 else "") + format(digits, "f")
+
+
+def check_syntax(processed_expression: str) -> None:
+    if processed_expression[-1] in BINARY_OPERATORS or processed_expression[0] in LEADING_INVALID_OPERATORS:
+        raise ArithmeticSyntaxError(processed_expression)
+
+
+def evaluate_exact(processed_expression: str) -> Value:
+    """
+    Evaluates a plain arithmetic expression to its exact value (an int, a Fraction or a float).
+    Raises like evaluate_arithmetic.
+    """
+    check_syntax(processed_expression)
+    try:
+        return Parser(tokenize(processed_expression)).parse()
+    except RecursionError:
+        # Very deeply nested input, let sympy decide what to do with it
+        raise UnsupportedExpression("expression nested too deeply")
+
+
+def set_result_digits(digits: int) -> None:
+    """Formats non-integer (and abbreviated integer) results with `digits` significant digits"""
+    global result_digits
+    if digits < 1:
+        raise ValueError("results need at least 1 significant digit")
+    result_digits = digits
+
+
+def get_result_digits() -> int:
+    return result_digits
+
+
+def evaluate_arithmetic(processed_expression: str) -> str:
+    """
+    Evaluates a plain arithmetic expression (after implied multiplication was made explicit)
+    and returns the result formatted exactly like the sympy path of `calculate`.
+
+    Raises ArithmeticSyntaxError for expressions sympy can never parse and
+    UnsupportedExpression for anything that has to go through sympy.
+    """
+    value = evaluate_exact(processed_expression)
+    if is_abbreviated(value):
+        large_results.put(processed_expression, value)
+    return format_result(value)
+
+
+def evaluate_float(processed_expression: str) -> str:
+    """
+    Evaluates an expression of decimal literals, + - * / and parentheses with float operations,
+    formatted like evaluate_arithmetic. Raises like evaluate_arithmetic, including for other operators.
+    """
+    check_syntax(processed_expression)
+    return format_result(evaluate_float_tokens(TOKEN_PATTERN.findall(processed_expression), processed_expression))
+
+
+def evaluate_float_tokens(tokens: list[str], expression: str) -> float:
+    """
+    Operator precedence evaluation with a value and an operator stack: the same operations in the
+    same order as Parser, without its recursion. A pending "(" is stacked as the sign of its group.
+    """
+    if sum(map(len, tokens)) != len(expression):
+        # Characters TOKEN_PATTERN skipped
+        raise UnsupportedExpression(expression)
+    values = []
+    operators = []
+    negate = False
+    expect_operand = True
+    for token in tokens:
+        if expect_operand:
+            if token == "-" or token == "+":
+                negate ^= token == "-"
+            elif token == "(":
+                operators.append(negate)
+                negate = False
+            elif "." in token:
+                # parse_number for a decimal literal, its only non-digit is the point
+                if len(token) > MAX_FLOAT_LITERAL_DIGITS + 1:
+                    raise UnsupportedExpression(token)
+                value = check_float(float(token))
+                values.append(-value if negate else value)
+                negate = False
+                expect_operand = False
+            else:
+                raise UnsupportedExpression(token)
+        elif token == ")":
+            while operators and operators[-1] in FLOAT_PRECEDENCE:
+                apply_float_operator(values, operators.pop())
+            if not operators:
+                raise UnsupportedExpression(token)
+            if operators.pop():
+                values[-1] = -values[-1]
+        else:
+            precedence = FLOAT_PRECEDENCE.get(token)
+            if precedence is None:
+                raise UnsupportedExpression(token)
+            while operators and FLOAT_PRECEDENCE.get(operators[-1], 0) >= precedence:
+                apply_float_operator(values, operators.pop())
+            operators.append(token)
+            expect_operand = True
+    if expect_operand:
+        raise UnsupportedExpression("unexpected end of expression")
+    while operators:
+        operator = operators.pop()
+        if operator not in FLOAT_PRECEDENCE:
+            raise UnsupportedExpression("missing closing parenthesis")
+        apply_float_operator(values, operator)
+    return values[0]
+
+
+def apply_float_operator(values: list[float], operator: str) -> None:
+    right = values.pop()
+    values[-1] = FLOAT_FUNCTIONS[operator](values[-1], right)
@@ -1,217 +1,556 @@
-from sympy import sympify, simplify, SympifyError, Number
-from constants import ALLOWED_KEYS, NUMPAD_OPERATIONS, ALL_OPERATORS, SHIFT_KEY_MAPPINGS
-from re import search, sub
-from flet import KeyboardEvent
-import timeit
+from constants import ALLOWED_KEYS, NUMPAD_KEYS, ALL_OPERATORS, SHIFT_KEY_MAPPINGS, TOO_EXPENSIVE_RESULT
+from fast_arithmetic import (
+    ArithmeticSyntaxError,
+    UnsupportedExpression,
+    evaluate_exact,
+    format_full_integer,
+    format_integer,
+    get_result_digits,
+    large_results,
+    set_result_digits,
+)
+from result_cache import LRUCache
+from expression_buffer import ExpressionBuffer
+from calculator_state import CalculatorState
+from evaluation_executor import EvaluationBusy, EvaluationTimeout
+from evaluation_backends import EvaluationBackend, register_backend, set_pinned_backend
+import evaluation_backends
+from undo_history import REDO_EVENT, UNDO_EVENT
+from re import compile as re_compile
 # ------------------------------------------------------------------------------
 
+INVALID_CHARACTER_PATTERN = re_compile(r"[^\d\(\)+\-*/.%^]")
+LEADING_ZEROS_PATTERN = re_compile(r"\b0+(?=\d)")
+IMPLIED_MULTIPLICATION_BEFORE_PATTERN = re_compile(r"(?<=[\d.)])\(")
+IMPLIED_MULTIPLICATION_AFTER_PATTERN = re_compile(r"\)(?=\d)")
+DOUBLE_STAR_PARENTHESIS_PATTERN = re_compile(r"\*\*\(")
 
-def prevent_initial_operator_input(input_key: str, current_expression: str) -> bool:
-    """Checks if the first input is empty and is either '*' or '/' in the current_expression object"""
-    return current_expression == "" and input_key in ("*", "/", "Numpad Multiply", "Numpad Divide")
+# Keys after which the result isn't the live preview ("=", clear and backspace set it themselves)
+NON_PREVIEW_KEYS = frozenset({"=", "Enter", "Clear", "C", "Backspace", "e"})
 
-def prevent_last_operator_input(current_expression: str) -> str:
-    """Checks if the current_expression object has a value and the last input is an operator in the current_expression object"""
-    return current_expression and current_expression[-1] in ALL_OPERATORS
+# Results of calculate() keyed on the normalized expression, failures are stored as None
+calculation_cache = LRUCache()
+CACHE_MISS = object()
 
+# When set, sympy runs in deadline-bounded worker processes instead of inline (see set_evaluation_executor)
+evaluation_executor = None
 
-def is_valid_input_key(input_key: str) -> bool:
-    """Checks if the input key is allowed"""
-    return input_key in ALLOWED_KEYS
+# When set, every calculation is also written to this persistent HistoryLog (see set_history_log)
+history_log = None
 
+# When set, pipeline stages are timed into this Instrumentation (see set_instrumentation)
+instrumentation = None
 
-def is_input_from_numpad(input_key: str) -> bool:
-    """Checks if the input is from the numpad"""
-    return isinstance(input_key, str) and input_key.startswith("Numpad")
 
+def prevent_initial_operator_input(input_key: str, current_expression: str) -> bool:
+    """Checks if the first input is empty and is either '*' or '/' in the current_expression object"""
+    return not current_expression and input_key in ("*", "/")
+
+def prevent_last_operator_input(current_expression: str) -> str:
+    """Checks if the current_expression object has a value and the last input is an operator in the current_expression object"""
+    return current_expression and current_expression[-1] in ALL_OPERATORS
 
-def process_numpad_input(input_key: str, current_expression: str):
-    """Handles numpad input"""
-    if input_key in NUMPAD_OPERATIONS:
-        return update_expression(NUMPAD_OPERATIONS[input_key], current_expression)
-    else:
-        return current_expression + input_key[-1]
 
-def calculate(current_expression: str) -> str:
-    """Validates the user's input, calculates the result using sympy, and returns it or the original expression on failure."""
+def calculate(current_expression: str, parentheses_balanced: bool | None = None) -> str:
+    """
+    Validates the user's input, calculates the result using sympy, and returns it or the original expression on failure.
+    Callers that already track the parenthesis balance (ExpressionBuffer) can pass it to skip counting.
+    """
     
+    # Stages are only timed when instrumentation is enabled, otherwise this costs one check per stage
+    timer = instrumentation
+    if timer is not None:
+        calculation_started = started = timer.now()
+
     # Strips whitespace and avoids processing if empty
     current_expression = current_expression.strip()
     if not current_expression:
         return current_expression
 
     # parentheses and invalid character validation
-    if current_expression.count("(") != current_expression.count(")") or search(r"[^\d\(\)+\-*/.%^]", current_expression):
+    if parentheses_balanced is None:
+        parentheses_balanced = current_expression.count("(") == current_expression.count(")")
+    invalid = not parentheses_balanced or INVALID_CHARACTER_PATTERN.search(current_expression)
+    if timer is not None:
+        started = timer.lap("validation", started)
+    if invalid:
         return current_expression
 
-    # Handle multiple outer parentheses and replace applicable opening parentheses with *(, if needed
-    # processed_expression = current_expression[0] + current_expression[1:].replace("(", "*(")
-    # Handle implied multiplication: 
+    # Handle implied multiplication:
     # - after a closing parenthesis ")"
     # - before an opening parenthesis "(" excluding at the start
-    processed_expression = ''
-    i = 0
-    while i < len(current_expression):
-        char = current_expression[i]
-        if char == '(' and i > 0 and (current_expression[i-1].isdigit() or current_expression[i-1] in '.)'):
-            processed_expression += '*('
-        elif char == ')' and i < len(current_expression) - 1 and current_expression[i+1].isdigit():
-            processed_expression += ')*'
+    processed_expression = insert_implied_multiplication(current_expression)
+    if timer is not None:
+        started = timer.lap("implied_multiplication", started)
+
+    # Repeated and backtracked expressions are served from the cache without any evaluation. Results are
+    # keyed on the precision too: another thread may change it while this one evaluates (see set_precision)
+    digits = get_result_digits()
+    cache_key = (digits, processed_expression)
+    result = calculation_cache.get(cache_key, CACHE_MISS)
+    if timer is not None:
+        timer.lap("cache_lookup", started)
+    if result is CACHE_MISS:
+        try:
+            result = evaluate_expression(processed_expression)
+        except EvaluationBusy:
+            # Every worker was taken, that says nothing about this expression so it isn't cached
+            result = TOO_EXPENSIVE_RESULT
         else:
-            processed_expression += char
-        i += 1
+            # Neither is a timeout: the worker may just have been slow, a later call evaluates it again.
+            # A result formatted after the precision changed mid-evaluation isn't cached under the old one
+            if result != TOO_EXPENSIVE_RESULT and get_result_digits() == digits:
+                calculation_cache.put(cache_key, result)
 
-        # Special handling to prevent multiplication between **) sequences from exponentiation and adjacent parentheses
-        if processed_expression.endswith("**("):
-            processed_expression = processed_expression[:-2] + "("
-    
+    if timer is not None:
+        # Calls that got past validation, slow ones are listed with their expression
+        timer.record_calculation(current_expression, calculation_started)
+    return current_expression if result is None else result
+
+
+def evaluate_expression(processed_expression: str) -> str | None:
+    """
+    Evaluates an already normalized expression, returns None if it can't be parsed.
+    Plain arithmetic is evaluated natively, sympy is only used for what the cheaper backends can't reproduce.
+    """
+    return evaluation_backends.evaluate(processed_expression, instrumentation)
+
+
+def evaluate_with_sympy_backend(processed_expression: str) -> str | None:
+    """The sympy backend, in the EvaluationExecutor's worker processes when one is set"""
+    if evaluation_executor is None:
+        return evaluate_with_sympy(processed_expression)
+    try:
+        return evaluation_executor.evaluate(processed_expression, digits=get_result_digits())
+    except EvaluationTimeout:
+        return TOO_EXPENSIVE_RESULT
+
+
+# Handles everything, the last backend tried (see evaluation_backends.py)
+register_backend(EvaluationBackend("sympy", 100, evaluate_with_sympy_backend))
+
+
+def evaluate_with_sympy(processed_expression: str, digits: int | None = None) -> str | None:
+    """
+    Evaluates with sympify + simplify, returns None if the expression can't be parsed.
+    Non-integer results get `digits` significant digits, the precision mode's by default.
+    """
+    # sympy takes a few hundred milliseconds to import, so it is only loaded when first needed (see warm_up_engines)
+    from sympy import sympify, simplify, SympifyError, Number
+
+    timer = instrumentation
+    if timer is not None:
+        started = timer.now()
     try:
         # parsing safety checks
         parsed_expression = sympify(processed_expression)
+        if timer is not None:
+            started = timer.lap("sympify", started)
         # Calculate the result
         simplified_expression = simplify(parsed_expression)
+        if timer is not None:
+            started = timer.lap("simplify", started)
 
         # Conditionally convert to float only when necessary
+        if digits is None:
+            digits = get_result_digits()
         if isinstance(simplified_expression, Number):
             if simplified_expression.is_integer:
-                result = int(simplified_expression)
+                # Long integers are abbreviated like the fast path does, not converted to decimal in full
+                result = format_integer(int(simplified_expression), digits)
             else:
-                result = simplified_expression.evalf(5)
+                result = str(simplified_expression.evalf(digits))
         else:
-            result = simplified_expression
+            result = str(simplified_expression)
+        if timer is not None:
+            timer.lap("formatting", started)
+        return result
+
+    except (SympifyError, RecursionError, TypeError, ValueError):
+        # Also input sympy fails on, e.g. integer literals past Python's 4300 digit conversion limit
+        # (ValueError or TypeError depending on where sympy's parser hits it)
+        return None
+
+
+def calculate_full(current_expression: str) -> str:
+    """
+    Like calculate, but an integer result shown abbreviated (e.g. 9.9900e+30102 for 2^100000) is
+    returned with all its digits. They are only formatted here, on request.
+    """
+    result = calculate(current_expression)
+    if "e+" not in result:
+        return result
+    processed_expression = insert_implied_multiplication(current_expression.strip())
+    # Kept as an int when it was abbreviated, otherwise evaluated again (a power is cheap next to formatting it)
+    value = large_results.get(processed_expression)
+    if value is None:
+        try:
+            value = evaluate_exact(processed_expression)
+        except (ArithmeticSyntaxError, UnsupportedExpression):
+            # Only sympy can evaluate it, its result stays abbreviated
+            return result
+    return format_full_integer(value) if type(value) is int else result
+
+
+def full_result_text(state: CalculatorState) -> str:
+    """The value shown, with every digit: the live preview's, or after "=" the calculated expression's"""
+    expression = str(state.expression)
+    if state.result:
+        return calculate_full(expression)
+    if state.history_list:
+        calculated, _, shown = state.history_list[-1].rpartition(" = ")
+        if shown == expression:
+            return calculate_full(calculated)
+    return expression
+
+
+def calculate_expression(current_expression: str | ExpressionBuffer) -> str:
+    """Calculates a plain string or an ExpressionBuffer, reusing the buffer's parenthesis balance"""
+    if isinstance(current_expression, ExpressionBuffer):
+        return calculate(str(current_expression), current_expression.is_balanced)
+    return calculate(current_expression)
+
+
+def remove_last_character(current_expression: str | ExpressionBuffer) -> str | ExpressionBuffer:
+    """Drops the last character, in place for an ExpressionBuffer"""
+    if isinstance(current_expression, ExpressionBuffer):
+        current_expression.backspace()
+        return current_expression
+    return current_expression[:-1]
 
-        return str(result)
 
-    except SympifyError:
+def replace_expression(current_expression: str | ExpressionBuffer, text: str) -> str | ExpressionBuffer:
+    """Replaces the whole expression, in place for an ExpressionBuffer"""
+    if isinstance(current_expression, ExpressionBuffer):
+        current_expression.load(text)
         return current_expression
+    return text
+
+
+def warm_up_engines() -> None:
+    """
+    Imports the lazily loaded evaluation engines ahead of their first use.
+    Meant to run in a background thread once the first frame is shown.
+    """
+    # Formatting of non-integer results
+    import mpmath.libmp
+    # sympy is only needed here when it isn't evaluated in worker processes
+    if evaluation_executor is None:
+        import sympy
+
+
+def set_instrumentation(timer) -> None:
+    """Times the pipeline stages into an Instrumentation (None disables timing again)"""
+    global instrumentation
+    instrumentation = timer
+
+
+def get_instrumentation():
+    """Returns the Instrumentation stages are timed into, if any"""
+    return instrumentation
+
+
+def set_evaluation_executor(executor) -> None:
+    """Routes sympy evaluations through an EvaluationExecutor (None evaluates inline again)"""
+    global evaluation_executor
+    evaluation_executor = executor
+
+
+def get_evaluation_executor():
+    """Returns the EvaluationExecutor sympy evaluations run in, if any"""
+    return evaluation_executor
+
+
+def set_history_log(log) -> None:
+    """Persists every calculation to a HistoryLog (None keeps the history in memory only)"""
+    global history_log
+    history_log = log
+
+
+def get_history_log():
+    """Returns the HistoryLog calculations are written to, if any"""
+    return history_log
+
 
+def set_precision(digits: int) -> None:
+    """
+    Precision mode: non-integer results (and integers too long to show in full) get `digits`
+    significant digits instead of 5. Cached results are keyed on the precision, so switching
+    back serves the ones of the previous precision again.
+    """
+    set_result_digits(digits)
 
-def update_expression(input_key: str, current_expression: str) -> str:
+
+def set_evaluation_backend(name: str | None) -> None:
+    """
+    Pins the backend evaluations start from ("float", "rational" or "sympy"), None picks the cheapest
+    per expression again. Results don't depend on it, the cached ones are dropped so timings do.
+    """
+    set_pinned_backend(name)
+    calculation_cache.clear()
+
+
+def get_precision() -> int:
+    """Returns the significant digits results are shown with"""
+    return get_result_digits()
+
+
+def get_calculation_cache_stats() -> dict:
+    """Returns hit / miss / eviction counters of the calculate() result cache"""
+    return calculation_cache.stats()
+
+
+def resize_calculation_cache(capacity: int) -> None:
+    """Changes how many evaluated expressions the calculate() result cache keeps"""
+    calculation_cache.resize(capacity)
+
+
+def insert_implied_multiplication(current_expression: str) -> str:
+    """Makes implied multiplication explicit in a single linear pass, e.g. 2(3)4 -> 2*(3)*4"""
+    processed_expression = IMPLIED_MULTIPLICATION_BEFORE_PATTERN.sub("*(", current_expression)
+    processed_expression = IMPLIED_MULTIPLICATION_AFTER_PATTERN.sub(")*", processed_expression)
+    # Special handling to prevent multiplication between **) sequences from exponentiation and adjacent parentheses
+    return DOUBLE_STAR_PARENTHESIS_PATTERN.sub("*(", processed_expression)
+
+
+def last_number_start(current_expression: str) -> int:
+    """
+    Returns where the number holding the last digit of the expression starts.
+    Leading zeros are only stripped when a digit is typed, so that number is the only place they can be left.
+    """
+    start = len(current_expression)
+    while start and not current_expression[start - 1].isdigit():
+        start -= 1
+    while True:
+        while start and (current_expression[start - 1].isalnum() or current_expression[start - 1] in "._"):
+            start -= 1
+        # Results in scientific notation such as 1.0000e-5 are a single number
+        if start >= 2 and current_expression[start - 1] in "+-" and current_expression[start - 2] == "e":
+            start -= 1
+            continue
+        return start
+
+
+def update_expression(input_key: str, current_expression: str | ExpressionBuffer) -> str | ExpressionBuffer:
+    if isinstance(current_expression, ExpressionBuffer):
+        # Token buffers append in place and normalize leading zeros within the affected number
+        if input_key not in ("=", "Enter"):
+            current_expression.append(input_key)
+        return current_expression
     if input_key not in ("=", "Enter"):
         if input_key.isdigit():
-            current_expression = sub(r"\b0+(?=\d)", "", current_expression)
+            # Everything before the last typed number is already normalized, so only its tail is rescanned
+            number_start = last_number_start(current_expression)
+            tail = current_expression[number_start:]
+            normalized_tail = LEADING_ZEROS_PATTERN.sub("", tail)
+            if normalized_tail != tail:
+                current_expression = current_expression[:number_start] + normalized_tail
         current_expression += input_key
     return current_expression
 
-# Benchmarking logic moved outside the function (optional)
-def benchmark_calculate(input_key: str, current_expression: str):
-    if is_calculate_key_pressed(input_key):
-        benchmark_calculate_result = calculate(current_expression)  # Avoid modifying original expression
-    
-        time_taken = timeit.timeit(lambda: benchmark_calculate_result, number=1000)
-        return print(f"Total execution time for calculate: {time_taken:.6f} seconds")
-            
-def is_calculate_key_pressed(input_key: str) -> bool:
-    """Checks if the input is '=' or 'Enter'."""
-    return input_key == "=" or (isinstance(input_key, str) and input_key == "Enter")
-
-def handle_calculate_key_pressed(input_key: str, current_expression: str, result: str, history: str, history_list: list[str]) -> tuple[str, str, str, list[str]]:
-    if current_expression == "":
-        return
-    elif prevent_last_operator_input(current_expression):
-        current_expression = current_expression[:-1]
-    else:
-        # format the history value, example (1 + 1 = 2)
-        calculated_current_expression = f"{current_expression} = {calculate(current_expression)}"
-
-        history_list.append(calculated_current_expression)
-        history_list_len = len(history_list)
-        # if length of history list if 5 or more, update its values.  Otherwise keep them the same
-        if history_list_len >= 5:
-            history = "\n".join(history_list[history_list_len - 5 : history_list_len + 1])
-        else:
-            history = "\n".join(history_list)
-        # The current calculation (1 + 1) will be evaluated (2)
-        current_expression = calculate(update_expression(input_key, current_expression))
-        result = calculate(current_expression)
-        result = ""
-        
-        # Benchmark calculating the result
-        # benchmark_calculate(input_key, current_expression)
-
-    return current_expression, result, history, history_list
 
+def type_character(input_key: str, state: CalculatorState) -> None:
+    """Appends a typed character to the expression"""
+    state.expression = update_expression(input_key, state.expression)
 
-def is_backspace_key_pressed(input_key: str) -> bool:
-    """Checks if the input is 'e' or 'Backspace'"""
-    return input_key == "e" or (isinstance(input_key, str) and input_key == "Backspace")
 
+def handle_calculate_key_pressed(input_key: str, state: CalculatorState) -> None:
+    """Handles "=" / "Enter": the expression is replaced by its result and added to the history"""
+    current_expression = state.expression
+    if not current_expression:
+        return
+    if prevent_last_operator_input(current_expression):
+        state.expression = remove_last_character(current_expression)
+        return
 
-def handle_backspace(current_expression: str, result: str) -> tuple[str, str]:
-    """Handles backspace input"""
-    if current_expression:
-        current_expression = current_expression[:-1]
-    if isinstance(result, str):
-        result = result[:-1]
-    else:
-        result = str(result)[:-1]
-    return current_expression, result
+    calculated = calculate_expression(current_expression)
+    if calculated == TOO_EXPENSIVE_RESULT:
+        # Not a value: the expression stays editable and nothing goes to the history
+        state.result = calculated
+        return
+    # An abbreviated result (e.g. 3.9803e+6020) can't be typed on, the expression gets all its digits instead
+    operand = calculated if "e+" not in calculated else calculate_full(str(current_expression))
+    # format the history value, example (1 + 1 = 2), before a buffer is replaced in place
+    calculated_current_expression = f"{current_expression} = {calculated}"
+    # history_list is a list or a fixed-capacity HistoryBuffer, both append in O(1)
+    state.history_list.append(calculated_current_expression)
+    if history_log is not None:
+        history_log.append(calculated_current_expression)
+    if "e+" in operand:
+        # No exact value to spell out (only sympy could evaluate it), the expression stays and the result is shown
+        state.result = calculated
+        return
+    # The current calculation (1 + 1) is replaced by its result (2)
+    state.expression = replace_expression(current_expression, operand)
+    state.result = ""
 
 
-def is_clear_key_pressed(input_key: str) -> bool:
-    """Checks if the input is 'c' for clear"""
-    return input_key == "C" or (isinstance(input_key, str) and input_key == "C")
+def handle_backspace(input_key: str, state: CalculatorState) -> None:
+    """Handles backspace input, trimming the result shown as well"""
+    if state.expression:
+        state.expression = remove_last_character(state.expression)
+    state.result = str(state.result)[:-1]
 
 
-def clear_calculator_state(
-    current_expression: str, result: str, history: str, history_list: list[str]
-) -> tuple[str, str, str, list[str]]:
-    """Clears current_expression, history, and result"""
-    if current_expression or result:
-        # Clear current expression and result on first press of "C"
-        current_expression = ""
-        result = ""
+def clear_calculator_state(input_key: str, state: CalculatorState) -> None:
+    """Clears the expression and result on the first press of "C", the history on the second"""
+    if state.expression or state.result:
+        state.expression = replace_expression(state.expression, "")
+        state.result = ""
     else:
-        # Clear history on second press of "C"
-        history = ""
-        history_list = []
-        
-    return current_expression, result, history, history_list
+        # Cleared in place so a HistoryBuffer keeps its capacity
+        state.history_list.clear()
+
+
+# Handler of every key that changes the state, keyed by the resolved key (see resolve_input_key)
+KEY_HANDLERS = {
+    **dict.fromkeys(ALLOWED_KEYS, type_character),
+    "=": handle_calculate_key_pressed,
+    "Enter": handle_calculate_key_pressed,
+    "Backspace": handle_backspace,
+    "e": handle_backspace,
+    "C": clear_calculator_state,
+}
 
 
 # ------------------------------------------------------------------------------
 # Main handle keyboard function
 # ------------------------------------------------------------------------------
 
-def handle_keyboard_input(event: KeyboardEvent, current_expression: str, result: str, history: str, history_list: list[str]) -> tuple[str, str, str, list]:
+def handle_keyboard_input(event, state: CalculatorState, preview_evaluator=None) -> None:
+    """Applies one key event to the state, then evaluates the live preview"""
+    timer = instrumentation
+    if timer is not None:
+        started = timer.now()
+    input_key = resolve_input_key(event)
+    if timer is not None:
+        timer.lap("key_normalization", started)
+
+    # Prevent "*" and "/" from being inputted first into current_expression object
+    if prevent_initial_operator_input(input_key, state.expression):
+        return
+
+    apply_input_key(input_key, state)
+    if updates_preview(input_key):
+        state.result = preview_result(state.expression, state.result, preview_evaluator)
+
+
+def resolve_input_key(event) -> str:
+    """
+    Returns the key a flet KeyboardEvent or button click stands for, numpad keys resolve to the character they type.
+    Events are read by attribute only, so evaluating (batch workers, the service) never imports flet.
+    """
     # Accept input from control/UI buttons or keyboard
     input_key = event.control.data or event.key
 
     # Apply Shift + key combinations (if any)
-    if isinstance(event, KeyboardEvent) and event.shift and event.key in SHIFT_KEY_MAPPINGS:
+    # Button clicks have no modifiers
+    if getattr(event, "shift", False) and event.key in SHIFT_KEY_MAPPINGS:
         input_key = SHIFT_KEY_MAPPINGS[event.key]
+    return NUMPAD_KEYS.get(input_key, input_key)
 
-    # Prevent "*" and "/" from being inputted first into current_expression object
-    if prevent_initial_operator_input(input_key, current_expression):
-        return current_expression
 
-    # Append the [keyboard / pressed buttons input] to current_expression object
-    if is_valid_input_key(input_key) and len(current_expression) <= 15:
-        current_expression = update_expression(input_key, current_expression)
-
-    # Handle numpad input:
-    elif is_input_from_numpad(input_key) and len(current_expression) <= 15:
-        current_expression = process_numpad_input(input_key, current_expression)
-
-    # Handle "=" or "Enter" to calculate the result
-    elif is_calculate_key_pressed(input_key):
-        current_expression, result, history, history_list = handle_calculate_key_pressed(
-            input_key, current_expression, result, history, history_list
-        )
-
-    # Handle backspace:
-    elif is_backspace_key_pressed(input_key):
-        current_expression, result = handle_backspace(current_expression, result)
-
-    # Handle clear:
-    elif is_clear_key_pressed(input_key):
-        current_expression, result, history, history_list = clear_calculator_state(
-            current_expression, result, history, history_list
-        )
-    if input_key not in {"=", "Enter", "Clear", "C", "Backspace", "e"}:
-        result = calculate(current_expression)
-
-    return current_expression, result, history, history_list
+def apply_input_key(input_key: str, state: CalculatorState) -> None:
+    """Applies one key to the calculator state, without evaluating the live preview"""
+    handler = KEY_HANDLERS.get(input_key)
+    if handler is not None:
+        handler(input_key, state)
+
+
+def updates_preview(input_key: str) -> bool:
+    """Checks if the result shows the live preview after this key"""
+    return input_key not in NON_PREVIEW_KEYS
+
+
+def preview_result(current_expression: str | ExpressionBuffer, result: str, preview_evaluator=None) -> str:
+    """Returns the live preview of the expression"""
+    # An incremental evaluator only re-parses what changed since the previous keystroke,
+    # an asynchronous one returns None and publishes the preview once it is ready
+    timer = instrumentation
+    if timer is not None:
+        started = timer.now()
+    if preview_evaluator is not None:
+        preview = preview_evaluator.preview(str(current_expression))
+        result = result if preview is None else preview
+    else:
+        result = calculate_expression(current_expression)
+    if timer is not None:
+        timer.lap("preview", started)
+    return result
+
+
+def handle_keyboard_batch(events: list, state: CalculatorState, preview_evaluator=None, undo_history=None) -> None:
+    """
+    Applies a burst of events to the state in order and evaluates the live preview once, at the end.
+    Pasted text can be passed in the list as a plain string. Ends in the same state as one
+    handle_keyboard_input call per event, except that "*" or "/" typed first is just skipped.
+    With an UndoHistory, every key and paste is recorded as one step, and UNDO_EVENT / REDO_EVENT undo / redo one.
+    """
+    preview_pending = False
+    for event in events:
+        if event is UNDO_EVENT or event is REDO_EVENT:
+            if undo_history is not None:
+                if event is UNDO_EVENT:
+                    applied = undo_history.undo(state)
+                else:
+                    applied = undo_history.redo(state)
+                if applied:
+                    preview_pending = undo_history.result_is_preview
+            continue
+
+        if isinstance(event, str):
+            if undo_history is not None:
+                undo_history.begin(state)
+            pasted_expression = ingest_pasted_text(event, state.expression)
+            if pasted_expression is not None:
+                state.expression = pasted_expression
+                preview_pending = True
+            if undo_history is not None:
+                undo_history.commit(state, preview_pending)
+            continue
+
+        timer = instrumentation
+        if timer is not None:
+            started = timer.now()
+        input_key = resolve_input_key(event)
+        if timer is not None:
+            timer.lap("key_normalization", started)
+        if prevent_initial_operator_input(input_key, state.expression):
+            continue
+        if preview_pending and not updates_preview(input_key):
+            # "=", clear and backspace can keep, check or trim the result shown before them, so that preview is needed after all
+            state.result = preview_result(state.expression, state.result, preview_evaluator)
+        if undo_history is not None:
+            undo_history.begin(state)
+        apply_input_key(input_key, state)
+        preview_pending = updates_preview(input_key)
+        if undo_history is not None:
+            undo_history.commit(state, preview_pending)
+
+    if preview_pending:
+        state.result = preview_result(state.expression, state.result, preview_evaluator)
+
+
+def validate_pasted_text(text: str, current_expression: str | ExpressionBuffer) -> str | None:
+    """Returns pasted text as expression input (whitespace dropped, × and ÷ mapped), None if it can't be typed"""
+    text = "".join(text.split()).replace("×", "*").replace("÷", "/")
+    if not text or any(char not in ALLOWED_KEYS for char in text):
+        return None
+    if prevent_initial_operator_input(text[0], current_expression):
+        return None
+    return text
+
+
+def ingest_pasted_text(text: str, current_expression: str | ExpressionBuffer) -> str | ExpressionBuffer | None:
+    """Appends pasted text in one pass, returns None (expression unchanged) if it isn't valid input"""
+    text = validate_pasted_text(text, current_expression)
+    if text is None:
+        return None
+    expression_text = str(current_expression)
+    # Leading zeros can only be left in the last number, the pasted numbers are normalized along with it
+    number_start = last_number_start(expression_text)
+    normalized_tail = LEADING_ZEROS_PATTERN.sub("", expression_text[number_start:] + text)
+    return replace_expression(current_expression, expression_text[:number_start] + normalized_tail)
 
 
 # from sympy import sympify, simplify, SympifyError, symbols
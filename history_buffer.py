@@ -0,0 +1,95 @@
+from constants import HISTORY_CAPACITY
+# ------------------------------------------------------------------------------
+
+
+class HistoryBuffer:
+    """
+    Fixed-capacity ring buffer of calculation history entries, oldest first.
+
+    Appending is O(1) and overwrites the oldest entry once the buffer is full,
+    so a long session keeps at most `capacity` entries. Supports `len()`,
+    iteration and list-style indexing / slicing (e.g. `history[-5:]`).
+    """
+
+    __slots__ = ("entries", "start", "count", "version")
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.entries = [None] * capacity
+        # Position of the oldest entry in `entries`
+        self.start = 0
+        self.count = 0
+        # Bumped on every change, lets views skip re-rendering an unchanged history
+        self.version = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.entries)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.entries[(self.start + index) % len(self.entries)]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("history index out of range")
+        return self.entries[(self.start + index) % len(self.entries)]
+
+    def __repr__(self) -> str:
+        return f"HistoryBuffer({list(self)!r}, capacity={self.capacity})"
+
+    def append(self, entry: str) -> None:
+        """Adds the newest entry, dropping the oldest one when full"""
+        capacity = len(self.entries)
+        if self.count < capacity:
+            self.entries[(self.start + self.count) % capacity] = entry
+            self.count += 1
+        else:
+            self.entries[self.start] = entry
+            self.start = (self.start + 1) % capacity
+        self.version += 1
+
+    def pop(self) -> str:
+        """Removes and returns the newest entry"""
+        if not self.count:
+            raise IndexError("pop from an empty history")
+        self.count -= 1
+        index = (self.start + self.count) % len(self.entries)
+        entry = self.entries[index]
+        self.entries[index] = None
+        self.version += 1
+        return entry
+
+    def push_oldest(self, entry: str) -> None:
+        """Puts back an entry dropped by `append`, before the oldest one (the buffer must not be full)"""
+        if self.count == len(self.entries):
+            raise IndexError("push to a full history")
+        self.start = (self.start - 1) % len(self.entries)
+        self.entries[self.start] = entry
+        self.count += 1
+        self.version += 1
+
+    def snapshot(self) -> tuple:
+        """
+        The current entries, for `restore`. O(1): `clear` replaces the entry list instead of emptying it,
+        so a snapshot taken before a clear still holds the cleared entries.
+        """
+        return (self.entries, self.start, self.count)
+
+    def restore(self, snapshot: tuple) -> None:
+        self.entries, self.start, self.count = snapshot
+        self.version += 1
+
+    def clear(self) -> None:
+        self.entries = [None] * len(self.entries)
+        self.start = 0
+        self.count = 0
+        self.version += 1
@@ -0,0 +1,236 @@
+import os
+import sys
+from array import array
+from bisect import bisect_right
+from mmap import ACCESS_READ, mmap
+from struct import Struct
+from threading import Lock
+from time import monotonic
+from constants import HISTORY_LOG_SYNC_EVERY, HISTORY_LOG_SYNC_INTERVAL, HISTORY_SEARCH_CACHE_SIZE, HISTORY_SEARCH_LIMIT
+from result_cache import LRUCache
+# ------------------------------------------------------------------------------
+# Persistent, append-only calculation history.
+#
+# The log is a UTF-8 text file with one "expression = result" entry per line.
+# A companion ".idx" file stores the byte offset of every entry as a 64-bit
+# little-endian integer, so the latest N entries can be read from a memory map
+# of the log without scanning it, and entry i is found with one seek.
+# Writes are buffered and fsync'ed in batches; a torn last line or a stale
+# index left by a crash is repaired when the log is opened.
+# ------------------------------------------------------------------------------
+
+OFFSET = Struct("<Q")
+ENTRY_SEPARATOR = b" = "
+
+
+class HistoryLog:
+    """Append-only on-disk history with an offset index and cached substring / prefix search"""
+
+    def __init__(
+        self,
+        path: str,
+        sync_every: int = HISTORY_LOG_SYNC_EVERY,
+        sync_interval: float = HISTORY_LOG_SYNC_INTERVAL,
+        search_cache_size: int = HISTORY_SEARCH_CACHE_SIZE,
+    ):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.log_file = open(path, "a+b")
+        self.index_file = open(self.index_path, "a+b")
+        self.size, self.count = self.recover()
+        self.map = None
+        self.mapped_size = 0
+        # Offsets of every entry, only loaded when a search needs them
+        self.offsets = None
+        self.unsynced = 0
+        self.last_sync = monotonic()
+        # (text, prefix, limit) -> (entries searched, newest-first matches)
+        self.searches = LRUCache(search_cache_size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "HistoryLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # --------------------------------------------------------------------------
+    # Writing
+    # --------------------------------------------------------------------------
+
+    def append(self, entry: str) -> None:
+        """Appends one "expression = result" entry, fsync'ing every `sync_every` entries or `sync_interval` seconds"""
+        data = entry.replace("\n", " ").encode() + b"\n"
+        with self.lock:
+            self.log_file.write(data)
+            self.index_file.write(OFFSET.pack(self.size))
+            if self.offsets is not None:
+                self.offsets.append(self.size)
+            self.size += len(data)
+            self.count += 1
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every or monotonic() - self.last_sync >= self.sync_interval:
+                self.sync()
+
+    def sync(self) -> None:
+        """Writes buffered entries through to the disk"""
+        self.log_file.flush()
+        self.index_file.flush()
+        os.fsync(self.log_file.fileno())
+        os.fsync(self.index_file.fileno())
+        self.unsynced = 0
+        self.last_sync = monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.log_file.closed:
+                return
+            self.sync()
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.log_file.close()
+            self.index_file.close()
+
+    # --------------------------------------------------------------------------
+    # Reading
+    # --------------------------------------------------------------------------
+
+    def latest(self, count: int) -> list[str]:
+        """Returns the newest `count` entries, oldest first, reading only their index records and lines"""
+        with self.lock:
+            start = max(0, self.count - count)
+            if start == self.count:
+                return []
+            self.index_file.flush()
+            self.index_file.seek(start * OFFSET.size)
+            offsets = array("Q", self.index_file.read((self.count - start) * OFFSET.size))
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            log = self.mapping()
+            ends = offsets[1:].tolist() + [self.size]
+            return [log[begin : end - 1].decode() for begin, end in zip(offsets, ends)]
+
+    def search(self, text: str, prefix: bool = False, limit: int = HISTORY_SEARCH_LIMIT) -> list[str]:
+        """
+        Returns up to `limit` entries, newest first, whose expression contains (or starts with) `text`.
+        Recent searches are cached; repeating one after new appends only scans the new entries.
+        """
+        needle = text.encode()
+        key = (text, prefix, limit)
+        with self.lock:
+            searched, matches = self.searches.get(key, (0, []))
+            if searched < self.count:
+                new_matches = self.scan(needle, prefix, searched, limit)
+                matches = (new_matches + matches)[:limit]
+                self.searches.put(key, (self.count, matches))
+            return list(matches)
+
+    def scan(self, needle: bytes, prefix: bool, first_entry: int, limit: int) -> list[str]:
+        """Searches entries from `first_entry` on, backwards from the newest one"""
+        offsets = self.load_offsets()
+        log = self.mapping()
+        low = offsets[first_entry]
+        end = self.size
+        matches = []
+        while len(matches) < limit:
+            position = log.rfind(needle, low, end)
+            if position < 0:
+                break
+            entry = bisect_right(offsets, position) - 1
+            entry_start = offsets[entry]
+            entry_end = offsets[entry + 1] if entry + 1 < len(offsets) else self.size
+            expression_end = log.find(ENTRY_SEPARATOR, entry_start, entry_end)
+            if expression_end < 0:
+                expression_end = entry_end - 1
+            if position + len(needle) <= expression_end and (not prefix or position == entry_start):
+                matches.append(log[entry_start : entry_end - 1].decode())
+                # Everything further in this entry is done, continue with the previous one
+                end = entry_start
+            else:
+                # The match was in the result part (or not at the start), earlier positions may still match
+                end = position + len(needle) - 1
+            if end <= low:
+                break
+        return matches
+
+    def load_offsets(self) -> array:
+        if self.offsets is None:
+            self.index_file.flush()
+            self.index_file.seek(0)
+            self.offsets = array("Q", self.index_file.read(self.count * OFFSET.size))
+            if sys.byteorder == "big":
+                self.offsets.byteswap()
+        return self.offsets
+
+    def mapping(self) -> mmap | bytes:
+        """Read-only memory map of the log, remapped when it grew"""
+        if self.mapped_size != self.size:
+            self.log_file.flush()
+            if self.map is not None:
+                self.map.close()
+            # Empty files can't be mapped
+            self.map = mmap(self.log_file.fileno(), 0, access=ACCESS_READ) if self.size else None
+            self.mapped_size = self.size
+        return self.map if self.map is not None else b""
+
+    # --------------------------------------------------------------------------
+    # Crash recovery
+    # --------------------------------------------------------------------------
+
+    def recover(self) -> tuple[int, int]:
+        """Repairs a torn last line and a stale index, returns the log size and the number of entries"""
+        log_size = os.fstat(self.log_file.fileno()).st_size
+        if log_size:
+            with mmap(self.log_file.fileno(), 0, access=ACCESS_READ) as log:
+                complete_size = log.rfind(b"\n") + 1
+            if complete_size != log_size:
+                self.log_file.truncate(complete_size)
+                log_size = complete_size
+
+        index_size = os.fstat(self.index_file.fileno()).st_size
+        count = index_size // OFFSET.size
+        if count * OFFSET.size != index_size:
+            self.index_file.truncate(count * OFFSET.size)
+        if not self.index_matches(log_size, count):
+            count = self.rebuild_index(log_size)
+        return log_size, count
+
+    def index_matches(self, log_size: int, count: int) -> bool:
+        """The index is valid when its last offset points at the start of the log's last line"""
+        if not log_size or not count:
+            return log_size == count == 0
+        self.index_file.seek((count - 1) * OFFSET.size)
+        (last_offset,) = OFFSET.unpack(self.index_file.read(OFFSET.size))
+        if last_offset >= log_size:
+            return False
+        self.log_file.seek(max(0, last_offset - 1))
+        line = self.log_file.read(log_size - max(0, last_offset - 1))
+        if last_offset:
+            if line[:1] != b"\n":
+                return False
+            line = line[1:]
+        return line.find(b"\n") == len(line) - 1
+
+    def rebuild_index(self, log_size: int) -> int:
+        offsets = array("Q")
+        if log_size:
+            with mmap(self.log_file.fileno(), 0, access=ACCESS_READ) as log:
+                position = 0
+                while position < log_size:
+                    offsets.append(position)
+                    position = log.find(b"\n", position) + 1
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self.index_file.truncate(0)
+        self.index_file.write(offsets.tobytes())
+        self.index_file.flush()
+        return len(offsets)
@@ -0,0 +1,81 @@
+import flet as ft
+from constants import COLORS, HISTORY_VISIBLE_ROWS
+from history_buffer import HistoryBuffer
+# ------------------------------------------------------------------------------
+
+
+class HistoryView(ft.GestureDetector):
+    """
+    Virtualized history pane.
+
+    Only `visible_rows` Text controls exist, whatever the size of the history:
+    scrolling (mouse wheel / trackpad) moves a window over the HistoryBuffer and
+    rewrites the values of those rows, so thousands of entries cost the same as five.
+    `refresh` pushes re-rendered rows to the client, it defaults to updating the view.
+    """
+
+    def __init__(self, visible_rows: int = HISTORY_VISIBLE_ROWS, refresh=None):
+        self.rows = [
+            ft.Text(
+                value="",
+                size=20,
+                text_align="right",
+                color=COLORS["hint_text"],
+                visible=False,
+            )
+            for _ in range(visible_rows)
+        ]
+        super().__init__(
+            content=ft.Column(
+                controls=self.rows,
+                spacing=0,
+                horizontal_alignment=ft.CrossAxisAlignment.END,
+            ),
+            on_scroll=self.handle_scroll,
+        )
+        self.refresh = refresh or self.update
+        self.history = HistoryBuffer(1)
+        self.rendered_version = None
+        # Number of newest entries scrolled out of view at the bottom, 0 shows the latest ones
+        self.offset = 0
+
+    @property
+    def value(self) -> str:
+        """Visible entries joined by newlines, like the former history Text"""
+        return "\n".join(row.value for row in self.rows if row.visible)
+
+    def show(self, history: HistoryBuffer) -> bool:
+        """Renders the newest entries of `history`, returns False when nothing changed"""
+        if history is self.history and history.version == self.rendered_version:
+            return False
+        self.history = history
+        self.rendered_version = history.version
+        self.offset = 0
+        self.render()
+        return True
+
+    def scroll(self, rows: int) -> None:
+        """Moves the window `rows` entries towards older (< 0) or newer (> 0) entries"""
+        max_offset = max(0, len(self.history) - len(self.rows))
+        offset = min(max(self.offset - rows, 0), max_offset)
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+            self.refresh()
+
+    def handle_scroll(self, event: ft.ScrollEvent) -> None:
+        if event.scroll_delta_y:
+            self.scroll(1 if event.scroll_delta_y > 0 else -1)
+
+    def render(self) -> None:
+        end = len(self.history) - self.offset
+        visible = self.history[max(0, end - len(self.rows)) : end]
+        # Newest entry at the bottom, unused rows at the top are hidden
+        padding = len(self.rows) - len(visible)
+        for index, row in enumerate(self.rows):
+            if index < padding:
+                row.value = ""
+                row.visible = False
+            else:
+                row.value = visible[index - padding]
+                row.visible = True
@@ -0,0 +1,321 @@
+from constants import ALLOWED_KEYS, SPECULATION_MAX_GROUPS, SPECULATION_MAX_LOOKBACK, SPECULATIVE_PREVIEW
+from fast_arithmetic import BINARY_FUNCTIONS, UnsupportedExpression, format_result, parse_number, power
+from handle_keyboard_helpers import calculate
+# ------------------------------------------------------------------------------
+# Incremental live preview.
+#
+# The evaluator keeps one parser state per character of the expression, so
+# typing a key only feeds that key to the state of the previous prefix and
+# backspace simply drops the last state. Finished operands are folded into
+# their pending sums / products as soon as an operator follows them, so a
+# preview only has to combine the trailing operand with a few pending values,
+# no matter how long the expression is.
+#
+# The states evaluate exactly like the fast path of `calculate`. Whenever a
+# prefix leaves that subset (sympy-only input, syntax errors, ...) its state
+# is marked as a fallback and the preview goes through `calculate` instead.
+#
+# Incomplete input, that `calculate` echoes back, gets a provisional result:
+# trailing operators and open parentheses are skipped back to the last state
+# that ended in an operand, and that state's open groups are closed by feeding
+# it ")" characters. Frames of the enclosing groups are shared between states,
+# so nothing typed before is parsed again, and the value is kept on the state
+# (a trailing operator reuses the one of the operand before it). At most
+# SPECULATION_MAX_LOOKBACK states are skipped and SPECULATION_MAX_GROUPS
+# groups closed per keystroke, and only the fast path is used (never sympy),
+# past that the expression is echoed back as before.
+# ------------------------------------------------------------------------------
+
+# What the parser expects next
+EXPECT_OPERAND = 0
+IN_NUMBER = 1
+AFTER_OPERAND = 2
+
+NEGATE = "-"
+POWER = "**"
+
+# PreviewState.speculation before the provisional value was computed
+NOT_SPECULATED = object()
+
+
+class PreviewState:
+    """Immutable-by-convention parser state after a prefix of the expression"""
+
+    __slots__ = (
+        "mode",
+        "number_text",
+        "operand",
+        "pending",
+        "term_value",
+        "term_operator",
+        "sum_value",
+        "sum_operator",
+        "frames",
+        "depth",
+        "last_token",
+        "fallback",
+        "speculation",
+    )
+
+    def __init__(self):
+        self.mode = EXPECT_OPERAND
+        # Text of the number being typed, converted only when needed
+        self.number_text = ""
+        # Value of the last closed parenthesis group
+        self.operand = None
+        # Linked list of unary minus / power bases waiting for their operand
+        self.pending = None
+        self.term_value = None
+        self.term_operator = None
+        self.sum_value = None
+        self.sum_operator = None
+        # Linked list of the enclosing groups' states, one entry per open "("
+        self.frames = None
+        self.depth = 0
+        self.last_token = ""
+        self.fallback = False
+        # Provisional value with the open groups closed, None if there is none (see speculate)
+        self.speculation = NOT_SPECULATED
+
+    def copy(self) -> "PreviewState":
+        state = PreviewState.__new__(PreviewState)
+        for name in PreviewState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state.speculation = NOT_SPECULATED
+        return state
+
+
+def complete_factor(value, pending):
+    """Applies pending unary minus signs and powers (right to left) to an operand"""
+    while pending is not None:
+        (item, base), pending = pending
+        value = -value if item == NEGATE else power(base, value)
+    return value
+
+
+def reduce_term(state: PreviewState, factor_value):
+    if state.term_operator is None:
+        return factor_value
+    return BINARY_FUNCTIONS[state.term_operator](state.term_value, factor_value)
+
+
+def reduce_sum(state: PreviewState, term_value):
+    if state.sum_operator is None:
+        return term_value
+    return BINARY_FUNCTIONS[state.sum_operator](state.sum_value, term_value)
+
+
+def current_operand(state: PreviewState):
+    if state.mode == IN_NUMBER:
+        if state.number_text == ".":
+            raise UnsupportedExpression(state.number_text)
+        return parse_number(state.number_text)
+    return state.operand
+
+
+def finish_group(state: PreviewState):
+    """Evaluates everything typed in the innermost open group"""
+    factor_value = complete_factor(current_operand(state), state.pending)
+    return reduce_sum(state, reduce_term(state, factor_value))
+
+
+class IncrementalEvaluator:
+    """
+    Live preview evaluator that keeps parser state between keystrokes.
+
+    `preview` returns the same string `calculate` would for the expression, except that incomplete
+    expressions get a provisional result when `speculative` (see speculate).
+    """
+
+    def __init__(self, speculative: bool = SPECULATIVE_PREVIEW):
+        self.expression = ""
+        self.states = [PreviewState()]
+        self.speculative = speculative
+
+    def preview(self, expression: str) -> str:
+        """Re-synchronizes with the new expression and returns its preview"""
+        if not expression.startswith(self.expression):
+            self.truncate(self.common_prefix_length(expression))
+        for char in expression[len(self.expression):]:
+            self.states.append(self.advance(char))
+        self.expression = expression
+        return self.evaluate(self.states[-1])
+
+    def reset(self) -> None:
+        self.expression = ""
+        del self.states[1:]
+
+    def truncate(self, length: int) -> None:
+        """Restores the state of the first `length` characters, e.g. after a backspace"""
+        del self.states[length + 1:]
+        self.expression = self.expression[:length]
+
+    def common_prefix_length(self, expression: str) -> int:
+        length = min(len(expression), len(self.expression))
+        if expression[:length] == self.expression[:length]:
+            return length
+        position = 0
+        while expression[position] == self.expression[position]:
+            position += 1
+        return position
+
+    def evaluate(self, state: PreviewState) -> str:
+        if state.fallback:
+            return calculate(self.expression)
+        if state.mode == EXPECT_OPERAND or state.depth:
+            # Empty, unbalanced or ending in an operator: calculate echoes these back
+            return self.speculate() if self.speculative else self.expression
+        try:
+            return format_result(finish_group(state))
+        except UnsupportedExpression:
+            return calculate(self.expression)
+
+    def speculate(self) -> str:
+        """
+        Provisional result of an incomplete expression, evaluated as if its trailing operators were
+        dropped and its parentheses closed: "2*(3+4" previews 14, "1+2*" previews 3.
+        Echoes the expression back when that can't be done within the budget on the fast path.
+        """
+        index = len(self.states) - 1
+        stop = max(index - SPECULATION_MAX_LOOKBACK, 0)
+        while index > stop and self.states[index].mode == EXPECT_OPERAND:
+            index -= 1
+        state = self.states[index]
+        if state.mode == EXPECT_OPERAND:
+            return self.expression
+        if state.speculation is NOT_SPECULATED:
+            state.speculation = self.close_groups(state)
+        return self.expression if state.speculation is None else format_result(state.speculation)
+
+    def close_groups(self, state: PreviewState):
+        """Value of a state ending in an operand once its open groups are closed, None if it has none"""
+        if state.depth > SPECULATION_MAX_GROUPS:
+            return None
+        try:
+            for _ in range(state.depth):
+                state = self.transition(state, ")")
+            return finish_group(state)
+        except UnsupportedExpression:
+            return None
+
+    def advance(self, char: str) -> PreviewState:
+        """Returns the state after feeding one more character to the last state"""
+        previous = self.states[-1]
+        if previous.fallback:
+            return previous
+        try:
+            state = self.transition(previous, char)
+        except UnsupportedExpression:
+            state = None
+        if state is None:
+            state = previous.copy()
+            state.fallback = True
+        return state
+
+    def transition(self, previous: PreviewState, char: str) -> PreviewState | None:
+        """Parses one character, returns None for anything only `calculate` can handle"""
+        if char not in ALLOWED_KEYS and char != "^":
+            return None
+
+        state = previous.copy()
+        state.last_token = char
+
+        if char.isdigit() or char == ".":
+            if state.mode == IN_NUMBER:
+                if char == "." and "." in state.number_text:
+                    return None
+                state.number_text += char
+                return state
+            if state.mode == AFTER_OPERAND:
+                if char == ".":
+                    return None
+                # Implied multiplication: ")2" is evaluated as ")*2"
+                apply_term_operator(state, "*")
+            state.mode = IN_NUMBER
+            state.number_text = char
+            return state
+
+        if char == "(":
+            if previous.last_token == "**":
+                # calculate() rewrites "**(" to "*(", leave that quirk to it
+                return None
+            if state.mode != EXPECT_OPERAND:
+                # Implied multiplication: "2(" and ")(" are evaluated as "2*(" and ")*("
+                apply_term_operator(state, "*")
+            state.frames = (previous_frame(state), state.frames)
+            state.depth += 1
+            state.pending = state.term_operator = state.term_value = None
+            state.sum_operator = state.sum_value = None
+            state.mode = EXPECT_OPERAND
+            return state
+
+        if char == ")":
+            if state.mode == EXPECT_OPERAND or state.depth == 0:
+                return None
+            group_value = finish_group(state)
+            (
+                state.pending,
+                state.term_value,
+                state.term_operator,
+                state.sum_value,
+                state.sum_operator,
+            ), state.frames = state.frames
+            state.depth -= 1
+            state.operand = group_value
+            state.mode = AFTER_OPERAND
+            return state
+
+        if state.mode == EXPECT_OPERAND:
+            if char == "-":
+                state.pending = ((NEGATE, None), state.pending)
+                return state
+            if char == "+":
+                return state
+            if char in "*/" and previous.last_token == char:
+                # Second half of "**" or "//": redo the operator on the state before the first half
+                return self.apply_double_operator(char)
+            return None
+
+        if char == "^":
+            return apply_power_operator(state)
+        if char in "+-":
+            factor_value = complete_factor(current_operand(state), state.pending)
+            state.sum_value = reduce_sum(state, reduce_term(state, factor_value))
+            state.sum_operator = char
+            state.pending = state.term_operator = state.term_value = None
+            state.mode = EXPECT_OPERAND
+            return state
+        apply_term_operator(state, char)
+        return state
+
+    def apply_double_operator(self, char: str) -> PreviewState | None:
+        before_operator = self.states[-2]
+        if before_operator.fallback or before_operator.mode == EXPECT_OPERAND:
+            return None
+        state = before_operator.copy()
+        if char == "*":
+            apply_power_operator(state)
+        else:
+            apply_term_operator(state, "//")
+        state.last_token = char * 2
+        return state
+
+
+def previous_frame(state: PreviewState) -> tuple:
+    return (state.pending, state.term_value, state.term_operator, state.sum_value, state.sum_operator)
+
+
+def apply_term_operator(state: PreviewState, operator: str) -> None:
+    """Folds the finished operand into the pending product and starts the next factor"""
+    factor_value = complete_factor(current_operand(state), state.pending)
+    state.term_value = reduce_term(state, factor_value)
+    state.term_operator = operator
+    state.pending = None
+    state.mode = EXPECT_OPERAND
+
+
+def apply_power_operator(state: PreviewState) -> PreviewState:
+    """Keeps the finished operand as the base of a (right-associative) power"""
+    state.pending = ((POWER, current_operand(state)), state.pending)
+    state.mode = EXPECT_OPERAND
+    return state
@@ -0,0 +1,61 @@
+from threading import Lock, Timer
+from time import monotonic
+from constants import INPUT_FRAME
+# ------------------------------------------------------------------------------
+# Keystroke coalescing.
+#
+# A key arriving when nothing was applied during the current frame is applied
+# right away. Keys arriving later in that frame (held keys, fast typing) are
+# collected and applied together when the frame ends, so a burst costs one
+# evaluation and one render instead of one per key.
+# ------------------------------------------------------------------------------
+
+
+class InputBatcher:
+    """Collects input events and hands them to `apply_batch(events)` at most once per frame, in order"""
+
+    def __init__(self, apply_batch, frame: float = INPUT_FRAME):
+        self.apply_batch = apply_batch
+        self.frame = frame
+        self.lock = Lock()
+        # Held while a batch is applied, batches never overlap and keep their order
+        self.apply_lock = Lock()
+        self.pending = []
+        self.scheduled = False
+        self.last_flush = float("-inf")
+        self.batches = 0
+        self.events = 0
+
+    def submit(self, event) -> None:
+        """Queues an event (or pasted text), applying it now if the frame has no batch yet"""
+        with self.lock:
+            self.pending.append(event)
+            if self.scheduled:
+                return
+            self.scheduled = True
+            delay = self.last_flush + self.frame - monotonic()
+        if delay > 0:
+            timer = Timer(delay, self.flush)
+            timer.daemon = True
+            timer.start()
+        else:
+            self.flush()
+
+    def flush(self) -> None:
+        """Applies everything queued so far as one batch"""
+        with self.apply_lock:
+            with self.lock:
+                events, self.pending = self.pending, []
+                self.scheduled = False
+                self.last_flush = monotonic()
+            if events:
+                self.batches += 1
+                self.events += len(events)
+                self.apply_batch(events)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "events_per_batch": self.events / self.batches if self.batches else 0.0,
+        }
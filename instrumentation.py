@@ -0,0 +1,151 @@
+import sys
+from collections import deque
+from json import dump
+from math import ceil
+from os import environ, makedirs
+from os.path import dirname
+from threading import Lock
+from time import perf_counter
+from constants import INSTRUMENTATION_SLOW_EXPRESSIONS, INSTRUMENTATION_SLOW_THRESHOLD, INSTRUMENTATION_WINDOW
+# ------------------------------------------------------------------------------
+# Opt-in stage timing for the evaluation pipeline.
+#
+# Call sites check a module global for None before touching the clock, so the
+# disabled path costs one comparison per stage:
+#
+#     if instrumentation is not None:
+#         started = instrumentation.lap("validation", started)
+#
+# Every stage keeps a rolling window of its latest durations, summarized as
+# percentiles and power-of-two microsecond buckets on export.
+# ------------------------------------------------------------------------------
+
+INSTRUMENTATION_FLAG = "--instrument"
+INSTRUMENTATION_VARIABLE = "CALCULATOR_INSTRUMENTATION"
+
+# Stages in pipeline order, as shown in the debug overlay
+STAGES = (
+    "key_normalization",
+    "validation",
+    "implied_multiplication",
+    "cache_lookup",
+    "float",
+    "rational",
+    "sympify",
+    "simplify",
+    "formatting",
+    "sympy",
+    "preview",
+    "calculate",
+    "ui_update",
+)
+
+
+class LatencyHistogram:
+    """Rolling window of the latest durations (seconds) of one stage"""
+
+    def __init__(self, window: int = INSTRUMENTATION_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.total_count = 0
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self.total_count += 1
+
+    def summary(self) -> dict:
+        """Percentiles in microseconds over the window, and its samples per power-of-two microsecond bucket"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"count": 0, "total_count": self.total_count}
+        buckets = {}
+        for seconds in ordered:
+            # Upper bound of the bucket, e.g. 3.2 us goes to the "4" (2-4 us) bucket
+            bound = 1 << max(0, ceil(seconds * 1e6) - 1).bit_length()
+            buckets[bound] = buckets.get(bound, 0) + 1
+        return {
+            "count": len(ordered),
+            "total_count": self.total_count,
+            "mean_us": sum(ordered) / len(ordered) * 1e6,
+            "p50_us": nearest_rank(ordered, 0.50) * 1e6,
+            "p90_us": nearest_rank(ordered, 0.90) * 1e6,
+            "p99_us": nearest_rank(ordered, 0.99) * 1e6,
+            "max_us": ordered[-1] * 1e6,
+            "buckets_us": {str(bound): count for bound, count in sorted(buckets.items())},
+        }
+
+
+class Instrumentation:
+    """Per-stage latency histograms, plus the latest calculations slower than `slow_threshold` seconds"""
+
+    def __init__(
+        self,
+        window: int = INSTRUMENTATION_WINDOW,
+        slow_threshold: float = INSTRUMENTATION_SLOW_THRESHOLD,
+        slow_expressions: int = INSTRUMENTATION_SLOW_EXPRESSIONS,
+    ):
+        self.window = window
+        self.slow_threshold = slow_threshold
+        self.histograms = {}
+        self.slow_expressions = deque(maxlen=slow_expressions)
+        # Stages are recorded from the keyboard handler and the preview thread
+        self.lock = Lock()
+
+    @staticmethod
+    def now() -> float:
+        return perf_counter()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.window)
+            histogram.add(seconds)
+
+    def lap(self, stage: str, started: float) -> float:
+        """Records the time since `started` under `stage` and returns the current time, the start of the next stage"""
+        now = perf_counter()
+        self.record(stage, now - started)
+        return now
+
+    def record_calculation(self, expression: str, started: float) -> None:
+        """Records a whole `calculate` call, remembering the expression if it was slow"""
+        seconds = perf_counter() - started
+        self.record("calculate", seconds)
+        if seconds >= self.slow_threshold:
+            with self.lock:
+                self.slow_expressions.append({"expression": expression, "ms": seconds * 1000})
+
+    def export(self) -> dict:
+        with self.lock:
+            stages = {stage: self.histograms[stage].summary() for stage in self.ordered_stages()}
+            slow_expressions = list(self.slow_expressions)
+        return {"window": self.window, "stages": stages, "slow_expressions": slow_expressions}
+
+    def dump(self, path: str) -> None:
+        """Writes the export as JSON"""
+        if dirname(path):
+            makedirs(dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            dump(self.export(), file, indent=2)
+
+    def overlay_text(self) -> str:
+        """One line per stage, for the debug overlay"""
+        lines = [f"{'stage':22}{'n':>6}{'p50':>9}{'p99':>9}  (us)"]
+        for stage, summary in self.export()["stages"].items():
+            if summary["count"]:
+                lines.append(f"{stage:22}{summary['count']:>6}{summary['p50_us']:>9.1f}{summary['p99_us']:>9.1f}")
+        return "\n".join(lines)
+
+    def ordered_stages(self) -> list[str]:
+        return [stage for stage in STAGES if stage in self.histograms] + sorted(
+            stage for stage in self.histograms if stage not in STAGES
+        )
+
+
+def nearest_rank(ordered: list[float], fraction: float) -> float:
+    return ordered[max(1, ceil(fraction * len(ordered))) - 1]
+
+
+def is_instrumentation_requested() -> bool:
+    """Checks for `python main.py --instrument` or CALCULATOR_INSTRUMENTATION=1"""
+    return INSTRUMENTATION_FLAG in sys.argv or environ.get(INSTRUMENTATION_VARIABLE, "") not in ("", "0")
@@ -1,3 +1,7 @@
+# First import, so the startup profiler (python main.py --profile-startup) also times flet
+from startup_profiler import mark_startup
+from functools import partial
+from threading import Thread
 import flet as ft
 from flet import (
     app,
@@ -8,11 +12,55 @@ from flet import (
     UserControl,
     MainAxisAlignment,
 )
-from constants import COLORS
-from handle_keyboard_helpers import handle_keyboard_input
+from constants import (
+    ASYNC_PREVIEW,
+    COLORS,
+    HISTORY_CAPACITY,
+    HISTORY_LOG_PATH,
+    INPUT_BATCHING,
+    INSTRUMENTATION_EXPORT_PATH,
+    INSTRUMENTATION_OVERLAY_INTERVAL,
+    PRECISION_CHOICES,
+    RECORDING_DIRECTORY,
+    SERVER_HOST,
+    SERVER_PORT,
+    TOO_EXPENSIVE_RESULT,
+    UPDATE_METER,
+)
+from handle_keyboard_helpers import (
+    full_result_text,
+    get_evaluation_executor,
+    get_history_log,
+    get_instrumentation,
+    get_precision,
+    handle_keyboard_batch,
+    set_evaluation_executor,
+    set_history_log,
+    set_instrumentation,
+    set_precision,
+    warm_up_engines,
+)
+from evaluation_executor import EvaluationBusy, EvaluationExecutor, EvaluationTimeout
+from incremental_preview import IncrementalEvaluator
+from async_preview import AsyncPreview
+from calculator_state import CalculatorState
+from expression_buffer import ExpressionBuffer
+from history_buffer import HistoryBuffer
+from history_log import HistoryLog
+from history_view import HistoryView
+from control_updates import ChangeTracker
+from input_batching import InputBatcher
+from instrumentation import Instrumentation, is_instrumentation_requested
+from server_mode import ServerResources, is_server_requested
+from undo_history import REDO_EVENT, UNDO_EVENT, UndoHistory
+from session_recorder import close_active_recorders, is_recording_requested, set_recording_directory, start_recording
+from tabulation import is_variable_expression, tabulate_in_worker
+from time import monotonic
 from ui_components import create_button_rows, create_text
 # ------------------------------------------------------------------------------
 
+mark_startup("modules imported")
+
 # class CalculatorApp(UserControl):
 #     # ------------------------------------------------------------------------------
 #     # Initializing the layout components
@@ -113,7 +161,13 @@ from ui_components import create_button_rows, create_text
 
 #         self.update()
 class CalculatorApp(ft.Column):
-    def __init__(self, page: ft.Page):
+    def __init__(
+        self,
+        page: ft.Page,
+        history_capacity: int = HISTORY_CAPACITY,
+        preview_executor=None,
+        precision_selectable: bool = True,
+    ):
         super().__init__()
         self.page = page
         self.text = create_text()
@@ -123,14 +177,53 @@ class CalculatorApp(ft.Column):
             text_align="right",
             color=ft.colors.AMBER_300,
         )
-        self.history = ft.Text(
+        # Only the visible history rows are rendered, the entries live in a bounded ring buffer
+        self.history = HistoryView(refresh=self.refresh_display)
+        # Expression, result and history entries, updated in place by the key handlers
+        self.state = CalculatorState(ExpressionBuffer(), "", HistoryBuffer(history_capacity))
+        # Stage timings, toggled with F12 when instrumentation is enabled
+        self.debug_overlay = ft.Text(
             value="",
-            size=20,
-            text_align="right",
+            size=11,
+            font_family="monospace",
             color=COLORS["hint_text"],
+            visible=False,
         )
-        self.history_list = []
+        self.overlay_refreshed = 0.0
+        # Records the handled events when recording is enabled (see session_recorder.py)
+        self.recorder = None
+        # The precision is process-wide, the sessions of a server can't change it for each other
+        self.precision_selectable = precision_selectable
+        # Bumped by every input, a tabulation that finishes after newer input isn't shown
+        self.tabulation_generation = 0
+        # The persistent log (if any) only has its newest entries read, through its offset index
+        history_log = get_history_log()
+        if history_log is not None:
+            for entry in history_log.latest(self.state.history_list.capacity):
+                self.state.history_list.append(entry)
+            self.history.show(self.state.history_list)
+        self.preview_evaluator = IncrementalEvaluator()
+        # Ctrl+Z / Ctrl+Y, every key is recorded as a step holding only what it changed
+        self.undo_history = UndoHistory()
+        # Without a page (headless benchmarks) the preview is evaluated synchronously
+        self.async_preview = None
+        if ASYNC_PREVIEW and page is not None:
+            self.async_preview = AsyncPreview(
+                self.preview_evaluator.preview, self.publish_preview, page.run_task, executor=preview_executor
+            )
         self.rows = create_button_rows(self.handle_keyboard_input)
+        # A keystroke can only change these, they are updated on their own instead of the whole tree
+        self.display = ChangeTracker([*self.history.rows, self.text, self.result, self.debug_overlay])
+        # Only for benchmarks.updates, the meter relies on flet internals
+        self.update_meter = None
+        if UPDATE_METER:
+            from control_updates import UpdateMeter
+
+            self.update_meter = UpdateMeter()
+        # Without a page (headless benchmarks) every event is applied on its own, right away
+        self.input_batcher = None
+        if INPUT_BATCHING and page is not None:
+            self.input_batcher = InputBatcher(self.apply_input)
 
         self.controls = [
             ft.Container(
@@ -170,6 +263,7 @@ class CalculatorApp(ft.Column):
                     ],
                 ),
             ),
+            ft.Row(controls=[self.debug_overlay]),
         ]
 
         self.bgcolor = COLORS["background"]
@@ -177,19 +271,145 @@ class CalculatorApp(ft.Column):
         self.padding = ft.padding.all(5)
         self.alignment = ft.alignment.center
 
+    def did_mount(self):
+        if self.update_meter is not None:
+            self.update_meter.attach(self.page)
+
+    def will_unmount(self):
+        if self.update_meter is not None:
+            self.update_meter.detach(self.page)
+
+    def close(self):
+        """Releases the session's preview thread (or its share of the server's), when the session ends"""
+        if self.async_preview is not None:
+            self.async_preview.shutdown()
+        if self.recorder is not None:
+            self.recorder.close()
+
     def handle_keyboard_input(self, event: ft.KeyboardEvent):
-        text = self.text.value
-        result = self.result.value
-        history = self.history.value
-        history_list = self.history_list
-        (
-            self.text.value,
-            self.result.value,
-            self.history.value,
-            self.history_list,
-        ) = handle_keyboard_input(event, text, result, history, history_list)
+        if isinstance(event, ft.KeyboardEvent) and (event.ctrl or event.meta) and event.key == "V":
+            # Recorded as the pasted text, a replay has no clipboard
+            self.paste(self.page.get_clipboard() or "")
+            return
+        if isinstance(event, ft.KeyboardEvent) and (event.ctrl or event.meta) and event.key == "C":
+            # Only the copy gets the full digits of a huge result, the display keeps it abbreviated
+            self.page.set_clipboard(full_result_text(self.state))
+            return
+        if self.recorder is not None:
+            self.recorder.record_event(event)
+        if isinstance(event, ft.KeyboardEvent) and event.key == "F12" and get_instrumentation() is not None:
+            self.debug_overlay.visible = not self.debug_overlay.visible
+            self.refresh_overlay(force=True)
+            self.refresh_display()
+        elif isinstance(event, ft.KeyboardEvent) and event.ctrl and event.key == "P" and self.precision_selectable:
+            self.cycle_precision()
+        elif isinstance(event, ft.KeyboardEvent) and (event.ctrl or event.meta) and event.key in ("Z", "Y"):
+            # Queued like a key, so it undoes / redoes after the keys typed before it
+            self.submit(REDO_EVENT if event.key == "Y" or event.shift else UNDO_EVENT)
+        else:
+            self.submit(event)
+
+    def submit(self, event):
+        """Applies an event, pasted text or undo / redo in order with the others, batched when enabled"""
+        if self.input_batcher is not None:
+            self.input_batcher.submit(event)
+        else:
+            self.apply_input([event])
+
+    def cycle_precision(self):
+        """Switches to the next of PRECISION_CHOICES, the result shows the new precision until the next key"""
+        current = get_precision()
+        digits = next((choice for choice in PRECISION_CHOICES if choice > current), PRECISION_CHOICES[0])
+        # Nothing to reset in the preview evaluator, it keeps unformatted values and formats them per preview
+        set_precision(digits)
+        self.state.result = self.result.value = f"{digits} digits"
+        self.refresh_display()
+
+    def paste(self, text: str):
+        """
+        Validates pasted text and appends it to the expression in one pass (ignored if it isn't valid input).
+        An expression in x (e.g. "sin(x)/x") is tabulated instead, see `tabulate`.
+        """
+        if self.recorder is not None:
+            self.recorder.record_paste(text)
+        if is_variable_expression(text):
+            self.tabulate(text)
+        else:
+            self.submit(text)
+
+    def tabulate(self, expression: str):
+        """
+        Variable mode: shows the expression with its min / max / roots over TABULATION_RANGE.
+        The points are evaluated in a sympy worker process under a deadline (parsing may fold huge constants
+        such as 9^9^9), waited for on a background thread. The next key returns to the calculator's expression.
+        """
+        self.tabulation_generation += 1
+        generation = self.tabulation_generation
+        self.text.value = expression
+        self.result.value = "..."
+        self.refresh_display()
 
-        self.update()
+        def show_summary():
+            try:
+                summary = tabulate_in_worker(expression, get_evaluation_executor()).summary()
+            except ValueError as error:
+                # VariableExpressionError, e.g. unbalanced parentheses
+                summary = str(error)
+            except (EvaluationTimeout, EvaluationBusy):
+                summary = TOO_EXPENSIVE_RESULT
+            if generation == self.tabulation_generation:
+                self.result.value = summary
+                self.refresh_display()
+
+        Thread(target=show_summary, daemon=True).start()
+
+    def apply_input(self, events: list):
+        """Applies a batch of events / pasted texts, evaluating and rendering once"""
+        self.tabulation_generation += 1
+        # A batch counts as one keystroke for the update meter
+        if self.update_meter is not None:
+            self.update_meter.start_keystroke()
+        state = self.state
+        # Previews published asynchronously and tabulations only set the Text control
+        state.result = self.result.value
+        preview_evaluator = self.preview_evaluator
+        if self.async_preview is not None:
+            # Whatever this key does, a preview of the previous expression is stale now
+            self.async_preview.cancel()
+            preview_evaluator = self.async_preview
+        handle_keyboard_batch(events, state, preview_evaluator, self.undo_history)
+        self.result.value = state.result
+        # The view renders its rows from the buffer, and only when the history changed
+        self.history.show(state.history_list)
+        # The token buffer is edited in place, the Text control only gets its rendered form
+        self.text.value = str(state.expression)
+
+        self.refresh_overlay()
+        self.refresh_display()
+
+    def refresh_display(self):
+        """Sends only the display controls whose value changed since they were last sent"""
+        instrumentation = get_instrumentation()
+        if instrumentation is None:
+            self.display.push(self.page)
+        else:
+            started = instrumentation.now()
+            self.display.push(self.page)
+            instrumentation.lap("ui_update", started)
+
+    def refresh_overlay(self, force: bool = False):
+        """Re-renders the debug overlay, at most every INSTRUMENTATION_OVERLAY_INTERVAL seconds"""
+        instrumentation = get_instrumentation()
+        if instrumentation is None or not self.debug_overlay.visible:
+            return
+        if force or monotonic() - self.overlay_refreshed >= INSTRUMENTATION_OVERLAY_INTERVAL:
+            self.debug_overlay.value = instrumentation.overlay_text()
+            self.overlay_refreshed = monotonic()
+
+    def publish_preview(self, result: str):
+        """Shows a preview evaluated by AsyncPreview, called on the event loop"""
+        self.state.result = self.result.value = result
+        self.refresh_display()
 
 
 
@@ -197,10 +417,11 @@ class CalculatorApp(ft.Column):
 # Main Page Setup
 # ------------------------------------------------------------------------------
 
-def main(page: Page):
+def main(page: Page, server: ServerResources | None = None):
     """
-    Sets up the calculator page
+    Sets up the calculator page, `server` holds the resources shared by the sessions in server mode
     """
+    mark_startup("page session started")
 
     # Page properties
     page.title = "Calculator"
@@ -212,10 +433,72 @@ def main(page: Page):
     page.vertical_alignment = MainAxisAlignment.CENTER
     page.horizontal_alignment = MainAxisAlignment.CENTER
 
-    calc_widget = CalculatorApp(page)
+    if server is None:
+        calc_widget = CalculatorApp(page)
+    else:
+        calc_widget = CalculatorApp(page, server.history_capacity, server.preview_executor, precision_selectable=False)
+        server.open_session()
+
+        def close_session(_event):
+            calc_widget.close()
+            server.close_session()
+
+        page.on_close = close_session
+    calc_widget.recorder = start_recording(page.session_id, calc_widget.state)
     # Set the keyboard event handler for the page, to enable keyboard input
     page.on_keyboard_event = calc_widget.handle_keyboard_input
     page.add(calc_widget)
+    mark_startup("first frame")
+
+    # The engines not needed for the first frame are loaded in the background while the user starts typing,
+    # a server loads them once before accepting sessions, so its startup ends with the first session's frame
+    if server is None:
+        Thread(target=warm_up_in_background, daemon=True).start()
+    else:
+        mark_startup("first session ready", final=True)
+
+
+def warm_up_in_background():
+    warm_up_engines()
+    mark_startup("engines warm", final=True)
+
 
 if __name__ == "__main__":
-    app(target=main, assets_dir="assets")
\ No newline at end of file
+    # Browser sessions served from one process (--server) share their evaluation resources, see server_mode.py
+    server = ServerResources() if is_server_requested() else None
+    if server is None:
+        # sympy evaluations run in a worker process with a deadline, so pathological input can't freeze the UI
+        evaluation_executor = EvaluationExecutor()
+        set_evaluation_executor(evaluation_executor)
+        # Calculations are kept across sessions, unless the log can't be opened (e.g. read-only home directory)
+        try:
+            history_log = HistoryLog(HISTORY_LOG_PATH)
+        except OSError:
+            history_log = None
+        set_history_log(history_log)
+    else:
+        history_log = None
+        warm_up_engines()
+        mark_startup("engines warm")
+    # Opt-in stage timing (--instrument), exported as JSON when the app exits
+    instrumentation = Instrumentation() if is_instrumentation_requested() else None
+    set_instrumentation(instrumentation)
+    # Opt-in keystroke recording (--record), replayed with `python -m benchmarks.replay`
+    set_recording_directory(RECORDING_DIRECTORY if is_recording_requested() else None)
+    mark_startup("evaluation workers and history log ready")
+    try:
+        if server is None:
+            app(target=main, assets_dir="assets")
+        else:
+            # No window or browser is opened, sessions connect to http://<host>:SERVER_PORT
+            app(target=partial(main, server=server), host=SERVER_HOST, port=SERVER_PORT, view=None, assets_dir="assets")
+    finally:
+        close_active_recorders()
+        if server is None:
+            evaluation_executor.shutdown()
+        else:
+            server.shutdown()
+        if history_log is not None:
+            history_log.close()
+        if instrumentation is not None:
+            instrumentation.dump(INSTRUMENTATION_EXPORT_PATH)
\ No newline at end of file
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from threading import Lock
+from constants import CALCULATION_CACHE_SIZE
+# ------------------------------------------------------------------------------
+
+
+class LRUCache:
+    """
+    Size-bounded mapping that evicts the least recently used entry first
+    and keeps hit / miss / eviction counters. Safe to share between threads.
+    """
+
+    def __init__(self, capacity: int = CALCULATION_CACHE_SIZE):
+        if capacity < 0:
+            raise ValueError("capacity must be >= 0")
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Returns the cached value and marks it as most recently used"""
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        """Stores a value, evicting the least recently used entries when full"""
+        if self.capacity == 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self._evict_overflow()
+
+    def resize(self, capacity: int) -> None:
+        """Changes the capacity, evicting entries right away if it shrinks"""
+        if capacity < 0:
+            raise ValueError("capacity must be >= 0")
+        with self.lock:
+            self.capacity = capacity
+            self._evict_overflow()
+
+    def clear(self) -> None:
+        """Drops every entry and resets the counters"""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Returns the counters as a plain dictionary"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _evict_overflow(self) -> None:
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,73 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count, environ
+from threading import Lock
+from constants import (
+    SERVER_CALCULATION_CACHE_SIZE,
+    SERVER_EVALUATION_WORKERS,
+    SERVER_HISTORY_CAPACITY,
+    SERVER_PREVIEW_THREADS,
+)
+from evaluation_executor import EvaluationExecutor
+from handle_keyboard_helpers import resize_calculation_cache, set_evaluation_executor, set_history_log
+# ------------------------------------------------------------------------------
+# Server mode, for serving many browser sessions from one process.
+#
+# Enabled with `python main.py --server` (or CALCULATOR_SERVER=1). Every
+# session still gets its own CalculatorApp, but the expensive parts are
+# shared: one pool of sympy worker processes sized to the cores, one
+# calculate() result cache (grown, since sessions repeat each other's
+# expressions) and one thread pool for the live previews. A session only
+# keeps a short in-memory history; the persistent history log is disabled so
+# users never see each other's calculations.
+# ------------------------------------------------------------------------------
+
+SERVER_FLAG = "--server"
+SERVER_VARIABLE = "CALCULATOR_SERVER"
+
+
+class ServerResources:
+    """Evaluation resources shared by every session of the process"""
+
+    history_capacity = SERVER_HISTORY_CAPACITY
+
+    def __init__(
+        self,
+        workers: int | None = SERVER_EVALUATION_WORKERS,
+        preview_threads: int = SERVER_PREVIEW_THREADS,
+        cache_size: int = SERVER_CALCULATION_CACHE_SIZE,
+    ):
+        self.evaluation_executor = EvaluationExecutor(workers=workers or cpu_count() or 1)
+        self.preview_executor = ThreadPoolExecutor(max_workers=preview_threads, thread_name_prefix="preview")
+        self.lock = Lock()
+        self.sessions = 0
+        self.total_sessions = 0
+        set_evaluation_executor(self.evaluation_executor)
+        set_history_log(None)
+        resize_calculation_cache(cache_size)
+
+    def open_session(self) -> None:
+        with self.lock:
+            self.sessions += 1
+            self.total_sessions += 1
+
+    def close_session(self) -> None:
+        with self.lock:
+            self.sessions -= 1
+
+    def stats(self) -> dict:
+        return {
+            "sessions": self.sessions,
+            "total_sessions": self.total_sessions,
+            "executor": self.evaluation_executor.stats(),
+        }
+
+    def shutdown(self) -> None:
+        self.preview_executor.shutdown(wait=False, cancel_futures=True)
+        set_evaluation_executor(None)
+        self.evaluation_executor.shutdown()
+
+
+def is_server_requested() -> bool:
+    """Checks for `python main.py --server` or CALCULATOR_SERVER=1"""
+    return SERVER_FLAG in sys.argv or environ.get(SERVER_VARIABLE, "") not in ("", "0")
@@ -0,0 +1,167 @@
+import gzip
+import sys
+from json import dumps, loads
+from os import environ, makedirs
+from os.path import join
+from re import compile as re_compile
+from threading import Lock
+from time import monotonic_ns, strftime
+from flet import KeyboardEvent
+from calculator_state import CalculatorState
+# ------------------------------------------------------------------------------
+# Opt-in keystroke recording, for replaying real sessions headlessly.
+#
+# Enabled with `python main.py --record` (or CALCULATOR_RECORD=1), every
+# session writes the events it handles to its own gzipped JSON-lines file in
+# RECORDING_DIRECTORY. Line one holds the format version and the history the
+# session started with, then one compact array per event:
+#
+#     [milliseconds since the previous event, "k", key, modifiers]   keyboard
+#     [milliseconds since the previous event, "b", control data]     button
+#     [milliseconds since the previous event, "p", text]             paste
+#
+# (modifiers: shift 1, ctrl 2, alt 4, meta 8), and the last line holds the
+# session's end state. `python -m benchmarks.replay` feeds recordings back
+# through the handlers and checks that they end in the same state.
+# ------------------------------------------------------------------------------
+
+RECORD_FLAG = "--record"
+RECORD_VARIABLE = "CALCULATOR_RECORD"
+FORMAT_VERSION = 1
+MODIFIERS = (("shift", 1), ("ctrl", 2), ("alt", 4), ("meta", 8))
+UNSAFE_CHARACTER_PATTERN = re_compile(r"[^\w-]")
+
+# Directory new sessions are recorded into, None records nothing (see set_recording_directory)
+recording_directory = None
+
+# Recorders of the sessions still open, closed by close_active_recorders when the app exits
+active_recorders = set()
+active_recorders_lock = Lock()
+
+
+class SessionRecorder:
+    """Writes the events one session handles, with their timing, and the state it ends in"""
+
+    def __init__(self, path: str, state: CalculatorState):
+        self.path = path
+        self.state = state
+        self.file = gzip.open(path, "wt", encoding="utf-8") if path.endswith(".gz") else open(path, "w", encoding="utf-8")
+        self.lock = Lock()
+        self.previous = monotonic_ns()
+        self.events = 0
+        self.write_line({"version": FORMAT_VERSION, "recorded_at": strftime("%Y-%m-%dT%H:%M:%S%z"), "history": list(state.history_list)})
+        with active_recorders_lock:
+            active_recorders.add(self)
+
+    def record_event(self, event) -> None:
+        """Records a keyboard event or a button click"""
+        if isinstance(event, KeyboardEvent):
+            modifiers = sum(bit for name, bit in MODIFIERS if getattr(event, name, False))
+            self.record(["k", event.key, modifiers])
+        else:
+            self.record(["b", event.control.data])
+
+    def record_paste(self, text: str) -> None:
+        self.record(["p", text])
+
+    def record(self, fields: list) -> None:
+        with self.lock:
+            if self.file is None:
+                return
+            now = monotonic_ns()
+            self.write_line([round((now - self.previous) / 1e6), *fields])
+            self.previous = now
+            self.events += 1
+
+    def write_line(self, value) -> None:
+        self.file.write(dumps(value, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def close(self) -> None:
+        """Writes the end state and closes the file, later events are ignored"""
+        with active_recorders_lock:
+            active_recorders.discard(self)
+        with self.lock:
+            if self.file is None:
+                return
+            self.write_line({"end": state_snapshot(self.state)})
+            self.file.close()
+            self.file = None
+
+
+class RecordedSession:
+    """A recording read back: the starting history, the events and the end state (None if it wasn't closed)"""
+
+    def __init__(self, path: str, history: list[str], events: list[tuple], end: dict | None):
+        self.path = path
+        self.history = history
+        # (seconds since the first event, kind, value, modifiers)
+        self.events = events
+        self.end = end
+
+
+def state_snapshot(state: CalculatorState) -> dict:
+    """The parts of a state replays are compared on"""
+    return {"expression": str(state.expression), "result": str(state.result), "history": list(state.history_list)}
+
+
+def read_session(path: str) -> RecordedSession:
+    """Reads a recording, raises ValueError for files that aren't one"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        try:
+            header = loads(file.readline())
+        except ValueError:
+            raise ValueError(f"{path}: not a session recording")
+        if not isinstance(header, dict) or header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: not a version {FORMAT_VERSION} session recording")
+        events = []
+        end = None
+        offset = 0.0
+        for line in file:
+            # A recording cut short (e.g. the app was killed) may end in a partial line
+            try:
+                fields = loads(line)
+            except ValueError:
+                break
+            if isinstance(fields, dict):
+                end = fields.get("end")
+                break
+            offset += fields[0] / 1000
+            events.append((offset, fields[1], fields[2], fields[3] if len(fields) > 3 else 0))
+    return RecordedSession(path, header.get("history", []), events, end)
+
+
+def session_path(directory: str, session_id: str) -> str:
+    """A new file name for a session, e.g. session-20260101-120000-3f2a9c1d.jsonl.gz"""
+    makedirs(directory, exist_ok=True)
+    session = UNSAFE_CHARACTER_PATTERN.sub("", session_id)[:8] or "desktop"
+    return join(directory, f"session-{strftime('%Y%m%d-%H%M%S')}-{session}.jsonl.gz")
+
+
+def start_recording(session_id: str, state: CalculatorState) -> SessionRecorder | None:
+    """Starts recording a session when recording is enabled, returns None when it isn't or the file can't be created"""
+    if recording_directory is None:
+        return None
+    try:
+        return SessionRecorder(session_path(recording_directory, session_id), state)
+    except OSError as error:
+        print(f"session not recorded: {error}", file=sys.stderr)
+        return None
+
+
+def close_active_recorders() -> None:
+    with active_recorders_lock:
+        recorders = list(active_recorders)
+    for recorder in recorders:
+        recorder.close()
+
+
+def set_recording_directory(directory: str | None) -> None:
+    """Records the sessions started from now on into `directory` (None stops recording new sessions)"""
+    global recording_directory
+    recording_directory = directory
+
+
+def is_recording_requested() -> bool:
+    """Checks for `python main.py --record` or CALCULATOR_RECORD=1"""
+    return RECORD_FLAG in sys.argv or environ.get(RECORD_VARIABLE, "") not in ("", "0")
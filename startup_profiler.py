@@ -0,0 +1,98 @@
+import builtins
+import sys
+from os import environ
+from threading import local
+from time import perf_counter
+# ------------------------------------------------------------------------------
+# Cold-start profiler.
+#
+# Enabled with `python main.py --profile-startup` (or CALCULATOR_PROFILE_STARTUP=1),
+# it times every module imported after this one (cumulative and self time) and
+# records startup milestones up to the first frame, then prints a report to
+# stderr. It must be the first import of main.py to see the other imports.
+# ------------------------------------------------------------------------------
+
+PROFILE_STARTUP_FLAG = "--profile-startup"
+PROFILE_STARTUP_VARIABLE = "CALCULATOR_PROFILE_STARTUP"
+# Number of slowest imports listed in the report
+REPORTED_IMPORTS = 15
+
+
+class StartupProfiler:
+    """Records import times per module and named milestones, in seconds since it was created"""
+
+    def __init__(self):
+        self.start = perf_counter()
+        # module name -> (cumulative seconds, self seconds), for the first import only
+        self.imports = {}
+        self.milestones = []
+        self.original_import = None
+        # Per-thread stacks of the time spent in nested imports
+        self.nesting = local()
+
+    def install(self) -> None:
+        """Starts timing imports"""
+        if self.original_import is None:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.timed_import
+
+    def uninstall(self) -> None:
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+        stack = getattr(self.nesting, "stack", None)
+        if stack is None:
+            stack = self.nesting.stack = []
+        stack.append(0.0)
+        start = perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.imports.setdefault(name, (elapsed, elapsed - nested))
+
+    def mark(self, milestone: str) -> float:
+        """Records a milestone, returns the seconds elapsed since the profiler started"""
+        elapsed = perf_counter() - self.start
+        self.milestones.append((milestone, elapsed))
+        return elapsed
+
+    def report(self, top: int = REPORTED_IMPORTS) -> str:
+        lines = ["Startup milestones (ms since the profiler started):"]
+        lines += [f"  {elapsed * 1000:9.1f}  {milestone}" for milestone, elapsed in self.milestones]
+        lines.append(f"Slowest imports (of {len(self.imports)}), cumulative / self ms:")
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        lines += [f"  {total * 1000:9.1f} {own * 1000:9.1f}  {name}" for name, (total, own) in slowest]
+        return "\n".join(lines)
+
+
+def is_profiling_requested() -> bool:
+    return PROFILE_STARTUP_FLAG in sys.argv or environ.get(PROFILE_STARTUP_VARIABLE, "") not in ("", "0")
+
+
+# The profiler exists (and times imports) only when requested
+startup_profiler = StartupProfiler() if is_profiling_requested() else None
+if startup_profiler is not None:
+    startup_profiler.install()
+
+
+def mark_startup(milestone: str, final: bool = False) -> None:
+    """
+    Records a startup milestone when profiling, `final` stops timing imports and prints the report.
+    Milestones after the final one (e.g. the first frames of later server sessions) are ignored.
+    """
+    global startup_profiler
+    if startup_profiler is None:
+        return
+    startup_profiler.mark(milestone)
+    if final:
+        startup_profiler.uninstall()
+        print(startup_profiler.report(), file=sys.stderr)
+        startup_profiler = None
@@ -0,0 +1,299 @@
+import sys
+from argparse import ArgumentParser
+from math import isfinite, nan
+from re import compile as re_compile
+from time import perf_counter
+from tokenize import TokenError
+from constants import (
+    TABULATION_CACHE_SIZE,
+    TABULATION_MAX_ROOTS,
+    TABULATION_POINTS,
+    TABULATION_RANGE,
+    TABULATION_TABLE_ROWS,
+    TABULATION_TIMEOUT,
+)
+from fast_arithmetic import format_result
+from result_cache import LRUCache
+# ------------------------------------------------------------------------------
+# Variable mode: an expression in x tabulated over a range.
+#
+# The expression (the calculator's syntax, i.e. ^, % and implied
+# multiplication, plus x, pi, e and sin, cos, log, exp, sqrt, ...) is parsed
+# by sympy once and compiled with lambdify into a NumPy callable, so a range
+# of 10^6 points is evaluated in a few vectorized passes instead of point by
+# point. Compiled callables are cached per expression. Without NumPy the
+# callable is compiled for the math module and evaluated in a loop instead.
+# Parsing folds constants exactly (9^9^9 never finishes), so the calculator
+# tabulates in its deadline-bounded sympy workers (see tabulate_in_worker).
+#
+#     python tabulation.py "sin(x)/x" --start -10 --stop 10 --points 1000000
+# ------------------------------------------------------------------------------
+
+VARIABLE = "x"
+# Names accepted besides x, and the sympy name of those spelled differently
+FUNCTION_NAMES = {
+    "sin", "cos", "tan", "asin", "acos", "atan", "sinh", "cosh", "tanh",
+    "exp", "log", "ln", "sqrt", "abs", "pi", "e",
+}
+SYMPY_NAMES = {"ln": "log", "abs": "Abs", "e": "E"}
+
+VARIABLE_EXPRESSION_PATTERN = re_compile(r"[0-9a-z.+\-*/%^()\s]+")
+NAME_PATTERN = re_compile(r"[a-z]+")
+# Formulas over named columns (see column_evaluation.py)
+FORMULA_PATTERN = re_compile(r"[\w.+\-*/%^()\s]+")
+IDENTIFIER_PATTERN = re_compile(r"[A-Za-z_]\w*")
+
+compiled_functions = LRUCache(TABULATION_CACHE_SIZE)
+
+
+class VariableExpressionError(ValueError):
+    """Raised for text that isn't an expression in x the variable mode can compile"""
+
+
+class Tabulation:
+    """Summary of an expression's values over a range: extrema, roots and a few evenly spaced rows"""
+
+    def __init__(self, expression: str, start: float, stop: float, points: int):
+        self.expression = expression
+        self.start = start
+        self.stop = stop
+        self.points = points
+        # (x, y) pairs, None when no point of the range is defined
+        self.minimum = None
+        self.maximum = None
+        self.roots = []
+        self.root_count = 0
+        self.undefined = 0
+        self.rows = []
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        """One line, e.g. for the calculator's result display"""
+        if self.minimum is None:
+            return "undefined on the range"
+        parts = [
+            f"min {format_number(self.minimum[1])} at x={format_number(self.minimum[0])}",
+            f"max {format_number(self.maximum[1])} at x={format_number(self.maximum[0])}",
+        ]
+        if self.root_count:
+            listed = ", ".join(format_number(root) for root in self.roots)
+            more = f" (+{self.root_count - len(self.roots)})" if self.root_count > len(self.roots) else ""
+            parts.append(f"{self.root_count} root{'s' if self.root_count > 1 else ''}: {listed}{more}")
+        else:
+            parts.append("no roots")
+        return ", ".join(parts)
+
+    def table(self) -> str:
+        lines = [f"{'x':>14}  {'f(x)':>14}"]
+        lines += [f"{format_number(x):>14}  {format_number(y):>14}" for x, y in self.rows]
+        if self.undefined:
+            lines.append(f"({self.undefined} of {self.points} points undefined)")
+        return "\n".join(lines)
+
+
+def is_variable_expression(text: str) -> bool:
+    """
+    Tells expressions in x apart from plain calculator input. Text without x is never one, even with
+    names such as e in "2e" or the exponent of a displayed result like "1.0000e-5".
+    """
+    if not VARIABLE_EXPRESSION_PATTERN.fullmatch(text):
+        return False
+    names = NAME_PATTERN.findall(text)
+    return VARIABLE in names and all(name == VARIABLE or name in FUNCTION_NAMES for name in names)
+
+
+def compile_expression(expression: str):
+    """
+    Returns a callable of x for the expression, vectorized over NumPy arrays when NumPy is installed,
+    and the numpy module (None without it). Raises VariableExpressionError for invalid input.
+    """
+    key = "".join(expression.split())
+    compiled = compiled_functions.get(key)
+    if compiled is not None:
+        return compiled
+    if not is_variable_expression(key):
+        raise VariableExpressionError(f"not an expression in {VARIABLE}: {expression!r}")
+
+    (variable,), parsed = parse_formula(key, (VARIABLE,))
+    from sympy import lambdify
+
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    function = lambdify(variable, parsed, modules="numpy" if numpy is not None else "math")
+    compiled = (function, numpy)
+    compiled_functions.put(key, compiled)
+    return compiled
+
+
+def parse_formula(text: str, variables) -> tuple:
+    """
+    Parses the calculator's syntax (^, %, implied multiplication) with the given variable names and the
+    FUNCTION_NAMES. Returns the variables' sympy symbols (in the given order) and the expression,
+    raises VariableExpressionError for anything else.
+    """
+    if not FORMULA_PATTERN.fullmatch(text):
+        raise VariableExpressionError(f"unexpected characters in {text!r}")
+    unknown = sorted({name for name in IDENTIFIER_PATTERN.findall(text) if name not in variables and name not in FUNCTION_NAMES})
+    if unknown:
+        raise VariableExpressionError(f"unknown names in {text!r}: {', '.join(unknown)}")
+
+    # Only loaded once a formula is compiled, like sympy in calculate
+    from sympy import Symbol, SympifyError, sympify
+    from sympy.parsing.sympy_parser import (
+        convert_xor,
+        implicit_multiplication_application,
+        parse_expr,
+        standard_transformations,
+    )
+
+    symbols = tuple(Symbol(name) for name in variables)
+    names = {**{name: sympify(sympy_name) for name, sympy_name in SYMPY_NAMES.items()}, **dict(zip(variables, symbols))}
+    try:
+        # Safe to evaluate: the text was checked to only hold numbers, operators and the names above
+        parsed = parse_expr(
+            text,
+            local_dict=names,
+            transformations=standard_transformations + (implicit_multiplication_application, convert_xor),
+        )
+    except (SympifyError, SyntaxError, TokenError, TypeError, ValueError) as error:
+        raise VariableExpressionError(f"can't parse {text!r}") from error
+    return symbols, parsed
+
+
+def tabulate(
+    expression: str,
+    start: float = TABULATION_RANGE[0],
+    stop: float = TABULATION_RANGE[1],
+    points: int = TABULATION_POINTS,
+) -> Tabulation:
+    """Evaluates the expression at `points` evenly spaced x from `start` to `stop` and summarizes the values"""
+    if points < 2 or not start < stop:
+        raise ValueError("a range needs start < stop and at least 2 points")
+    function, numpy = compile_expression(expression)
+    tabulation = Tabulation(expression, start, stop, points)
+    started = perf_counter()
+    if numpy is not None:
+        summarize_vectorized(tabulation, function, numpy)
+    else:
+        summarize_pointwise(tabulation, function)
+    tabulation.seconds = perf_counter() - started
+    return tabulation
+
+
+def tabulate_in_worker(expression: str, executor, timeout: float = TABULATION_TIMEOUT) -> Tabulation:
+    """
+    Tabulates over the default range in one of the EvaluationExecutor's workers, inline without one.
+    Raises EvaluationTimeout / EvaluationBusy like EvaluationExecutor.run, VariableExpressionError for invalid input.
+    """
+    if executor is None:
+        return tabulate(expression)
+    return executor.run(tabulate, (expression,), timeout)
+
+
+def summarize_vectorized(tabulation: Tabulation, function, numpy) -> None:
+    xs = numpy.linspace(tabulation.start, tabulation.stop, tabulation.points)
+
+    def evaluate(at):
+        # Constant expressions give a scalar, complex values (e.g. sqrt of a negative constant) are undefined
+        values = numpy.asarray(function(at))
+        if numpy.iscomplexobj(values):
+            values = numpy.where(values.imag == 0, values.real, nan)
+        return numpy.broadcast_to(values.astype(float), at.shape)
+
+    with numpy.errstate(all="ignore"):
+        ys = evaluate(xs)
+        finite = numpy.isfinite(ys)
+        tabulation.undefined = int(tabulation.points - numpy.count_nonzero(finite))
+        if tabulation.undefined == tabulation.points:
+            return
+        defined = numpy.where(finite, ys, nan)
+        low, high = int(numpy.nanargmin(defined)), int(numpy.nanargmax(defined))
+        tabulation.minimum = (float(xs[low]), float(ys[low]))
+        tabulation.maximum = (float(xs[high]), float(ys[high]))
+
+        # Exact zeros count once per run of zeros, sign changes are interpolated
+        zero = ys == 0
+        zeros = numpy.flatnonzero(zero & ~numpy.concatenate(([False], zero[:-1])))
+        left, right = ys[:-1], ys[1:]
+        crossings = numpy.flatnonzero(finite[:-1] & finite[1:] & (numpy.sign(left) * numpy.sign(right) < 0))
+        roots = xs[crossings] - left[crossings] * (xs[crossings + 1] - xs[crossings]) / (right[crossings] - left[crossings])
+        # A pole (e.g. tan at pi/2) changes sign as well, but the function isn't smaller between its neighbours
+        at_roots = numpy.abs(evaluate(roots))
+        roots = roots[at_roots <= numpy.minimum(numpy.abs(left[crossings]), numpy.abs(right[crossings]))]
+        all_roots = numpy.sort(numpy.concatenate((xs[zeros], roots)))
+
+    tabulation.root_count = int(all_roots.size)
+    tabulation.roots = [float(root) for root in all_roots[:TABULATION_MAX_ROOTS]]
+    rows = numpy.linspace(0, tabulation.points - 1, min(TABULATION_TABLE_ROWS, tabulation.points)).round().astype(int)
+    tabulation.rows = [(float(xs[row]), float(ys[row])) for row in rows]
+
+
+def summarize_pointwise(tabulation: Tabulation, function) -> None:
+    """The same summary without NumPy, one point at a time"""
+
+    def evaluate(x: float) -> float:
+        try:
+            value = function(x)
+            return float(value) if not isinstance(value, complex) or value.imag == 0 else nan
+        except (ArithmeticError, ValueError, TypeError):
+            # e.g. log(0), sqrt(-1), 1/0 with the math module
+            return nan
+
+    points = tabulation.points
+    step = (tabulation.stop - tabulation.start) / (points - 1)
+    rows = {round(index * (points - 1) / (TABULATION_TABLE_ROWS - 1)) for index in range(TABULATION_TABLE_ROWS)}
+    roots = []
+    previous_x = previous_y = None
+    for index in range(points):
+        x = tabulation.start + index * step if index < points - 1 else tabulation.stop
+        y = evaluate(x)
+        if index in rows:
+            tabulation.rows.append((x, y))
+        if not isfinite(y):
+            tabulation.undefined += 1
+            previous_x = previous_y = None
+            continue
+        if tabulation.minimum is None or y < tabulation.minimum[1]:
+            tabulation.minimum = (x, y)
+        if tabulation.maximum is None or y > tabulation.maximum[1]:
+            tabulation.maximum = (x, y)
+        if y == 0:
+            if previous_y != 0:
+                roots.append(x)
+        elif previous_y is not None and previous_y != 0 and (previous_y < 0) != (y < 0):
+            root = previous_x - previous_y * (x - previous_x) / (y - previous_y)
+            if abs(evaluate(root)) <= min(abs(previous_y), abs(y)):
+                roots.append(root)
+        previous_x, previous_y = x, y
+    tabulation.root_count = len(roots)
+    tabulation.roots = roots[:TABULATION_MAX_ROOTS]
+
+
+def format_number(value: float) -> str:
+    """Formats like the calculator's non-integer results, at the result precision"""
+    return format_result(value) if isfinite(value) else "undefined"
+
+
+def main(arguments: list[str] | None = None) -> int:
+    parser = ArgumentParser(description="Tabulates an expression in x over a range")
+    parser.add_argument("expression", help='e.g. "sin(x)/x" or "x^3-2x"')
+    parser.add_argument("--start", type=float, default=TABULATION_RANGE[0])
+    parser.add_argument("--stop", type=float, default=TABULATION_RANGE[1])
+    parser.add_argument("--points", type=int, default=TABULATION_POINTS)
+    options = parser.parse_args(arguments)
+
+    try:
+        tabulation = tabulate(options.expression, options.start, options.stop, options.points)
+    except (VariableExpressionError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(tabulation.table())
+    print(tabulation.summary())
+    print(f"({options.points} points in {tabulation.seconds * 1000:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+"""
+The cheap evaluation backends and the incremental preview must return exactly what sympy and
+`calculate` return. Random expressions are generated from a fixed seed, so a failure always reproduces.
+"""
+import random
+
+import pytest
+
+from benchmarks.corpus import CORPUS
+from evaluation_backends import backends
+from fast_arithmetic import UnsupportedExpression
+from handle_keyboard_helpers import calculate, evaluate_with_sympy, get_precision, insert_implied_multiplication, set_precision
+from incremental_preview import IncrementalEvaluator
+# ------------------------------------------------------------------------------
+
+SEED = 2024
+RANDOM_EXPRESSIONS = 200
+BINARY_OPERATORS = ("+", "-", "*", "/", "//", "%", "**", "^")
+
+
+def random_number(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.5:
+        return str(rng.randint(0, 12))
+    if kind < 0.7:
+        return str(rng.randint(10**15, 10**25))
+    if kind < 0.9:
+        return f"{rng.randint(0, 99)}.{rng.randint(0, 999)}"
+    return rng.choice((".5", "3.", "0.001"))
+
+
+def random_operand(rng: random.Random, depth: int) -> str:
+    operand = f"({random_expression(rng, depth + 1)})" if depth < 3 and rng.random() < 0.25 else random_number(rng)
+    return ("-" if rng.random() < 0.1 else "") + operand
+
+
+def random_expression(rng: random.Random, depth: int = 0) -> str:
+    """Well-formed calculator input: numbers, the binary operators, unary minus and nested groups"""
+    parts = [random_operand(rng, depth)]
+    for _ in range(rng.randint(0, 4)):
+        # Small, unchained exponents keep sympy's side of the comparison fast
+        operator = rng.choice(BINARY_OPERATORS[:-2] if parts[-2:-1] in (["**"], ["^"]) else BINARY_OPERATORS)
+        right = str(rng.randint(0, 6)) if operator in ("**", "^") else random_operand(rng, depth)
+        parts += [operator, right]
+    return "".join(parts)
+
+
+def expressions() -> list[str]:
+    rng = random.Random(SEED)
+    corpus = [expression for group in CORPUS.values() for expression in group]
+    return corpus + [random_expression(rng) for _ in range(RANDOM_EXPRESSIONS)]
+
+
+def outcome(function, *arguments):
+    """The result, or the type of the exception raised instead"""
+    try:
+        return function(*arguments)
+    except Exception as error:
+        return type(error)
+
+
+@pytest.fixture(params=[5, 50], ids=lambda digits: f"{digits}_digits")
+def precision(request):
+    previous = get_precision()
+    set_precision(request.param)
+    yield request.param
+    set_precision(previous)
+
+
+def test_cheap_backends_match_sympy(precision):
+    cheap_backends = [backend for backend in backends if backend.name != "sympy"]
+    compared = 0
+    for expression in expressions():
+        processed = insert_implied_multiplication(expression)
+        expected = outcome(evaluate_with_sympy, processed)
+        for backend in cheap_backends:
+            try:
+                result = backend.evaluate(processed)
+            except UnsupportedExpression:
+                continue
+            assert result == expected, f"{backend.name} backend on {expression!r}"
+            compared += 1
+    # Most of the generated expressions must actually be taken by a cheap backend
+    assert compared > RANDOM_EXPRESSIONS // 2
+
+
+def test_incremental_preview_matches_calculate(precision):
+    for expression in expressions():
+        evaluator = IncrementalEvaluator(speculative=False)
+        for end in range(1, len(expression) + 1):
+            prefix = expression[:end]
+            assert outcome(evaluator.preview, prefix) == outcome(calculate, prefix), f"preview of {prefix!r}"
+
+
+def test_speculative_preview_only_changes_incomplete_input():
+    for expression in expressions():
+        evaluator = IncrementalEvaluator()
+        for end in range(1, len(expression) + 1):
+            prefix = expression[:end]
+            expected = outcome(calculate, prefix)
+            if expected != prefix:
+                # Complete input, there is nothing to speculate about
+                assert outcome(evaluator.preview, prefix) == expected, f"preview of {prefix!r}"
+            else:
+                evaluator.preview(prefix)
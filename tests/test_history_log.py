@@ -0,0 +1,67 @@
+"""
+A history log left behind by a crash (a torn last line, a stale or missing index) must reopen
+with exactly its complete entries, and keep appending after them.
+"""
+import os
+
+import pytest
+
+from history_log import OFFSET, HistoryLog
+# ------------------------------------------------------------------------------
+
+ENTRIES = [f"{number}*{number} = {number * number}" for number in range(50)]
+
+
+@pytest.fixture
+def log_path(tmp_path) -> str:
+    path = str(tmp_path / "history.log")
+    with HistoryLog(path) as log:
+        for entry in ENTRIES:
+            log.append(entry)
+    return path
+
+
+def reopened_entries(path: str) -> list[str]:
+    with HistoryLog(path) as log:
+        assert len(log) == len(log.latest(len(ENTRIES) + 10))
+        return log.latest(len(ENTRIES) + 10)
+
+
+def test_reopen_keeps_every_entry(log_path):
+    assert reopened_entries(log_path) == ENTRIES
+
+
+def test_torn_last_line_is_dropped(log_path):
+    with open(log_path, "ab") as log_file:
+        log_file.write(b"7*")
+    assert reopened_entries(log_path) == ENTRIES
+
+    # An entry cut off before its index record was written
+    with open(log_path, "r+b") as log_file:
+        log_file.truncate(os.path.getsize(log_path) - 3)
+    assert reopened_entries(log_path) == ENTRIES[:-1]
+
+
+def test_stale_index_is_rebuilt(log_path):
+    index_path = log_path + ".idx"
+    # A torn index record, then one too few records, then no index at all
+    with open(index_path, "ab") as index_file:
+        index_file.write(b"\x01\x02")
+    assert reopened_entries(log_path) == ENTRIES
+
+    with open(index_path, "r+b") as index_file:
+        index_file.truncate(os.path.getsize(index_path) - OFFSET.size)
+    assert reopened_entries(log_path) == ENTRIES
+
+    os.remove(index_path)
+    assert reopened_entries(log_path) == ENTRIES
+
+
+def test_appends_after_recovery(log_path):
+    with open(log_path, "ab") as log_file:
+        log_file.write(b"1+")
+    with HistoryLog(log_path) as log:
+        log.append("1+1 = 2")
+        assert log.latest(2) == [ENTRIES[-1], "1+1 = 2"]
+        assert log.search("1+1") == ["1+1 = 2"]
+    assert reopened_entries(log_path) == ENTRIES + ["1+1 = 2"]
@@ -0,0 +1,116 @@
+"""
+Batched input must end in the same state as one handle_keyboard_input call per event, and undo / redo
+must restore every earlier state exactly. Key sequences are generated from a fixed seed.
+"""
+import random
+
+from benchmarks.common import button_event
+from calculator_state import CalculatorState
+from expression_buffer import ExpressionBuffer
+from handle_keyboard_helpers import handle_keyboard_batch, handle_keyboard_input
+from history_buffer import HistoryBuffer
+from incremental_preview import IncrementalEvaluator
+from undo_history import REDO_EVENT, UNDO_EVENT, UndoHistory
+# ------------------------------------------------------------------------------
+
+SEED = 2024
+SEQUENCES = 150
+KEYS_PER_SEQUENCE = 40
+# "/" is left out: "//0" and "%0" make sympy raise, which is no state to compare
+KEYS = [*"0123456789.+-*()", "0", "0", "=", "Enter", "C", "Backspace", "e"]
+# A small history, so undo / redo also cover the ring buffer dropping its oldest entry
+HISTORY_CAPACITY = 3
+
+
+def key_sequences() -> list[list[str]]:
+    rng = random.Random(SEED)
+    return [[rng.choice(KEYS) for _ in range(KEYS_PER_SEQUENCE)] for _ in range(SEQUENCES)]
+
+
+def snapshot(state: CalculatorState) -> tuple:
+    return (str(state.expression), state.result, list(state.history_list))
+
+
+def test_batch_matches_sequential_events():
+    rng = random.Random(SEED)
+    compared = 0
+    for keys in key_sequences():
+        sequential = CalculatorState(ExpressionBuffer(), "", HistoryBuffer(HISTORY_CAPACITY))
+        evaluator = IncrementalEvaluator()
+        try:
+            for key in keys:
+                handle_keyboard_input(button_event(key), sequential, evaluator)
+        except (TypeError, ValueError, ZeroDivisionError):
+            # sympy raising on input such as "()" is left out, calculate doesn't handle it either way
+            continue
+
+        batched = CalculatorState(ExpressionBuffer(), "", HistoryBuffer(HISTORY_CAPACITY))
+        evaluator = IncrementalEvaluator()
+        events = [button_event(key) for key in keys]
+        while events:
+            size = rng.randint(1, 8)
+            handle_keyboard_batch(events[:size], batched, evaluator)
+            del events[:size]
+        assert snapshot(batched) == snapshot(sequential), "".join(keys)
+        compared += 1
+    assert compared > SEQUENCES // 2
+
+
+def test_undo_redo_restore_every_state():
+    rng = random.Random(SEED)
+    for keys in key_sequences():
+        state = CalculatorState(ExpressionBuffer(), "", HistoryBuffer(HISTORY_CAPACITY))
+        evaluator = IncrementalEvaluator()
+        undo_history = UndoHistory()
+        # The state after each recorded step, states[position] is the current one
+        states = [snapshot(state)]
+        position = 0
+        try:
+            for key in keys:
+                roll = rng.random()
+                if roll < 0.2:
+                    handle_keyboard_batch([UNDO_EVENT], state, evaluator, undo_history)
+                    position = max(position - 1, 0)
+                    assert snapshot(state) == states[position]
+                elif roll < 0.3:
+                    handle_keyboard_batch([REDO_EVENT], state, evaluator, undo_history)
+                    position = min(position + 1, len(states) - 1)
+                    assert snapshot(state) == states[position]
+                else:
+                    steps = len(undo_history)
+                    handle_keyboard_batch([button_event(key)], state, evaluator, undo_history)
+                    if len(undo_history) > steps:
+                        del states[position + 1:]
+                        states.append(snapshot(state))
+                        position += 1
+                    else:
+                        # Only the preview of an unchanged expression, which isn't a step
+                        states[position] = snapshot(state)
+        except (TypeError, ValueError, ZeroDivisionError):
+            continue
+
+        # All the way back and forward again
+        while undo_history.undo(state):
+            position -= 1
+        assert position == 0 and (str(state.expression), list(state.history_list)) == states[0][::2]
+        while undo_history.redo(state):
+            position += 1
+        assert position == len(states) - 1
+        assert (str(state.expression), list(state.history_list)) == states[-1][::2]
+
+        # The token buffer must be the one typing the restored text would give
+        typed = ExpressionBuffer(str(state.expression))
+        assert (state.expression.length, state.expression.open_parentheses) == (typed.length, typed.open_parentheses)
+
+
+def test_undo_memory_limit_drops_oldest_steps():
+    state = CalculatorState(ExpressionBuffer(), "", HistoryBuffer(HISTORY_CAPACITY))
+    undo_history = UndoHistory(memory_limit=4096)
+    for key in "12+34*56-" * 200:
+        handle_keyboard_batch([button_event(key)], state, None, undo_history)
+    assert undo_history.size <= undo_history.memory_limit
+    assert undo_history.dropped > 0
+    while undo_history.undo(state):
+        pass
+    # The oldest steps are gone, undoing stops at the text typed before the kept ones
+    assert str(state.expression) == ("12+34*56-" * 200)[:undo_history.dropped]
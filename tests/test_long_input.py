@@ -0,0 +1,67 @@
+"""
+Expressions of any length can be typed and pasted: the input isn't capped, and integer literals past
+Python's 4300 digit str-to-int limit are evaluated (or echoed back) instead of raising.
+"""
+from benchmarks.common import button_event
+from calculator_state import CalculatorState
+from expression_buffer import ExpressionBuffer
+from fast_arithmetic import MAX_EXACT_DIGITS
+from handle_keyboard_helpers import (
+    LEADING_ZEROS_PATTERN,
+    calculate,
+    calculate_full,
+    evaluate_with_sympy,
+    handle_keyboard_batch,
+    handle_keyboard_input,
+    update_expression,
+)
+from history_buffer import HistoryBuffer
+from incremental_preview import IncrementalEvaluator
+# ------------------------------------------------------------------------------
+
+LONG_LITERAL = "9" * 5000
+
+
+def new_state() -> CalculatorState:
+    return CalculatorState(ExpressionBuffer(), "", HistoryBuffer())
+
+
+def test_typing_past_fifteen_characters():
+    state = new_state()
+    evaluator = IncrementalEvaluator()
+    keys = "12+3*(4-5)/7-" * 20 + "1"
+    for key in keys:
+        handle_keyboard_input(button_event(key), state, evaluator)
+    assert str(state.expression) == keys
+    assert state.result == calculate(keys)
+
+
+def test_leading_zeros_match_rescanning_the_whole_expression():
+    # Only the last number is rescanned when a digit is typed, the result must be what the full rewrite gives
+    for expression in ("100+" * 500 + "00", "100+" * 500 + "007", "0.00", "(0)(00", "0"):
+        assert update_expression("7", expression) == LEADING_ZEROS_PATTERN.sub("", expression) + "7"
+
+
+def test_long_integer_literals():
+    assert calculate(LONG_LITERAL) == "1.0000e+5000"
+    # The literal is exact, not a float
+    assert calculate_full(LONG_LITERAL + "+1") == "1" + "0" * 5000
+    assert calculate(LONG_LITERAL + "-" + LONG_LITERAL) == "0"
+
+
+def test_long_literal_preview_and_paste():
+    state = new_state()
+    handle_keyboard_batch([LONG_LITERAL[:4400]], state, IncrementalEvaluator())
+    assert state.result == "1.0000e+4400"
+
+    evaluator = IncrementalEvaluator()
+    for end in (4299, 4300, 4301, 5000):
+        assert evaluator.preview(LONG_LITERAL[:end]) == calculate(LONG_LITERAL[:end])
+
+
+def test_literals_past_the_exact_limit_are_echoed_back():
+    too_long = "9" * (MAX_EXACT_DIGITS + 1)
+    assert calculate(too_long) == too_long
+    # Only sympy takes division by zero, it can't read the literal either
+    assert calculate(LONG_LITERAL + "/0") == LONG_LITERAL + "/0"
+    assert evaluate_with_sympy(LONG_LITERAL) is None
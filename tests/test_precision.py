@@ -0,0 +1,66 @@
+"""
+Precision mode and huge integer results: non-integer results get the chosen number of significant
+digits, integers past 4300 digits are shown abbreviated and their digits are only spelled out on request.
+"""
+import pytest
+
+from benchmarks.common import button_event
+from calculator_state import CalculatorState
+from expression_buffer import ExpressionBuffer
+from handle_keyboard_helpers import (
+    calculate,
+    calculate_full,
+    evaluate_with_sympy,
+    full_result_text,
+    get_precision,
+    handle_keyboard_batch,
+    set_precision,
+)
+from history_buffer import HistoryBuffer
+from incremental_preview import IncrementalEvaluator
+# ------------------------------------------------------------------------------
+
+# 9^6309 has 6021 digits
+HUGE_POWER = "9**6309"
+
+
+@pytest.fixture
+def restore_precision():
+    previous = get_precision()
+    yield
+    set_precision(previous)
+
+
+def test_precision_changes_non_integer_results(restore_precision):
+    assert calculate("1/3") == "0.33333"
+    set_precision(20)
+    assert calculate("1/3") == "0.33333333333333333333"
+    assert calculate("2**70") == str(2**70)
+    # Switching back serves the result cached under the earlier precision
+    set_precision(5)
+    assert calculate("1/3") == "0.33333"
+
+
+def test_huge_integers_are_abbreviated(restore_precision):
+    assert calculate(HUGE_POWER) == "2.0701e+6020"
+    digits = calculate_full(HUGE_POWER)
+    assert len(digits) == 6021 and digits.startswith("20701")
+    assert digits[-20:] == str(9**6309 % 10**20).zfill(20)
+    set_precision(10)
+    assert calculate(HUGE_POWER) == "2.070103467e+6020"
+    # sympy abbreviates its integer results the same way
+    assert evaluate_with_sympy(HUGE_POWER) == calculate(HUGE_POWER)
+
+
+def test_calculated_huge_result_can_be_typed_on():
+    state = CalculatorState(ExpressionBuffer(), "", HistoryBuffer())
+    evaluator = IncrementalEvaluator()
+    handle_keyboard_batch([HUGE_POWER, button_event("=")], state, evaluator)
+    assert state.history_list[-1] == f"{HUGE_POWER} = 2.0701e+6020"
+    # The expression holds every digit, not the abbreviation
+    assert str(state.expression) == calculate_full(HUGE_POWER)
+    assert full_result_text(state) == str(state.expression)
+
+    handle_keyboard_batch([button_event(key) for key in "-1="], state, evaluator)
+    assert state.history_list[-1].endswith("1 = 2.0701e+6020")
+    assert str(state.expression)[-1] == "8"
@@ -0,0 +1,81 @@
+"""
+Variable mode: expressions in x are told apart from calculator input and tabulated over a range.
+Pasting one that folds a huge constant (x+9^9^9) must hit the worker's deadline, not freeze the app.
+"""
+from functools import partial
+from time import monotonic, sleep
+
+import pytest
+
+import main as calculator_app
+from benchmarks.common import headless_page
+from constants import TOO_EXPENSIVE_RESULT
+from evaluation_executor import EvaluationExecutor, EvaluationTimeout
+from handle_keyboard_helpers import get_evaluation_executor, set_evaluation_executor
+from tabulation import VariableExpressionError, is_variable_expression, tabulate, tabulate_in_worker
+# ------------------------------------------------------------------------------
+
+HUGE_CONSTANT = "x+9^9^9"
+# Deadline of the tabulations in these tests, the default one is long enough for 10^6 points
+TIMEOUT = 1.0
+
+
+@pytest.fixture(scope="module")
+def executor():
+    previous = get_evaluation_executor()
+    executor = EvaluationExecutor(workers=1, timeout=TIMEOUT)
+    set_evaluation_executor(executor)
+    yield executor
+    set_evaluation_executor(previous)
+    executor.shutdown()
+
+
+def test_variable_expressions():
+    assert is_variable_expression("sin(x)/x")
+    assert is_variable_expression("x^3-2x")
+    # Calculator input, names without x and displayed results stay in the calculator
+    assert not is_variable_expression("2+3")
+    assert not is_variable_expression("2e")
+    assert not is_variable_expression("1.0000e-5")
+    assert not is_variable_expression("import(x)")
+
+
+def test_tabulate_summary():
+    tabulation = tabulate("x^2-4", -10, 10, 2001)
+    assert tabulation.roots == pytest.approx([-2, 2])
+    assert tabulation.minimum == pytest.approx((0, -4))
+    assert tabulation.maximum[1] == pytest.approx(96)
+    # Poles are undefined points, not roots
+    assert tabulate("1/x", -1, 1, 3).undefined == 1
+    assert tabulate("tan(x)", -3, 3, 10001).root_count == 1
+    with pytest.raises(VariableExpressionError):
+        tabulate("x+(", -1, 1, 3)
+
+
+def test_huge_constant_hits_the_worker_deadline(executor):
+    started = monotonic()
+    with pytest.raises(EvaluationTimeout):
+        tabulate_in_worker(HUGE_CONSTANT, executor, timeout=TIMEOUT)
+    assert monotonic() - started < TIMEOUT + 5
+    # The stuck worker was replaced, the next tabulation works
+    assert tabulate_in_worker("x^2-4", executor, timeout=10).root_count == 2
+
+
+def test_pasting_a_huge_constant_keeps_the_app_responsive(executor, monkeypatch):
+    monkeypatch.setattr(calculator_app, "ASYNC_PREVIEW", False)
+    monkeypatch.setattr(calculator_app, "INPUT_BATCHING", False)
+    monkeypatch.setattr(calculator_app, "tabulate_in_worker", partial(tabulate_in_worker, timeout=TIMEOUT))
+    page = headless_page()
+    app = calculator_app.CalculatorApp(page)
+    page.add(app)
+
+    app.paste(HUGE_CONSTANT)
+    # The main thread keeps running while the tabulation is waited for
+    deadline = monotonic() + TIMEOUT + 10
+    ticks = 0
+    while app.result.value == "..." and monotonic() < deadline:
+        sleep(0.01)
+        ticks += 1
+    assert app.result.value == TOO_EXPENSIVE_RESULT
+    assert ticks > 10
+    assert app.text.value == HUGE_CONSTANT
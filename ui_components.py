@@ -14,6 +14,13 @@ from constants import (
 )
 # ------------------------------------------------------------------------------
 
+# Every button has the same style and scale, the objects are shared instead of built per button
+BUTTON_STYLE = ButtonStyle(
+    padding=padding.all(10),
+    shape=RoundedRectangleBorder(radius=10),
+)
+BUTTON_SCALE = transform.Scale(scale=1.1)
+
 
 def create_button(text, data, on_click):
     """
@@ -34,12 +41,9 @@ def create_button(text, data, on_click):
         data=data,
         width=65,
         height=50,
-        scale=transform.Scale(scale=1.1),
+        scale=BUTTON_SCALE,
         on_click=on_click,
-        style=ButtonStyle(
-            padding=padding.all(10),
-            shape=RoundedRectangleBorder(radius=10),
-        ),
+        style=BUTTON_STYLE,
     )
 
 
@@ -0,0 +1,226 @@
+from collections import deque
+from sys import getsizeof
+from calculator_state import CalculatorState
+from constants import UNDO_MEMORY_LIMIT
+from expression_buffer import ExpressionBuffer
+# ------------------------------------------------------------------------------
+# Undo / redo of the calculator state.
+#
+# Every key that changes the state records one step holding only what it
+# changed, never a copy of the state:
+#
+#     expression  the length of the prefix the key left alone, and the text
+#                 after it before and after the key (one character when
+#                 typing or backspacing, shared single-character strings)
+#     result      the result line before and after, None for a live preview,
+#                 which is evaluated again rather than stored
+#     history     the entry "=" appended (and the one a full ring buffer
+#                 dropped for it), or the entry list a clear replaced, kept
+#                 by reference since HistoryBuffer.clear allocates a new one
+#
+# Undo and redo apply a step in place, to the token buffer's tail and the
+# ends of the ring buffer, so each costs the same at any depth and expression
+# length. Steps are kept until their estimated size passes the memory limit,
+# then the oldest are dropped first. The persistent history log is
+# append-only: undoing "=" doesn't remove its entry from the log.
+# ------------------------------------------------------------------------------
+
+# Events handle_keyboard_batch undoes / redoes the last step for, queued in order with the keys
+UNDO_EVENT = object()
+REDO_EVENT = object()
+
+# History changes (see UndoStep.history_change)
+APPEND = "append"
+CLEAR = "clear"
+
+
+class UndoStep:
+    """What one key changed, enough to apply it in either direction"""
+
+    __slots__ = ("keep", "before_tail", "after_tail", "before_result", "after_result", "history_change", "size")
+
+    def __init__(self, keep: int, before_tail: str, after_tail: str, before_result, after_result, history_change):
+        # The first `keep` characters of the expression are the same before and after
+        self.keep = keep
+        self.before_tail = before_tail
+        self.after_tail = after_tail
+        # None when the result was the live preview
+        self.before_result = before_result
+        self.after_result = after_result
+        # None, (APPEND, entry, dropped_entry_or_None) or (CLEAR, HistoryBuffer.snapshot())
+        self.history_change = history_change
+        self.size = STEP_SIZE + estimate_size(before_tail) + estimate_size(after_tail)
+        if keep > 256:
+            # Smaller ints are shared objects
+            self.size += getsizeof(keep)
+        self.size += estimate_size(before_result) + (after_result is not before_result) * estimate_size(after_result)
+        if history_change is not None:
+            self.size += getsizeof(history_change)
+            if history_change[0] == APPEND:
+                self.size += estimate_size(history_change[1]) + estimate_size(history_change[2])
+            else:
+                entries = history_change[1][0]
+                self.size += getsizeof(entries) + sum(estimate_size(entry) for entry in entries)
+
+
+class UndoHistory:
+    """
+    Undo / redo stacks of one calculator session, bounded by their estimated size in bytes.
+
+    `begin(state)` before a key and `commit(state, result_is_preview)` after it record a step,
+    `undo(state)` / `redo(state)` apply one and return False when there is none. Afterwards,
+    `result_is_preview` tells whether the result has to be evaluated again as the live preview.
+    The state's history_list must be a HistoryBuffer.
+    """
+
+    def __init__(self, memory_limit: int = UNDO_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self.undo_steps = deque()
+        self.redo_steps = []
+        # Estimated bytes held by both stacks
+        self.size = 0
+        # Steps dropped to stay under memory_limit
+        self.dropped = 0
+        # Whether the current result is the live preview, the result itself isn't stored then
+        self.result_is_preview = False
+        self.before_text = ""
+        self.before_result = ""
+        self.before_version = 0
+        self.before_snapshot = None
+        self.before_oldest = None
+
+    def __len__(self) -> int:
+        return len(self.undo_steps)
+
+    def begin(self, state: CalculatorState) -> None:
+        """Remembers what a key may change, O(1) besides rendering the expression (cached by the buffer)"""
+        history = state.history_list
+        self.before_text = str(state.expression)
+        self.before_result = state.result
+        self.before_version = history.version
+        self.before_snapshot = history.snapshot()
+        # A full ring buffer drops its oldest entry on "="
+        self.before_oldest = history[0] if len(history) == history.capacity else None
+
+    def commit(self, state: CalculatorState, result_is_preview: bool) -> None:
+        """Records the step since `begin`, unless the key changed nothing"""
+        after_text = str(state.expression)
+        history = state.history_list
+        history_change = None
+        if history.version != self.before_version:
+            if history:
+                history_change = (APPEND, history[-1], self.before_oldest)
+            elif self.before_snapshot[2]:
+                history_change = (CLEAR, self.before_snapshot)
+        self.before_snapshot = self.before_oldest = None
+
+        if after_text == self.before_text and history_change is None:
+            # A live preview of an unchanged expression isn't an edit
+            if result_is_preview:
+                self.result_is_preview = True
+                return
+            if state.result == self.before_result:
+                return
+
+        before_text = self.before_text
+        if after_text.startswith(before_text):
+            keep = len(before_text)
+        elif before_text.startswith(after_text):
+            keep = len(after_text)
+        else:
+            keep = common_prefix_length(before_text, after_text)
+        step = UndoStep(
+            keep,
+            before_text[keep:],
+            after_text[keep:],
+            None if self.result_is_preview else self.before_result,
+            None if result_is_preview else state.result,
+            history_change,
+        )
+        self.result_is_preview = result_is_preview
+
+        self.undo_steps.append(step)
+        self.size += step.size
+        if self.redo_steps:
+            self.size -= sum(redo_step.size for redo_step in self.redo_steps)
+            self.redo_steps.clear()
+        while self.size > self.memory_limit and self.undo_steps:
+            self.size -= self.undo_steps.popleft().size
+            self.dropped += 1
+
+    def undo(self, state: CalculatorState) -> bool:
+        """Reverts the last step, returns False if there is nothing to undo"""
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        replace_expression_tail(state, step.keep, step.before_tail)
+        if step.before_result is not None:
+            state.result = step.before_result
+        self.result_is_preview = step.before_result is None
+        change = step.history_change
+        if change is not None:
+            if change[0] == APPEND:
+                state.history_list.pop()
+                if change[2] is not None:
+                    state.history_list.push_oldest(change[2])
+            else:
+                state.history_list.restore(change[1])
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self, state: CalculatorState) -> bool:
+        """Applies the last undone step again, returns False if there is nothing to redo"""
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        replace_expression_tail(state, step.keep, step.after_tail)
+        if step.after_result is not None:
+            state.result = step.after_result
+        self.result_is_preview = step.after_result is None
+        change = step.history_change
+        if change is not None:
+            if change[0] == APPEND:
+                state.history_list.append(change[1])
+            else:
+                state.history_list.clear()
+        self.undo_steps.append(step)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "undo_steps": len(self.undo_steps),
+            "redo_steps": len(self.redo_steps),
+            "bytes": self.size,
+            "memory_limit": self.memory_limit,
+            "dropped": self.dropped,
+        }
+
+
+def replace_expression_tail(state: CalculatorState, keep: int, text: str) -> None:
+    if isinstance(state.expression, ExpressionBuffer):
+        state.expression.replace_tail(keep, text)
+    else:
+        state.expression = state.expression[:keep] + text
+
+
+def common_prefix_length(first: str, second: str) -> int:
+    """Length of the longest common prefix, found by binary search over C-level comparisons"""
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def estimate_size(value) -> int:
+    """Bytes a stored string costs, None and single characters are shared objects and cost nothing"""
+    if value is None or len(value) <= 1:
+        return 0
+    return getsizeof(value)
+
+
+# Bytes of an UndoStep itself and of its slot in the stack
+STEP_SIZE = getsizeof(UndoStep.__new__(UndoStep)) + 8